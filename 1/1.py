@@ -1,6 +1,14 @@
+import os
+import queue
+import threading
 import tkinter as tk
+from collections import Counter
 from tkinter import filedialog, messagebox
-import chardet
+
+from byte_view import ByteSource, ByteView
+from encoding_core import (CODEPAGES, PREVIEW_BYTES, ByteParseError, decode_bytes, detect_encoding,
+                           encode_text, format_byte_values, format_unmappable, parse_byte_values,
+                           read_text_preview, transcode_file)
 
 
 class EncodingApp:
@@ -11,7 +19,7 @@ class EncodingApp:
 
         # Выбор кодировки
         self.encoding_var = tk.StringVar(value="Windows-1251")
-        self.encodings = ["Windows-1251", "KOI8-R", "ISO-8859-5", "CP866"]
+        self.encodings = CODEPAGES
 
         # Создание интерфейса
         self.create_widgets()
@@ -50,6 +58,9 @@ class EncodingApp:
         self.output_text = tk.Text(output_frame, height=10)
         self.output_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
 
+        # Большие массивы байтов показываются постранично вместо поля вывода
+        self.byte_view = ByteView(output_frame, on_close=self.close_byte_view)
+
         # Фрейм для кнопок сохранения
         save_frame = tk.Frame(self.root)
         save_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -63,9 +74,46 @@ class EncodingApp:
         self.load_btn = tk.Button(save_frame, text="Загрузить файл", command=self.load_file)
         self.load_btn.pack(side=tk.LEFT, padx=5)
 
+        self.transcode_btn = tk.Button(save_frame, text="Перекодировать файл", command=self.transcode_file)
+        self.transcode_btn.pack(side=tk.LEFT, padx=5)
+
+        # Строка состояния для длительных операций
+        self.status_var = tk.StringVar(value="")
+        status_label = tk.Label(self.root, textvariable=self.status_var, anchor=tk.W)
+        status_label.pack(fill=tk.X, padx=5, pady=5)
+
     def update_encoding(self):
         pass
 
+    def show_bytes(self, source):
+        """Показ байтов в постраничном просмотре вместо поля вывода"""
+        self.output_text.pack_forget()
+        self.byte_view.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.byte_view.set_source(source)
+
+    def close_byte_view(self):
+        """Возврат к редактируемому полю вывода"""
+        if self.byte_view.source is None:
+            return
+        self.byte_view.clear()
+        self.byte_view.pack_forget()
+        self.output_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+    def parse_output(self, text):
+        """Байты из поля вывода; при ошибке запись выделяется и показывается"""
+        try:
+            return parse_byte_values(text)
+        except ByteParseError as e:
+            start = f"1.0+{e.position}c"
+            end = f"1.0+{e.position + e.length}c"
+            self.output_text.tag_remove(tk.SEL, "1.0", tk.END)
+            self.output_text.tag_add(tk.SEL, start, end)
+            self.output_text.mark_set(tk.INSERT, start)
+            self.output_text.see(start)
+            self.output_text.focus_set()
+            messagebox.showerror("Ошибка", f"Неверные байты: {e}")
+            return None
+
     def encode_text(self):
         text = self.input_text.get("1.0", tk.END).strip()
         if not text:
@@ -75,49 +123,59 @@ class EncodingApp:
         encoding = self.encoding_var.get()
         try:
             # Кодируем текст в выбранную кодировку
-            encoded_bytes = text.encode(encoding, errors='replace')
+            encoded_bytes = encode_text(text, encoding)
+
+            # Длинный результат - в просмотр по страницам
+            if len(encoded_bytes) > PREVIEW_BYTES:
+                self.show_bytes(ByteSource(encoded_bytes))
+                return
 
             # Отображаем байты в виде чисел, разделенных пробелами
-            byte_values = ' '.join([str(b) for b in encoded_bytes])
+            self.close_byte_view()
+            byte_values = format_byte_values(encoded_bytes)
             self.output_text.delete("1.0", tk.END)
             self.output_text.insert(tk.END, byte_values)
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка кодирования: {str(e)}")
 
     def decode_text(self):
-        text = self.output_text.get("1.0", tk.END).strip()
-        if not text:
+        source = self.byte_view.source
+        # Текст без отбрасывания пробелов: позиция ошибки разбора совпадает с полем
+        text = self.output_text.get("1.0", "end-1c") if source is None else None
+        if source is None and not text.strip():
             messagebox.showwarning("Ошибка", "Введите закодированный текст для декодирования")
             return
 
+        # Числа через пробел или строка байтов b'...'; ошибки разбора
+        # показывает parse_output
+        if source is None:
+            byte_data = self.parse_output(text)
+            if byte_data is None:
+                return
+
         encoding = self.encoding_var.get()
         try:
-            # Обрабатываем два формата ввода:
-            # 1. Последовательность чисел (209 208 197...)
-            # 2. Строка байтов (b'\xd1\xd0\xc5...')
-
-            if text.startswith("b'") or text.startswith('b"'):
-                # Это строковое представление байтов
-                import ast
-                byte_data = ast.literal_eval(text)
-            else:
-                # Это последовательность чисел
-                byte_list = [int(b) for b in text.split()]
-                byte_data = bytes(byte_list)
-
+            if source is not None:
+                byte_data = source.read(0, len(source))
             # Декодируем текст из выбранной кодировки
-            decoded_text = byte_data.decode(encoding, errors='replace')
+            decoded_text = decode_bytes(byte_data, encoding)
             self.input_text.delete("1.0", tk.END)
             self.input_text.insert(tk.END, decoded_text)
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка декодирования: {str(e)}")
 
     def save_binary(self):
-        text = self.output_text.get("1.0", tk.END).strip()
-        if not text:
+        source = self.byte_view.source
+        text = self.output_text.get("1.0", "end-1c") if source is None else None
+        if source is None and not text.strip():
             messagebox.showwarning("Ошибка", "Нет данных для сохранения")
             return
 
+        # Байты разбираются до выбора файла, чтобы ошибка не оставила пустой файл
+        byte_data = self.parse_output(text) if source is None else None
+        if source is None and byte_data is None:
+            return
+
         file_path = filedialog.asksaveasfilename(
             defaultextension=".bin",
             filetypes=[("Бинарные файлы", "*.bin"), ("Все файлы", "*.*")]
@@ -127,23 +185,20 @@ class EncodingApp:
             return
 
         try:
-            # Обрабатываем два формата ввода, как в decode_text
-            if text.startswith("b'") or text.startswith('b"'):
-                import ast
-                byte_data = ast.literal_eval(text)
-            else:
-                byte_list = [int(b) for b in text.split()]
-                byte_data = bytes(byte_list)
-
             with open(file_path, 'wb') as f:
-                f.write(byte_data)
+                if source is None:
+                    f.write(byte_data)
+                else:
+                    for chunk in source.chunks():
+                        f.write(chunk)
             messagebox.showinfo("Успех", "Файл успешно сохранен")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка сохранения: {str(e)}")
 
     def save_text(self):
-        text = self.output_text.get("1.0", tk.END)
-        if not text.strip():
+        source = self.byte_view.source
+        text = self.output_text.get("1.0", tk.END) if source is None else None
+        if source is None and not text.strip():
             messagebox.showwarning("Ошибка", "Нет данных для сохранения")
             return
 
@@ -157,7 +212,15 @@ class EncodingApp:
 
         try:
             with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(text)
+                if source is None:
+                    f.write(text)
+                else:
+                    # Числа через пробел, блоками, без одной огромной строки
+                    separator = ''
+                    for chunk in source.chunks():
+                        f.write(separator + format_byte_values(chunk))
+                        separator = ' '
+                    f.write('\n')
             messagebox.showinfo("Успех", "Файл успешно сохранен")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка сохранения: {str(e)}")
@@ -172,32 +235,111 @@ class EncodingApp:
 
         try:
             # Пытаемся определить кодировку для текстовых файлов
+            # В окно попадает только начало большого текстового файла
             if file_path.endswith('.bin'):
-                # Бинарный файл - читаем как есть
-                with open(file_path, 'rb') as f:
-                    content = f.read()
-
-                # Отображаем байты в виде чисел
-                byte_values = ' '.join([str(b) for b in content])
-                self.output_text.delete("1.0", tk.END)
-                self.output_text.insert(tk.END, byte_values)
+                truncated = False
+                if os.path.getsize(file_path) > PREVIEW_BYTES:
+                    # Большой бинарный файл отображается в память и
+                    # показывается по страницам
+                    self.show_bytes(ByteSource.from_file(file_path))
+                else:
+                    # Небольшой - числами в редактируемом поле вывода
+                    with open(file_path, 'rb') as f:
+                        content = f.read()
+                    self.close_byte_view()
+                    self.output_text.delete("1.0", tk.END)
+                    self.output_text.insert(tk.END, format_byte_values(content))
             else:
                 # Текстовый файл - пытаемся определить кодировку
-                with open(file_path, 'rb') as f:
-                    raw_data = f.read()
-                    result = chardet.detect(raw_data)
-                    encoding = result['encoding'] if result['confidence'] > 0.7 else 'utf-8'
-
-                with open(file_path, 'r', encoding=encoding, errors='replace') as f:
-                    content = f.read()
+                encoding = detect_encoding(file_path)
+                content, truncated = read_text_preview(file_path, encoding)
 
                 self.input_text.delete("1.0", tk.END)
                 self.input_text.insert(tk.END, content)
 
-            messagebox.showinfo("Успех", "Файл успешно загружен")
+            if truncated:
+                messagebox.showinfo("Успех", "Файл большой, загружено только его начало. "
+                                             "Для полного перекодирования используйте "
+                                             "\"Перекодировать файл\"")
+            else:
+                messagebox.showinfo("Успех", "Файл успешно загружен")
         except Exception as e:
             messagebox.showerror("Ошибка", f"Ошибка загрузки файла: {str(e)}")
 
+    def transcode_file(self):
+        """Потоковое перекодирование файла в выбранную кодировку"""
+        src_path = filedialog.askopenfilename(
+            title="Исходный файл",
+            filetypes=[("Текстовые файлы", "*.txt"), ("Все файлы", "*.*")]
+        )
+        if not src_path:
+            return
+
+        dst_path = filedialog.asksaveasfilename(
+            title="Сохранить результат",
+            defaultextension=".txt",
+            filetypes=[("Текстовые файлы", "*.txt"), ("Бинарные файлы", "*.bin"), ("Все файлы", "*.*")]
+        )
+        if not dst_path:
+            return
+
+        # Работа с диском идёт в отдельном потоке, окно опрашивает очередь
+        self.transcode_btn.config(state=tk.DISABLED)
+        self.transcode_queue = queue.Queue()
+        worker = threading.Thread(
+            target=self._transcode_worker,
+            args=(src_path, dst_path, self.encoding_var.get()),
+            daemon=True
+        )
+        worker.start()
+        self.root.after(100, self._poll_transcode)
+
+    def _transcode_worker(self, src_path, dst_path, dst_encoding):
+        try:
+            src_encoding = detect_encoding(src_path)
+            self.transcode_queue.put(('status', f"{src_encoding} -> {dst_encoding}"))
+            unmappable = Counter()
+            done = transcode_file(
+                src_path, dst_path, src_encoding, dst_encoding,
+                progress=lambda done, total: self.transcode_queue.put(('progress', done, total)),
+                unmappable=unmappable
+            )
+            self.transcode_queue.put(('done', done, unmappable, dst_encoding))
+        except Exception as e:
+            self.transcode_queue.put(('error', str(e)))
+
+    def _poll_transcode(self):
+        try:
+            while True:
+                event = self.transcode_queue.get_nowait()
+                if event[0] == 'status':
+                    self.status_var.set(f"Перекодирование: {event[1]}")
+                elif event[0] == 'progress':
+                    done, total = event[1], event[2]
+                    percent = done * 100 // total if total else 100
+                    self.status_var.set(f"Перекодирование: {done} из {total} байт ({percent}%)")
+                elif event[0] == 'done':
+                    self.transcode_btn.config(state=tk.NORMAL)
+                    self.status_var.set(f"Перекодировано {event[1]} байт")
+                    # Кодировка задания, а не текущее значение списка
+                    unmappable, dst_encoding = event[2], event[3]
+                    if unmappable:
+                        messagebox.showwarning(
+                            "Успех",
+                            f"Файл перекодирован, {sum(unmappable.values())} байт без соответствия "
+                            f"в {dst_encoding} заменены на '?':\n{format_unmappable(unmappable)}")
+                    else:
+                        messagebox.showinfo("Успех", "Файл успешно перекодирован")
+                    return
+                elif event[0] == 'error':
+                    self.transcode_btn.config(state=tk.NORMAL)
+                    self.status_var.set("")
+                    messagebox.showerror("Ошибка", f"Ошибка перекодирования: {event[1]}")
+                    return
+        except queue.Empty:
+            pass
+        self.root.after(100, self._poll_transcode)
+
 
 if __name__ == "__main__":
     root = tk.Tk()
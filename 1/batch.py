@@ -0,0 +1,128 @@
+"""Пакетное перекодирование файлов без графического интерфейса
+
+Файлы обрабатываются параллельно в пуле процессов, для каждого файла
+выводится скорость перекодирования.
+
+Пример:
+    python batch.py исходный_каталог каталог_результата --to UTF-8 --workers 8
+"""
+import argparse
+import fnmatch
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from encoding_core import BATCH_ENCODINGS, detect_encoding, format_unmappable, transcode_file
+
+AUTO_ENCODING = 'auto'
+
+
+def encoding_name(value):
+    """Приведение имени кодировки к виду из BATCH_ENCODINGS"""
+    for name in BATCH_ENCODINGS + [AUTO_ENCODING]:
+        if value.lower() == name.lower():
+            return name
+    raise argparse.ArgumentTypeError(
+        f"неизвестная кодировка {value}, допустимы: {', '.join(BATCH_ENCODINGS)}")
+
+
+def collect_jobs(src, dst, pattern):
+    """Пары (исходный файл, файл результата) с сохранением структуры каталогов
+
+    Результат не может совпадать с исходным файлом или каталогом (ValueError);
+    каталог результата внутри исходного не обходится.
+    """
+    if os.path.realpath(src) == os.path.realpath(dst):
+        raise ValueError("результат совпадает с исходным файлом или каталогом")
+    if os.path.isfile(src):
+        return [(src, dst)]
+
+    dst_real = os.path.realpath(dst)
+    jobs = []
+    for dirpath, dirnames, filenames in os.walk(src):
+        # Уже записанные результаты не перекодируются повторно
+        dirnames[:] = [name for name in dirnames
+                       if os.path.realpath(os.path.join(dirpath, name)) != dst_real]
+        for filename in sorted(filenames):
+            if not fnmatch.fnmatch(filename, pattern):
+                continue
+            src_path = os.path.join(dirpath, filename)
+            jobs.append((src_path, os.path.join(dst, os.path.relpath(src_path, src))))
+    return jobs
+
+
+def transcode_job(src_path, dst_path, src_encoding, dst_encoding):
+    """Перекодирование одного файла в процессе пула
+
+    Возвращает (кодировка исходного файла, размер, время в секундах,
+    Counter непереводимых байтов).
+    """
+    started = time.perf_counter()
+    if src_encoding == AUTO_ENCODING:
+        src_encoding = detect_encoding(src_path, use_cache=False)
+    os.makedirs(os.path.dirname(os.path.abspath(dst_path)), exist_ok=True)
+    unmappable = Counter()
+    size = transcode_file(src_path, dst_path, src_encoding, dst_encoding, unmappable=unmappable)
+    return src_encoding, size, time.perf_counter() - started, unmappable
+
+
+def format_speed(size, elapsed):
+    return f"{size / max(elapsed, 1e-9) / (1024 * 1024):.1f} МБ/с"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетное перекодирование файлов")
+    parser.add_argument('src', help="исходный файл или каталог")
+    parser.add_argument('dst', help="файл или каталог для результата")
+    parser.add_argument('--from', dest='src_encoding', type=encoding_name, default=AUTO_ENCODING,
+                        help="кодировка исходных файлов (по умолчанию определяется)")
+    parser.add_argument('--to', dest='dst_encoding', type=encoding_name, required=True,
+                        help="кодировка результата")
+    parser.add_argument('--pattern', default='*', help="маска имён файлов в каталоге")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="число процессов")
+    args = parser.parse_args(argv)
+
+    if args.dst_encoding == AUTO_ENCODING:
+        parser.error("для --to нужно указать кодировку")
+
+    try:
+        jobs = collect_jobs(args.src, args.dst, args.pattern)
+    except ValueError as e:
+        parser.error(str(e))
+    if not jobs:
+        print("Нет файлов для перекодирования")
+        return 0
+
+    failed = 0
+    total_size = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(transcode_job, src_path, dst_path, args.src_encoding, args.dst_encoding): src_path
+            for src_path, dst_path in jobs
+        }
+        for future in as_completed(futures):
+            src_path = futures[future]
+            try:
+                src_encoding, size, elapsed, unmappable = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"{src_path}: ошибка: {e}", file=sys.stderr)
+                continue
+            total_size += size
+            print(f"{src_path}: {src_encoding} -> {args.dst_encoding}, {size} байт, "
+                  f"{elapsed * 1000:.1f} мс, {format_speed(size, elapsed)}")
+            if unmappable:
+                print(f"{src_path}: {sum(unmappable.values())} байт без соответствия заменены на '?': "
+                      f"{format_unmappable(unmappable)}")
+
+    elapsed = time.perf_counter() - started
+    print(f"Итого: {len(jobs) - failed} из {len(jobs)} файлов, {total_size} байт, "
+          f"{elapsed:.2f} с, {format_speed(total_size, elapsed)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""Постраничный просмотр больших массивов байтов
+
+ByteSource держит сами байты: bytes в памяти или mmap файла, поэтому
+файл любого размера открывается без чтения целиком. PageFormatter
+превращает байты в строки по BYTES_PER_ROW значений (десятичных или
+шестнадцатеричных) и делает это лениво, страницами по PAGE_ROWS строк,
+храня последние CACHE_PAGES страниц. ByteView - виджет tkinter, который
+показывает только видимые строки и сам ведёт полосу прокрутки.
+"""
+import mmap
+import tkinter as tk
+import tkinter.font as tkfont
+from collections import OrderedDict
+
+BYTES_PER_ROW = 16
+PAGE_ROWS = 256
+CACHE_PAGES = 32
+SCROLL_ROWS = 3
+
+DECIMAL = 'dec'
+HEX = 'hex'
+_CELLS = {
+    DECIMAL: [f"{b:3d}" for b in range(256)],
+    HEX: [f"{b:02X}" for b in range(256)],
+}
+
+
+class ByteSource:
+    """Байты для просмотра: в памяти или отображённый в память файл"""
+
+    def __init__(self, data, path=None):
+        self.data = data
+        self.path = path
+        self._file = None
+
+    @classmethod
+    def from_file(cls, path):
+        f = open(path, 'rb')
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Пустой файл нельзя отобразить в память
+            f.close()
+            return cls(b'', path)
+        source = cls(data, path)
+        source._file = f
+        return source
+
+    def __len__(self):
+        return len(self.data)
+
+    def read(self, offset, size):
+        return self.data[offset:offset + size]
+
+    def find(self, pattern, start=0):
+        """Смещение первого вхождения с позиции start или -1"""
+        return self.data.find(pattern, start)
+
+    def chunks(self, chunk_size=1024 * 1024):
+        """Байты по блокам, чтобы не копировать большой файл целиком"""
+        for offset in range(0, len(self.data), chunk_size):
+            yield self.data[offset:offset + chunk_size]
+
+    def close(self):
+        if self._file is not None:
+            self.data.close()
+            self._file.close()
+            self._file = None
+
+
+def parse_offset(text):
+    """Смещение: десятичное число или шестнадцатеричное с префиксом 0x"""
+    return int(text.strip(), 0)
+
+
+def parse_pattern(text, base):
+    """Байты для поиска в записи текущего режима просмотра
+
+    В десятичном режиме - числа через пробел, в шестнадцатеричном -
+    пары цифр с пробелами или без.
+    """
+    if base == HEX:
+        return bytes.fromhex(text)
+    return bytes([int(b) for b in text.split()])
+
+
+class PageFormatter:
+    """Ленивое форматирование байтов в строки по страницам"""
+
+    def __init__(self, source, base=DECIMAL, row_size=BYTES_PER_ROW,
+                 page_rows=PAGE_ROWS, cache_pages=CACHE_PAGES):
+        self.source = source
+        self.base = base
+        self.row_size = row_size
+        self.page_rows = page_rows
+        self.cache_pages = cache_pages
+        self._pages = OrderedDict()
+
+    @property
+    def total_rows(self):
+        return max(1, -(-len(self.source) // self.row_size))
+
+    @property
+    def cell_width(self):
+        return len(_CELLS[self.base][0])
+
+    @property
+    def offset_width(self):
+        if self.base == HEX:
+            return max(8, len(f"{len(self.source):X}"))
+        return max(10, len(str(len(self.source))))
+
+    def set_base(self, base):
+        if base != self.base:
+            self.base = base
+            self._pages.clear()
+
+    def column(self, index):
+        """Позиция в строке байта с номером index внутри строки"""
+        return self.offset_width + 2 + index * (self.cell_width + 1)
+
+    def format_row(self, row):
+        offset = row * self.row_size
+        cells = _CELLS[self.base]
+        values = ' '.join(map(cells.__getitem__, self.source.read(offset, self.row_size)))
+        if self.base == HEX:
+            return f"{offset:0{self.offset_width}X}  {values}"
+        return f"{offset:>{self.offset_width}}  {values}"
+
+    def _page(self, number):
+        page = self._pages.get(number)
+        if page is None:
+            first = number * self.page_rows
+            last = min(first + self.page_rows, self.total_rows)
+            page = self._pages[number] = [self.format_row(row) for row in range(first, last)]
+            if len(self._pages) > self.cache_pages:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(number)
+        return page
+
+    def rows(self, first, count):
+        """Строки с first по first + count - 1"""
+        lines = []
+        row = first
+        end = min(first + count, self.total_rows)
+        while row < end:
+            page = self._page(row // self.page_rows)
+            start = row % self.page_rows
+            lines.extend(page[start:start + end - row])
+            row = (row // self.page_rows + 1) * self.page_rows
+        return lines
+
+
+class ByteView(tk.Frame):
+    """Виджет просмотра байтов: выводятся только видимые строки"""
+
+    def __init__(self, master, on_close=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.source = None
+        self.formatter = None
+        self.top_row = 0
+        self.visible_rows = 10
+        self.highlight = None
+        self.base_var = tk.StringVar(value=DECIMAL)
+
+        toolbar = tk.Frame(self)
+        toolbar.pack(fill=tk.X)
+        tk.Radiobutton(toolbar, text="Десятичный", variable=self.base_var, value=DECIMAL,
+                       command=self.change_base).pack(side=tk.LEFT)
+        tk.Radiobutton(toolbar, text="Шестнадцатеричный", variable=self.base_var, value=HEX,
+                       command=self.change_base).pack(side=tk.LEFT)
+
+        tk.Label(toolbar, text="Смещение:").pack(side=tk.LEFT, padx=(10, 0))
+        self.offset_entry = tk.Entry(toolbar, width=12)
+        self.offset_entry.pack(side=tk.LEFT)
+        self.offset_entry.bind('<Return>', lambda event: self.jump())
+        tk.Button(toolbar, text="Перейти", command=self.jump).pack(side=tk.LEFT, padx=2)
+
+        tk.Label(toolbar, text="Поиск:").pack(side=tk.LEFT, padx=(10, 0))
+        self.search_entry = tk.Entry(toolbar, width=20)
+        self.search_entry.pack(side=tk.LEFT)
+        self.search_entry.bind('<Return>', lambda event: self.search())
+        tk.Button(toolbar, text="Найти", command=self.search).pack(side=tk.LEFT, padx=2)
+
+        if on_close:
+            tk.Button(toolbar, text="Закрыть", command=on_close).pack(side=tk.RIGHT)
+
+        self.info_var = tk.StringVar(value="")
+        tk.Label(self, textvariable=self.info_var, anchor=tk.W).pack(fill=tk.X)
+
+        body = tk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True)
+        self.scrollbar = tk.Scrollbar(body, command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text = tk.Text(body, height=10, wrap=tk.NONE, font='TkFixedFont', state=tk.DISABLED)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.text.tag_configure('match', background='yellow')
+
+        self.text.bind('<Configure>', self.on_resize)
+        self.text.bind('<MouseWheel>', self.on_wheel)
+        self.text.bind('<Button-4>', lambda event: self.scroll_rows(-SCROLL_ROWS))
+        self.text.bind('<Button-5>', lambda event: self.scroll_rows(SCROLL_ROWS))
+        self.text.bind('<Up>', lambda event: self.scroll_rows(-1))
+        self.text.bind('<Down>', lambda event: self.scroll_rows(1))
+        self.text.bind('<Prior>', lambda event: self.scroll_rows(-self.visible_rows))
+        self.text.bind('<Next>', lambda event: self.scroll_rows(self.visible_rows))
+
+    def set_source(self, source):
+        """Показ новых байтов; прежний источник закрывается"""
+        if self.source is not None:
+            self.source.close()
+        self.source = source
+        self.formatter = PageFormatter(source, self.base_var.get())
+        self.top_row = 0
+        self.highlight = None
+        self.info_var.set(f"Размер: {len(source)} байт")
+        self.render()
+
+    def clear(self):
+        if self.source is not None:
+            self.source.close()
+        self.source = None
+        self.formatter = None
+
+    def change_base(self):
+        if self.formatter:
+            self.formatter.set_base(self.base_var.get())
+            self.render()
+
+    def on_resize(self, event):
+        linespace = tkfont.Font(font=self.text['font']).metrics('linespace')
+        rows = max(1, event.height // linespace)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.render()
+
+    def on_scroll(self, action, value, unit=None):
+        if not self.formatter:
+            return
+        if action == 'moveto':
+            self.top_row = int(float(value) * self.formatter.total_rows)
+        elif unit == 'pages':
+            self.top_row += int(value) * self.visible_rows
+        else:
+            self.top_row += int(value)
+        self.render()
+
+    def on_wheel(self, event):
+        return self.scroll_rows(-SCROLL_ROWS if event.delta > 0 else SCROLL_ROWS)
+
+    def scroll_rows(self, count):
+        if self.formatter:
+            self.top_row += count
+            self.render()
+        return 'break'
+
+    def show_offset(self, offset, length=0):
+        """Прокрутка к смещению с подсветкой length байт"""
+        self.top_row = offset // self.formatter.row_size
+        self.highlight = (offset, length) if length else None
+        self.render()
+
+    def jump(self):
+        if not self.formatter:
+            return
+        try:
+            offset = parse_offset(self.offset_entry.get())
+        except ValueError:
+            self.info_var.set("Неверное смещение")
+            return
+        if not 0 <= offset < max(len(self.source), 1):
+            self.info_var.set(f"Смещение вне файла (размер {len(self.source)} байт)")
+            return
+        self.show_offset(offset, 1)
+        self.info_var.set(f"Смещение {offset}")
+
+    def search(self):
+        """Поиск следующего вхождения после подсвеченного, с переходом в начало"""
+        if not self.formatter:
+            return
+        try:
+            pattern = parse_pattern(self.search_entry.get(), self.base_var.get())
+        except ValueError:
+            self.info_var.set("Неверная запись байтов для поиска")
+            return
+        if not pattern:
+            return
+
+        start = self.highlight[0] + 1 if self.highlight else self.top_row * self.formatter.row_size
+        offset = self.source.find(pattern, start)
+        if offset < 0 and start:
+            offset = self.source.find(pattern, 0)
+        if offset < 0:
+            self.info_var.set("Не найдено")
+            return
+        self.show_offset(offset, len(pattern))
+        self.info_var.set(f"Найдено на смещении {offset}")
+
+    def render(self):
+        """Перерисовка видимых строк и полосы прокрутки"""
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        if not self.formatter:
+            self.text.config(state=tk.DISABLED)
+            self.scrollbar.set(0, 1)
+            return
+
+        total = self.formatter.total_rows
+        self.top_row = max(0, min(self.top_row, total - self.visible_rows))
+        lines = self.formatter.rows(self.top_row, self.visible_rows)
+        self.text.insert("1.0", '\n'.join(lines))
+        self._tag_highlight()
+        self.text.config(state=tk.DISABLED)
+        self.scrollbar.set(self.top_row / total, min((self.top_row + self.visible_rows) / total, 1))
+
+    def _tag_highlight(self):
+        if not self.highlight:
+            return
+        row_size = self.formatter.row_size
+        offset, length = self.highlight
+        first = max(offset, self.top_row * row_size)
+        last = min(offset + length, (self.top_row + self.visible_rows) * row_size)
+        while first < last:
+            row, index = divmod(first, row_size)
+            count = min(last - first, row_size - index)
+            line = row - self.top_row + 1
+            start = self.formatter.column(index)
+            end = self.formatter.column(index + count - 1) + self.formatter.cell_width
+            self.text.tag_add('match', f"{line}.{start}", f"{line}.{end}")
+            first += count
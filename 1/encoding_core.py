@@ -0,0 +1,446 @@
+"""Логика кодирования без графического интерфейса
+
+Используется окном EncodingApp (1.py) и пакетным режимом (batch.py).
+При перекодировании файл читается блоками по CHUNK_SIZE байт и пропускается через
+инкрементальные декодер и кодировщик из модуля codecs, поэтому память
+не зависит от размера файла. В окно попадает только начало файла.
+Кодировка определяется по выборкам из начала, середины и конца файла,
+результат кэшируется в DETECT_CACHE_FILE.
+
+Между однобайтными кодовыми страницами CODEPAGES файл перекодируется
+без декодирования в str: таблицей из 256 байт для bytes.translate,
+которая строится один раз для каждой пары кодировок. Байты, которым
+нет соответствия в кодировке результата, заменяются на REPLACEMENT_BYTE
+и подсчитываются для отчёта.
+"""
+import codecs
+import hashlib
+import json
+import os
+import re
+import threading
+import warnings
+
+from chardet import UniversalDetector
+
+# Кодировки окна и дополнительные кодировки пакетного режима
+CODEPAGES = ["Windows-1251", "KOI8-R", "ISO-8859-5", "CP866"]
+BATCH_ENCODINGS = CODEPAGES + ["UTF-8"]
+
+CHUNK_SIZE = 1024 * 1024
+PREVIEW_CHARS = 64 * 1024
+PREVIEW_BYTES = 16 * 1024
+CONFIDENCE_THRESHOLD = 0.7
+DEFAULT_ENCODING = 'utf-8'
+
+# Определение кодировки
+SAMPLE_SIZE = 32 * 1024
+FEED_SIZE = 4 * 1024
+DETECT_CACHE_FILE = 'detect_cache.json'
+DETECT_CACHE_LIMIT = 1000
+_detect_cache_lock = threading.Lock()
+
+# Разбор байтов из поля вывода: числа читаются блоками по PARSE_BLOCK символов
+PARSE_BLOCK = 64 * 1024
+_TOKEN = re.compile(r'\S+')
+# Всё, кроме десятичных цифр и пробелов: такой блок разбирается по числам
+_NOT_DECIMAL = re.compile(r'[^0-9\s]')
+# Экранирование в записи b'...': \xNN, восьмеричное \NNN, перевод строки
+# после \ (продолжение строки) или любой другой символ
+_ESCAPE = re.compile(r'\\(?:x([0-9a-fA-F]{2})|([0-7]{1,3})|\n|(.))', re.DOTALL)
+_SIMPLE_ESCAPES = {'\\': 0x5c, "'": 0x27, '"': 0x22, 'a': 0x07, 'b': 0x08, 'f': 0x0c,
+                   'n': 0x0a, 'r': 0x0d, 't': 0x09, 'v': 0x0b}
+
+# Замена непереводимых байтов - та же, что даёт errors='replace'
+REPLACEMENT_BYTE = b'?'
+_translation_cache = {}
+
+
+def encode_text(text, encoding):
+    """Кодирование текста в выбранную кодировку"""
+    return text.encode(encoding, errors='replace')
+
+
+def decode_bytes(byte_data, encoding):
+    """Декодирование байтов из выбранной кодировки"""
+    return byte_data.decode(encoding, errors='replace')
+
+
+def format_byte_values(byte_data):
+    """Байты в виде чисел, разделенных пробелами"""
+    return ' '.join(map(str, byte_data))
+
+
+class ByteParseError(ValueError):
+    """Ошибка разбора байтов: position - смещение неверной записи в тексте"""
+
+    def __init__(self, message, text, position, length=1):
+        line = text.count('\n', 0, position) + 1
+        column = position - (text.rfind('\n', 0, position) + 1) + 1
+        super().__init__(f"{message} (строка {line}, столбец {column})")
+        self.position = position
+        self.length = length
+        self.line = line
+        self.column = column
+
+
+def parse_byte_values(text):
+    """Разбор байтов из текста за один проход в bytearray
+
+    Поддерживаются два формата ввода:
+    1. Числа через пробелы и переводы строк, десятичные (209 208 197...)
+       или шестнадцатеричные с префиксом 0x (0xd1 0xd0 0xc5...)
+    2. Строка байтов (b'\\xd1\\xd0\\xc5...') с экранированием как в Python
+
+    При ошибке - ByteParseError с позицией первой неверной записи.
+    """
+    start = len(text) - len(text.lstrip())
+    if text.startswith(("b'", 'b"', "B'", 'B"'), start):
+        return _parse_bytes_literal(text, start)
+    return _parse_numbers(text)
+
+
+def _parse_numbers(text):
+    result = bytearray()
+    offset = 0
+    while offset < len(text):
+        end = min(offset + PARSE_BLOCK, len(text))
+        if end < len(text):
+            # Блок заканчивается на пробельном символе, числа не разрезаются
+            while end > offset and not text[end - 1].isspace():
+                end -= 1
+            if end == offset:
+                end = _TOKEN.match(text, offset).end()
+        block = text[offset:end]
+        try:
+            if _NOT_DECIMAL.search(block):
+                raise ValueError
+            # Быстрый путь: только десятичные числа, bytes проверяет диапазон
+            result += bytes(map(int, block.split()))
+        except ValueError:
+            # Шестнадцатеричные числа или ошибка: разбор по числам с позициями
+            for match in _TOKEN.finditer(text, offset, end):
+                result.append(_parse_number(text, match))
+        offset = end
+    return result
+
+
+def _parse_number(text, match):
+    token = match.group()
+    try:
+        if token[:2] in ('0x', '0X'):
+            value = int(token[2:], 16) if token[2:].isalnum() else -1
+        else:
+            value = int(token) if token.isdigit() and token.isascii() else -1
+    except ValueError:
+        value = -1
+    if value < 0:
+        raise ByteParseError(f"Неверная запись байта '{token[:20]}'", text, match.start(), len(token))
+    if value > 255:
+        raise ByteParseError(f"Значение {token} вне диапазона 0-255", text, match.start(), len(token))
+    return value
+
+
+def _parse_bytes_literal(text, start):
+    """Строка байтов: корректная запись декодируется целиком на C,
+    при любой ошибке разбор повторяется по символам ради её позиции"""
+    quote = text[start + 1]
+    end = len(text.rstrip()) - 1
+    if end > start + 1 and text[end] == quote:
+        body = text[start + 2:end]
+        # Неэкранированная кавычка внутри означает лишние символы после строки
+        if body.isascii() and not _has_bare_quote(body, quote):
+            with warnings.catch_warnings():
+                # Неизвестные экранирования и \NNN больше 255 разбираются по символам
+                warnings.simplefilter('error', DeprecationWarning)
+                try:
+                    # Тот же разбор экранирования, что у литералов bytes в Python
+                    return bytearray(codecs.escape_decode(body.encode('ascii'))[0])
+                except (ValueError, DeprecationWarning):
+                    pass
+    return _scan_bytes_literal(text, start, quote)
+
+
+def _has_bare_quote(body, quote):
+    """Есть ли в строке байтов кавычка без экранирования"""
+    if quote not in body:
+        return False
+    body = body.replace('\\\\', '')
+    position = body.find(quote)
+    while position >= 0:
+        if position == 0 or body[position - 1] != '\\':
+            return True
+        position = body.find(quote, position + 1)
+    return False
+
+
+def _scan_bytes_literal(text, start, quote):
+    result = bytearray()
+    position = start + 2
+    while True:
+        end = text.find(quote, position)
+        if end < 0:
+            raise ByteParseError("Нет закрывающей кавычки строки байтов", text, start, 2)
+        backslash = text.find('\\', position, end)
+        if backslash < 0:
+            _append_ascii(result, text, position, end)
+            break
+        _append_ascii(result, text, position, backslash)
+        match = _ESCAPE.match(text, backslash)
+        if match is None:
+            raise ByteParseError("Нет закрывающей кавычки строки байтов", text, start, 2)
+        hex_value, octal, char = match.groups()
+        if hex_value is not None:
+            result.append(int(hex_value, 16))
+        elif octal is not None:
+            if int(octal, 8) > 255:
+                raise ByteParseError(f"Значение \\{octal} вне диапазона 0-255", text, backslash, match.end() - backslash)
+            result.append(int(octal, 8))
+        elif char is None:
+            pass  # Продолжение строки
+        elif char == 'x':
+            raise ByteParseError("После \\x нужны две шестнадцатеричные цифры", text, backslash, 2)
+        elif char in _SIMPLE_ESCAPES:
+            result.append(_SIMPLE_ESCAPES[char])
+        else:
+            # Как в Python: неизвестная последовательность остаётся с \\
+            result.append(0x5c)
+            _append_ascii(result, text, match.start(3), match.end())
+        position = match.end()
+
+    tail = text[end + 1:]
+    if tail.strip():
+        rest = end + 1 + len(tail) - len(tail.lstrip())
+        raise ByteParseError("Лишние символы после строки байтов", text, rest, len(text) - rest)
+    return result
+
+
+def _append_ascii(result, text, start, end):
+    """Участок строки байтов без экранирования: допустимы только символы ASCII"""
+    try:
+        result += text[start:end].encode('ascii')
+    except UnicodeEncodeError as e:
+        raise ByteParseError(f"Символ '{text[start + e.start]}' не ASCII: используйте \\x", text,
+                             start + e.start) from None
+
+
+def _read_samples(file_path, size):
+    """Начало, середина и конец файла; небольшой файл читается целиком"""
+    with open(file_path, 'rb') as f:
+        if size <= 3 * SAMPLE_SIZE:
+            return [f.read()]
+        head = f.read(SAMPLE_SIZE)
+        f.seek(size // 2 - SAMPLE_SIZE // 2)
+        middle = f.read(SAMPLE_SIZE)
+        f.seek(size - SAMPLE_SIZE)
+        tail = f.read(SAMPLE_SIZE)
+    return [head, middle, tail]
+
+
+def _detect_samples(samples):
+    """Определение кодировки по выборкам с ранней остановкой
+
+    Выборки подаются одному детектору блоками по FEED_SIZE байт, каждый
+    байт - один раз. Как только детектор уверен (detector.done: метка
+    BOM, однозначный результат или набран его предел данных), остальное
+    не подаётся. Результат с уверенностью не выше CONFIDENCE_THRESHOLD
+    заменяется на DEFAULT_ENCODING.
+    """
+    detector = UniversalDetector()
+    for sample in samples:
+        for start in range(0, len(sample), FEED_SIZE):
+            detector.feed(sample[start:start + FEED_SIZE])
+            if detector.done:
+                break
+        if detector.done:
+            break
+    result = detector.close()
+    if result['encoding'] and result['confidence'] > CONFIDENCE_THRESHOLD:
+        return result['encoding']
+    return DEFAULT_ENCODING
+
+
+def _load_detect_cache():
+    try:
+        with open(DETECT_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_detect_cache(cache):
+    # Старые записи вытесняются в порядке добавления
+    while len(cache) > DETECT_CACHE_LIMIT:
+        del cache[next(iter(cache))]
+    tmp_path = f"{DETECT_CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, DETECT_CACHE_FILE)
+
+
+def detect_encoding(file_path, use_cache=True):
+    """Определение кодировки файла по выборкам с кэшем на диске
+
+    Запись кэша действительна, пока совпадают размер, время изменения
+    и хэш выборок файла.
+    """
+    stat = os.stat(file_path)
+    samples = _read_samples(file_path, stat.st_size)
+    if not use_cache:
+        return _detect_samples(samples)
+
+    key = os.path.abspath(file_path)
+    digest = hashlib.sha1()
+    for sample in samples:
+        digest.update(sample)
+    entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'hash': digest.hexdigest()}
+
+    with _detect_cache_lock:
+        cached = _load_detect_cache().get(key)
+    if cached and all(cached.get(name) == value for name, value in entry.items()):
+        return cached['encoding']
+
+    entry['encoding'] = _detect_samples(samples)
+    with _detect_cache_lock:
+        cache = _load_detect_cache()
+        cache.pop(key, None)
+        cache[key] = entry
+        try:
+            _save_detect_cache(cache)
+        except OSError:
+            pass  # Без кэша определение всё равно работает
+    return entry['encoding']
+
+
+def read_text_preview(file_path, encoding, limit=PREVIEW_CHARS):
+    """Чтение не более limit символов текста
+
+    Возвращает (текст, обрезан_ли_файл).
+    """
+    with open(file_path, 'r', encoding=encoding, errors='replace') as f:
+        text = f.read(limit)
+        truncated = bool(f.read(1))
+    return text, truncated
+
+
+def read_bytes_preview(file_path, limit=PREVIEW_BYTES):
+    """Чтение не более limit байт; возвращает (байты, обрезан_ли_файл)"""
+    with open(file_path, 'rb') as f:
+        data = f.read(limit)
+        truncated = bool(f.read(1))
+    return data, truncated
+
+
+def _codec_name(encoding):
+    """Каноническое имя кодировки: 'IBM866' и 'CP866' - одна кодировка"""
+    return codecs.lookup(encoding).name
+
+
+_CODEPAGE_NAMES = {_codec_name(encoding) for encoding in CODEPAGES}
+
+
+def is_codepage_pair(src_encoding, dst_encoding):
+    """Обе кодировки - однобайтные кодовые страницы из CODEPAGES"""
+    try:
+        return {_codec_name(src_encoding), _codec_name(dst_encoding)} <= _CODEPAGE_NAMES
+    except LookupError:
+        return False
+
+
+def translation_table(src_encoding, dst_encoding):
+    """Таблица перевода байтов и байты без соответствия
+
+    Возвращает (таблица для bytes.translate, байты исходной кодировки,
+    у которых нет символа или которых нет в кодировке результата).
+    """
+    key = (_codec_name(src_encoding), _codec_name(dst_encoding))
+    cached = _translation_cache.get(key)
+    if cached is None:
+        table = bytearray(256)
+        unmappable = bytearray()
+        for byte in range(256):
+            try:
+                table[byte] = ord(bytes([byte]).decode(key[0]).encode(key[1]))
+            except UnicodeError:
+                table[byte] = ord(REPLACEMENT_BYTE)
+                unmappable.append(byte)
+        # Третий элемент - переводимые байты, для подсчёта остальных
+        mappable = bytes(byte for byte in range(256) if byte not in unmappable)
+        cached = _translation_cache[key] = (bytes(table), bytes(unmappable), mappable)
+    return cached[:2]
+
+
+def translate_bytes(data, src_encoding, dst_encoding, unmappable=None):
+    """Перекодирование байтов между кодовыми страницами за один проход
+
+    Если передан unmappable (Counter), в него добавляется число
+    непереводимых байтов каждого значения.
+    """
+    table, missing = translation_table(src_encoding, dst_encoding)
+    if unmappable is not None and missing:
+        # Удаление всех переводимых байтов оставляет только непереводимые
+        mappable = _translation_cache[_codec_name(src_encoding), _codec_name(dst_encoding)][2]
+        rest = data.translate(None, mappable)
+        if rest:
+            unmappable.update(rest)
+    return data.translate(table)
+
+
+def format_unmappable(unmappable, limit=16):
+    """Отчёт о непереводимых байтах: 0x98 x3, 0xA0 x1, ..."""
+    items = [f"0x{byte:02X} x{count}" for byte, count in unmappable.most_common(limit)]
+    if len(unmappable) > limit:
+        items.append("...")
+    return ', '.join(items)
+
+
+def transcode_file(src_path, dst_path, src_encoding, dst_encoding,
+                   errors='replace', chunk_size=CHUNK_SIZE, progress=None, unmappable=None):
+    """Перекодирование файла из src_encoding в dst_encoding по блокам
+
+    progress(обработано_байт, всего_байт) вызывается после каждого блока.
+    Между кодовыми страницами CODEPAGES блоки переводятся таблицей байтов;
+    тогда в unmappable (Counter, если передан) подсчитываются байты,
+    заменённые на REPLACEMENT_BYTE. Возвращает число прочитанных байт.
+    Запись в исходный файл отклоняется (ValueError): открытие на запись
+    обнулило бы его до чтения.
+    """
+    if os.path.exists(dst_path) and os.path.samefile(src_path, dst_path):
+        raise ValueError(f"Файл результата совпадает с исходным: {dst_path}")
+    if errors == 'replace' and is_codepage_pair(src_encoding, dst_encoding):
+        return _translate_file(src_path, dst_path, src_encoding, dst_encoding,
+                               chunk_size, progress, unmappable)
+
+    decoder = codecs.getincrementaldecoder(src_encoding)(errors=errors)
+    encoder = codecs.getincrementalencoder(dst_encoding)(errors=errors)
+    total = os.path.getsize(src_path)
+    done = 0
+
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            dst.write(encoder.encode(decoder.decode(chunk)))
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+        # Хвост незавершённой многобайтной последовательности
+        dst.write(encoder.encode(decoder.decode(b'', final=True), final=True))
+
+    return done
+
+
+def _translate_file(src_path, dst_path, src_encoding, dst_encoding, chunk_size, progress, unmappable):
+    total = os.path.getsize(src_path)
+    done = 0
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            dst.write(translate_bytes(chunk, src_encoding, dst_encoding, unmappable))
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+    return done
@@ -1,105 +1,76 @@
 import socket
 import os
-from datetime import datetime
-import atexit
+import sys
+import time
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.codec import (encode_text, decode_text, pack_text, unpack_text,  # noqa: E402
+                          unpack_codes, is_packed, PACKED_HEADER)
+from common.entropy import SessionEncoder, decode as entropy_decode, entropy_bits, is_entropy  # noqa: E402
+from common.store import MessageStore, INDEX_FILE, RECEIVED, SENT  # noqa: E402
+from common.fragment import MAX_DATAGRAM, Reassembler, fragment, is_fragment  # noqa: E402
+from common.metrics import REGISTRY, start_exporter  # noqa: E402
+from common.tracing import RECEIVE, SEND, now, tracer_from_env, unwrap  # noqa: E402
 
 # Конфигурация
 CONFIG_FILE = '../udp_config.txt'
 DEFAULT_IP = '127.0.0.1'
 DEFAULT_PORT = 5005
-BUFFER_SIZE = 1024
-created_files = []
-
-
-# Регистрируем функцию очистки при выходе
-def cleanup():
-    """Удаление всех созданных файлов при завершении программы"""
-    for filepath in created_files:
-        try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                print(f"Удалён файл: {filepath}")
-        except Exception as e:
-            print(f"Ошибка при удалении файла {filepath}: {e}")
-
-
-atexit.register(cleanup)
-
-
-def encode_text(text):
-    """Улучшенное кодирование текста с поддержкой русского и английского алфавитов"""
-    encoded = []
-    for char in text:
-        # Пробел
-        if char == ' ':
-            encoded.append('00000000')
-        # Английские строчные буквы (a-z)
-        elif 'a' <= char <= 'z':
-            encoded.append(f'0{ord(char) - ord("a"):07b}')
-        # Английские заглавные буквы (A-Z)
-        elif 'A' <= char <= 'Z':
-            encoded.append(f'1{ord(char) - ord("A"):07b}')
-        # Русские строчные буквы (а-я)
-        elif 'а' <= char <= 'я':
-            encoded.append(f'2{ord(char) - ord("а"):07b}')
-        # Русские заглавные буквы (А-Я)
-        elif 'А' <= char <= 'Я':
-            encoded.append(f'3{ord(char) - ord("А"):07b}')
-        # Буква 'ё' и 'Ё'
-        elif char == 'ё':
-            encoded.append('21100101')  # Код для 'ё'
-        elif char == 'Ё':
-            encoded.append('31100101')  # Код для 'Ё'
-        # Все остальные символы кодируем как пробел
-        else:
-            encoded.append('00000000')
-    return ' '.join(encoded)
-
-
-def decode_text(binary_str):
-    """Декодирование бинарной строки с поддержкой русского и английского алфавитов"""
-    binary_list = binary_str.split()
-    decoded = []
-    for code in binary_list:
-        if len(code) != 8:
-            decoded.append(' ')
+# Приёмный буфер вмещает датаграмму размером в MTU, длинные
+# сообщения приходят фрагментами
+BUFFER_SIZE = MAX_DATAGRAM
+# Отправитель и получатель пишут в разные хранилища: каждое
+# хранилище рассчитано на один процесс-писатель
+STORE_DIRS = {SENT: os.path.join('messages', 'send'), RECEIVED: os.path.join('messages', 'receive')}
+EXPORT_DIR = 'export'
+EXPORT_NAME_FORMAT = '{kind}_%Y_%H-%M-%S.bit'
+# Приём несколькими процессами: у каждого свой сокет на общем порту
+# (SO_REUSEPORT), свой буфер сокета и своё хранилище worker_N
+WORKER_RCVBUF = 8 * 1024 * 1024
+WORKER_STATS = ('datagrams', 'messages', 'bytes', 'failures')
+STATS_INTERVAL = 1.0
+
+messages_out = REGISTRY.counter('messages_out_total', "Отправлено сообщений")
+bytes_out = REGISTRY.counter('bytes_out_total', "Отправлено байт сообщений")
+datagrams_in = REGISTRY.counter('datagrams_in_total', "Принято датаграмм")
+messages_in = REGISTRY.counter('messages_in_total', "Принято сообщений после сборки фрагментов")
+bytes_in = REGISTRY.counter('bytes_in_total', "Принято байт сообщений")
+decode_failures = REGISTRY.counter('decode_failures_total', "Сообщения, которые не удалось разобрать")
+
+
+def save_message(store, binary_data, peer, is_receiver=False, verbose=True):
+    """Дописывание сообщения в хранилище истории"""
+    kind = RECEIVED if is_receiver else SENT
+    number = store.append(binary_data.encode('utf-8'), peer=f"{peer[0]}:{peer[1]}", kind=kind)
+    if verbose:
+        print(f"Сохранено в историю: сообщение №{number + 1}")
+
+
+def store_directories():
+    """Каталоги хранилищ вместе с хранилищами процессов-получателей"""
+    for directory in STORE_DIRS.values():
+        yield directory
+        if os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isfile(os.path.join(path, INDEX_FILE)):
+                    yield path
+
+
+def export_history():
+    """Выгрузка истории в отдельные файлы прежнего формата"""
+    exported = []
+    for directory in store_directories():
+        if not os.path.isfile(os.path.join(directory, INDEX_FILE)):
             continue
-
-        prefix = code[0]
-        char_code = int(code[1:], 2)
-
-        if code == '00000000':
-            decoded.append(' ')
-        elif prefix == '0':  # Английская строчная
-            decoded.append(chr(char_code + ord('a')))
-        elif prefix == '1':  # Английская заглавная
-            decoded.append(chr(char_code + ord('A')).upper())
-        elif prefix == '2':  # Русская строчная
-            if code == '21100101':  # Специальный код для 'ё'
-                decoded.append('ё')
-            else:
-                decoded.append(chr(char_code + ord('а')))
-        elif prefix == '3':  # Русская заглавная
-            if code == '31100101':  # Специальный код для 'Ё'
-                decoded.append('Ё')
-            else:
-                decoded.append(chr(char_code + ord('А')).upper())
-        else:
-            decoded.append(' ')
-    return ''.join(decoded)
-
-
-def save_to_file(binary_data, is_receiver=False):
-    """Сохранение данных в файл с добавлением файла в список для последующего удаления"""
-    timestamp = datetime.now().strftime("%Y_%H-%M-%S")
-    prefix = "receive" if is_receiver else "send"
-    filename = f"{prefix}_{timestamp}.bit"
-
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(binary_data)
-
-    created_files.append(filename)
-    print(f"Сохранено в файл: {filename}")
+        # Только чтение: запущенный отправитель или получатель продолжает писать
+        store = MessageStore(directory, read_only=True)
+        try:
+            exported += store.export(EXPORT_DIR, EXPORT_NAME_FORMAT)
+        finally:
+            store.close()
+    print(f"Выгружено {len(exported)} файлов в {EXPORT_DIR}")
 
 
 def read_config():
@@ -114,10 +85,21 @@ def read_config():
         return DEFAULT_IP, DEFAULT_PORT
 
 
-def sender():
-    """Режим отправителя"""
+def sender(packed=False, entropy=False):
+    """Режим отправителя
+
+    packed=True включает упакованный формат: один байт на символ
+    и заголовок PACKED_HEADER вместо строки из '0'/'1' через пробел.
+    entropy=True - коды Хаффмана с таблицей по сообщениям сеанса;
+    символы вне алфавита передаются без потерь.
+    """
     ip, port = read_config()
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    store = MessageStore(STORE_DIRS[SENT])
+    session = SessionEncoder() if entropy else None
+    tracer = tracer_from_env(SEND)
+    if tracer.enabled:
+        print(f"Трассировка в {tracer.path}, доля сообщений {tracer.sample_rate}")
 
     try:
         while True:
@@ -125,15 +107,51 @@ def sender():
             if text.lower() == 'exit':
                 break
 
-            binary_data = encode_text(text)
+            trace = tracer.start()
+            with trace.stage('encode'):
+                if entropy:
+                    payload = session.encode(text)
+                    binary_data = entropy_bits(payload)
+                elif packed:
+                    payload = PACKED_HEADER + pack_text(text)
+                    binary_data = unpack_codes(payload[len(PACKED_HEADER):])
+                else:
+                    binary_data = encode_text(text)
+                    payload = binary_data.encode('utf-8')
             print(f"Закодированный текст: {binary_data}")
 
-            sock.sendto(binary_data.encode('utf-8'), (ip, port))
-            print(f"Отправлено {len(binary_data)} байт на {ip}:{port}")
-
-            save_to_file(binary_data)
+            with trace.stage('send'):
+                datagrams = fragment(trace.wrap(payload))
+                for datagram in datagrams:
+                    sock.sendto(datagram, (ip, port))
+            messages_out.inc()
+            bytes_out.inc(len(payload))
+            print(f"Отправлено {len(payload)} байт на {ip}:{port}"
+                  + (f" ({len(datagrams)} фрагментов)" if len(datagrams) > 1 else ""))
+
+            with trace.stage('persist'):
+                save_message(store, binary_data, (ip, port))
+            trace.finish()
     finally:
         sock.close()
+        store.close()
+        tracer.close()
+
+
+def decode_message(data):
+    """Разбор сообщения: (строка кодов, декодированный текст)
+
+    ValueError означает, что датаграмма не является сообщением.
+    """
+    if is_entropy(data):
+        # Энтропийный код: вместо строки кодов - биты сообщения
+        return entropy_bits(data), entropy_decode(data)
+    if is_packed(data):
+        # Упакованный формат: байт на символ после заголовка
+        payload = memoryview(data)[len(PACKED_HEADER):]
+        return unpack_codes(payload), unpack_text(payload)
+    binary_data = str(data, 'utf-8')
+    return binary_data, decode_text(binary_data)
 
 
 def receiver():
@@ -141,35 +159,200 @@ def receiver():
     ip, port = read_config()
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.bind((ip, port))
+    store = MessageStore(STORE_DIRS[RECEIVED])
+    reassembler = Reassembler()
+    REGISTRY.gauge('reassembly_pending', "Сообщения, ожидающие недостающих фрагментов",
+                   fn=lambda: reassembler.pending)
+    tracer = tracer_from_env(RECEIVE)
+    buffer = bytearray(BUFFER_SIZE)
     print(f"Ожидание сообщений на {ip}:{port}")
 
     try:
         while True:
-            data, addr = sock.recvfrom(BUFFER_SIZE)
-            binary_data = data.decode('utf-8')
-            print(f"\nПолучено {len(binary_data)} байт от {addr}")
-            print(f"Двоичные данные: {binary_data}")
+            nbytes, addr = sock.recvfrom_into(buffer)
+            arrived = now()
+            datagrams_in.inc()
+            data = memoryview(buffer)[:nbytes]
+            if is_fragment(data):
+                # Фрагмент копируется в буфер сборки, приёмный буфер свободен
+                data = reassembler.feed(data, addr)
+                if data is None:
+                    continue
+            trace_id, sent_ns, data = unwrap(data)
+            trace = tracer.resume(trace_id, sent_ns, arrived)
+            messages_in.inc()
+            bytes_in.inc(len(data))
+            print(f"\nПолучено {len(data)} байт от {addr}")
+            try:
+                with trace.stage('decode'):
+                    binary_data, decoded_text = decode_message(data)
+            except ValueError as e:
+                decode_failures.inc()
+                print(f"Некорректное сообщение: {e}")
+                continue
+            with trace.stage('output'):
+                print(f"Двоичные данные: {binary_data}")
+                print(f"Декодированный текст: {decoded_text}")
+
+            with trace.stage('persist'):
+                save_message(store, binary_data, addr, is_receiver=True)
+            trace.finish()
+    finally:
+        sock.close()
+        store.close()
+        tracer.close()
+
 
-            decoded_text = decode_text(binary_data)
-            print(f"Декодированный текст: {decoded_text}")
+def receive_worker(ip, port, index, stats):
+    """Процесс-получатель пула: разбор и запись без вывода на экран
 
-            save_to_file(binary_data, is_receiver=True)
+    Счётчики пишутся в свою часть общего массива stats, читает их
+    только процесс-руководитель.
+    """
+    base = index * len(WORKER_STATS)
+    datagrams, messages, nbytes_in, failures = range(base, base + len(WORKER_STATS))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, WORKER_RCVBUF)
+    sock.bind((ip, port))
+    store = MessageStore(os.path.join(STORE_DIRS[RECEIVED], f"worker_{index}"))
+    reassembler = Reassembler()
+    # Процессы пула дописывают трассы в общий файл целыми строками
+    tracer = tracer_from_env(RECEIVE)
+    buffer = bytearray(BUFFER_SIZE)
+
+    try:
+        while True:
+            nbytes, addr = sock.recvfrom_into(buffer)
+            arrived = now()
+            stats[datagrams] += 1
+            data = memoryview(buffer)[:nbytes]
+            if is_fragment(data):
+                # Все фрагменты одного отправителя приходят в один процесс:
+                # ядро выбирает сокет по адресам и портам отправителя
+                data = reassembler.feed(data, addr)
+                if data is None:
+                    continue
+            trace_id, sent_ns, data = unwrap(data)
+            trace = tracer.resume(trace_id, sent_ns, arrived)
+            try:
+                with trace.stage('decode'):
+                    binary_data, _ = decode_message(data)
+            except ValueError:
+                stats[failures] += 1
+                continue
+            stats[messages] += 1
+            stats[nbytes_in] += len(data)
+            with trace.stage('persist'):
+                save_message(store, binary_data, addr, is_receiver=True, verbose=False)
+            trace.finish()
+    except KeyboardInterrupt:
+        pass
     finally:
         sock.close()
+        store.close()
+        tracer.close()
+
+
+def receiver_pool(workers):
+    """Режим получателя из нескольких процессов на одном порту
+
+    Ядро распределяет датаграммы между сокетами процессов, поэтому
+    приём масштабируется по ядрам. Руководитель раз в STATS_INTERVAL
+    секунд выводит общую скорость и долю каждого процесса.
+    """
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        print("SO_REUSEPORT не поддерживается в этой системе")
+        return
+    ip, port = read_config()
+    stats = multiprocessing.RawArray('Q', workers * len(WORKER_STATS))
+
+    def total(field):
+        offset = WORKER_STATS.index(field)
+        return sum(stats[offset::len(WORKER_STATS)])
+
+    # Общие метрики процесса-руководителя складываются из счётчиков пула
+    REGISTRY.counter('datagrams_in_total', fn=lambda: total('datagrams'))
+    REGISTRY.counter('messages_in_total', fn=lambda: total('messages'))
+    REGISTRY.counter('bytes_in_total', fn=lambda: total('bytes'))
+    REGISTRY.counter('decode_failures_total', fn=lambda: total('failures'))
+
+    processes = [multiprocessing.Process(target=receive_worker, args=(ip, port, index, stats))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+    print(f"Ожидание сообщений на {ip}:{port}, процессов: {workers}")
+
+    try:
+        previous = (0, 0)
+        while any(process.is_alive() for process in processes):
+            time.sleep(STATS_INTERVAL)
+            messages, nbytes = total('messages'), total('bytes')
+            if (messages, nbytes) == previous:
+                continue
+            shares = ' '.join(map(str, stats[WORKER_STATS.index('messages')::len(WORKER_STATS)]))
+            print(f"Сообщений: {messages} ({(messages - previous[0]) / STATS_INTERVAL:.0f}/с, "
+                  f"{(nbytes - previous[1]) / STATS_INTERVAL / (1024 * 1024):.2f} МБ/с), "
+                  f"ошибок: {total('failures')}, по процессам: {shares}")
+            previous = (messages, nbytes)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        print(f"Принято сообщений: {total('messages')}, датаграмм: {total('datagrams')}")
+
+
+def read_worker_count():
+    """Запрос числа процессов-получателей до ввода положительного целого"""
+    default = os.cpu_count() or 1
+    while True:
+        count = input(f"Число процессов [{default}]: ").strip()
+        if not count:
+            return default
+        try:
+            if int(count) > 0:
+                return int(count)
+        except ValueError:
+            pass
+        print("Введите целое число больше нуля")
 
 
 def main():
     """Основная функция"""
     print("1. Отправитель")
     print("2. Получатель")
+    print("3. Отправитель (упакованный формат)")
+    print("4. Выгрузить историю в файлы")
+    print("5. Получатель (несколько процессов)")
+    print("6. Отправитель (энтропийное кодирование)")
     choice = input("Выберите режим: ")
 
-    if choice == '1':
-        sender()
-    elif choice == '2':
-        receiver()
-    else:
-        print("Неверный выбор")
+    # Экспорт метрик, если заданы METRICS_PORT или METRICS_FILE
+    exporter = start_exporter()
+    if exporter and exporter.port:
+        print(f"Метрики: http://127.0.0.1:{exporter.port}/metrics")
+
+    try:
+        if choice == '1':
+            sender()
+        elif choice == '2':
+            receiver()
+        elif choice == '3':
+            sender(packed=True)
+        elif choice == '4':
+            export_history()
+        elif choice == '5':
+            receiver_pool(read_worker_count())
+        elif choice == '6':
+            sender(entropy=True)
+        else:
+            print("Неверный выбор")
+    finally:
+        if exporter:
+            exporter.close()
 
 
 if __name__ == "__main__":
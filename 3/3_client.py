@@ -1,42 +1,20 @@
 import socket
 import os
+import sys
+import argparse
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.codec import encode_text  # noqa: E402
+from common.framing import frame  # noqa: E402
+from common.entropy import SessionEncoder, entropy_bits  # noqa: E402
+from common.tracing import SEND, tracer_from_env  # noqa: E402
+
 CONFIG_FILE = 'tcp_config.txt'
 DEFAULT_IP = '127.0.0.1'
 DEFAULT_PORT = 5005
 
 
-def encode_text(text):
-    """Кодирование текста с поддержкой русского и английского алфавитов"""
-    encoded = []
-    for char in text:
-        # Пробел
-        if char == ' ':
-            encoded.append('00000000')
-        # Английские строчные буквы (a-z)
-        elif 'a' <= char <= 'z':
-            encoded.append(f'0{ord(char) - ord("a"):07b}')
-        # Английские заглавные буквы (A-Z)
-        elif 'A' <= char <= 'Z':
-            encoded.append(f'1{ord(char) - ord("A"):07b}')
-        # Русские строчные буквы (а-я)
-        elif 'а' <= char <= 'я':
-            encoded.append(f'2{ord(char) - ord("а"):07b}')
-        # Русские заглавные буквы (А-Я)
-        elif 'А' <= char <= 'Я':
-            encoded.append(f'3{ord(char) - ord("А"):07b}')
-        # Буква 'ё' и 'Ё'
-        elif char == 'ё':
-            encoded.append('21100101')  # Код для 'ё'
-        elif char == 'Ё':
-            encoded.append('31100101')  # Код для 'Ё'
-        # Все остальные символы кодируем как пробел
-        else:
-            encoded.append('00000000')
-    return ' '.join(encoded)
-
-
 def read_config():
     """Чтение конфигурационного файла"""
     try:
@@ -51,6 +29,17 @@ def read_config():
 
 def main():
     """Основная функция клиента"""
+    parser = argparse.ArgumentParser(description="TCP клиент")
+    parser.add_argument('--entropy', action='store_true',
+                        help="энтропийное кодирование: короче и без потери символов вне алфавита")
+    parser.add_argument('--trace-file', default=None,
+                        help="файл трасс JSONL (по умолчанию TRACE_FILE)")
+    parser.add_argument('--trace-sample', type=float, default=None,
+                        help="доля сообщений с трассой, от 0 до 1 (по умолчанию TRACE_SAMPLE или 1)")
+    args = parser.parse_args()
+    session = SessionEncoder() if args.entropy else None
+    tracer = tracer_from_env(SEND, args.trace_file, args.trace_sample)
+
     ip, port = read_config()
 
     # Создание файла для логов клиента
@@ -66,20 +55,32 @@ def main():
                 if text.lower() == 'exit':
                     break
 
-                binary_data = encode_text(text)
+                trace = tracer.start()
+                with trace.stage('encode'):
+                    if session:
+                        payload = session.encode(text)
+                        binary_data = entropy_bits(payload)
+                    else:
+                        binary_data = encode_text(text)
+                        payload = binary_data.encode('utf-8')
                 print(f"Закодированный текст: {binary_data}")
 
-                s.sendall(binary_data.encode('utf-8'))
-                print(f"Отправлено {len(binary_data)} байт")
+                with trace.stage('send'):
+                    s.sendall(frame(trace.wrap(payload)))
+                print(f"Отправлено {len(payload)} байт")
 
                 # Запись в файл клиента
-                with open(client_file, 'a', encoding='utf-8') as f:
-                    f.write(f"{datetime.now()}: {binary_data}\n")
+                with trace.stage('persist'):
+                    with open(client_file, 'a', encoding='utf-8') as f:
+                        f.write(f"{datetime.now()}: {binary_data}\n")
+                trace.finish()
 
         except ConnectionRefusedError:
             print("Не удалось подключиться к серверу")
         except KeyboardInterrupt:
             print("\nКлиент остановлен")
+        finally:
+            tracer.close()
 
 
 if __name__ == "__main__":
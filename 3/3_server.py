@@ -1,72 +1,170 @@
 import socket
 import os
+import sys
+import argparse
+import asyncio
 from datetime import datetime
 import threading
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.codec import decode_text  # noqa: E402
+from common.entropy import decode as entropy_decode, entropy_bits, is_entropy  # noqa: E402
+from common.framing import FrameReader, FramingError  # noqa: E402
+from common.logsink import LogSink  # noqa: E402
+from common.metrics import REGISTRY, start_exporter  # noqa: E402
+from common.tracing import RECEIVE, now, tracer_from_env, unwrap  # noqa: E402
+
 CONFIG_FILE = 'tcp_config.txt'
 DEFAULT_IP = '127.0.0.1'
 DEFAULT_PORT = 5005
-BUFFER_SIZE = 1024
-
-
-def decode_text(binary_str):
-    """Декодирование бинарной строки с поддержкой русского и английского алфавитов"""
-    binary_list = binary_str.split()
-    decoded = []
-    for code in binary_list:
-        if len(code) != 8:
-            decoded.append(' ')
-            continue
-
-        prefix = code[0]
-        char_code = int(code[1:], 2)
-
-        if code == '00000000':
-            decoded.append(' ')
-        elif prefix == '0':  # Английская строчная
-            decoded.append(chr(char_code + ord('a')))
-        elif prefix == '1':  # Английская заглавная
-            decoded.append(chr(char_code + ord('A')).upper())
-        elif prefix == '2':  # Русская строчная
-            if code == '21100101':  # Специальный код для 'ё'
-                decoded.append('ё')
-            else:
-                decoded.append(chr(char_code + ord('а')))
-        elif prefix == '3':  # Русская заглавная
-            if code == '31100101':  # Специальный код для 'Ё'
-                decoded.append('Ё')
+BUFFER_SIZE = 64 * 1024
+MAX_CONNECTIONS = 10000
+IDLE_TIMEOUT = 300
+
+messages_in = REGISTRY.counter('messages_in_total', "Принято сообщений")
+bytes_in = REGISTRY.counter('bytes_in_total', "Принято байт сообщений")
+decode_failures = REGISTRY.counter('decode_failures_total', "Сообщения, которые не удалось разобрать")
+active_connections = REGISTRY.gauge('active_connections', "Подключённые клиенты")
+
+
+def process_message(data, addr, log_sink, tracer, arrived=None, wait=True):
+    """Декодирование сообщения клиента и запись в журнал сервера
+
+    arrived - отметка tracing.now() после recv, с которым пришло сообщение.
+    wait=False - строка журнала не ждёт места в очереди, а отбрасывается:
+    так цикл asyncio не останавливается, если запись отстаёт.
+    """
+    trace_id, sent_ns, data = unwrap(data)
+    trace = tracer.resume(trace_id, sent_ns, now() if arrived is None else arrived)
+    messages_in.inc()
+    bytes_in.inc(len(data))
+    try:
+        with trace.stage('decode'):
+            if is_entropy(data):
+                # Энтропийный код: вместо строки кодов - биты сообщения
+                binary_data = entropy_bits(data)
+                decoded_text = entropy_decode(data)
             else:
-                decoded.append(chr(char_code + ord('А')).upper())
+                binary_data = data.decode('utf-8')
+                decoded_text = decode_text(binary_data)
+    except ValueError as e:
+        decode_failures.inc()
+        print(f"\nНекорректное сообщение от {addr}: {e}")
+        return
+
+    with trace.stage('output'):
+        print(f"\nСообщение от {addr}:")
+        print(f"Двоичные данные: {binary_data}")
+        print(f"Декодированный текст: {decoded_text}")
+
+    # Запись в файл сервера через общий поток-писатель
+    with trace.stage('persist'):
+        timestamp = datetime.now().strftime("%d%m.%Y_%H-%M-%S")
+        line = f"{timestamp} {addr}: {binary_data}\n"
+        if wait:
+            log_sink.write(line)
         else:
-            decoded.append(' ')
-    return ''.join(decoded)
+            log_sink.write_nowait(line)
+    trace.finish()
 
 
-def handle_client(conn, addr, server_file):
+def handle_client(conn, addr, log_sink, tracer):
     """Обработка подключения клиента"""
+    active_connections.inc()
     try:
         with conn:
             print(f"Подключен клиент: {addr}")
+            frames = FrameReader()
             while True:
                 data = conn.recv(BUFFER_SIZE)
                 if not data:
                     break
+                arrived = now()
 
-                binary_data = data.decode('utf-8')
-                decoded_text = decode_text(binary_data)
+                # За один recv может прийти несколько сообщений
+                for message in frames.feed(data):
+                    process_message(message, addr, log_sink, tracer, arrived)
+    except FramingError as e:
+        decode_failures.inc()
+        print(f"Ошибка протокола от {addr}: {e}")
+    finally:
+        active_connections.dec()
+        print(f"Клиент отключен: {addr}")
 
-                print(f"\nСообщение от {addr}:")
-                print(f"Двоичные данные: {binary_data}")
-                print(f"Декодированный текст: {decoded_text}")
 
-                # Запись в файл сервера
-                timestamp = datetime.now().strftime("%d%m.%Y_%H-%M-%S")
-                with open(server_file, 'a', encoding='utf-8') as f:
-                    f.write(f"{timestamp} {addr}: {binary_data}\n")
+async def handle_client_async(reader, writer, log_sink, tracer, idle_timeout):
+    """Обработка подключения клиента в цикле событий"""
+    addr = writer.get_extra_info('peername')
+    active_connections.inc()
+    try:
+        print(f"Подключен клиент: {addr}")
+        frames = FrameReader()
+        while True:
+            try:
+                data = await asyncio.wait_for(reader.read(BUFFER_SIZE), idle_timeout)
+            except asyncio.TimeoutError:
+                print(f"Клиент {addr} неактивен {idle_timeout} с")
+                break
+            if not data:
+                break
+            arrived = now()
+
+            for message in frames.feed(data):
+                process_message(message, addr, log_sink, tracer, arrived, wait=False)
+    except FramingError as e:
+        decode_failures.inc()
+        print(f"Ошибка протокола от {addr}: {e}")
+    except ConnectionError:
+        pass
     finally:
+        active_connections.dec()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
         print(f"Клиент отключен: {addr}")
 
 
+async def serve_async(ip, port, log_sink, tracer, max_connections, idle_timeout):
+    """Сервер на asyncio: все клиенты в одном потоке"""
+    active = 0
+
+    async def on_connect(reader, writer):
+        nonlocal active
+        if active >= max_connections:
+            print(f"Отклонено подключение {writer.get_extra_info('peername')}: "
+                  f"достигнут предел {max_connections}")
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            return
+
+        active += 1
+        try:
+            await handle_client_async(reader, writer, log_sink, tracer, idle_timeout)
+        finally:
+            active -= 1
+
+    server = await asyncio.start_server(on_connect, ip, port, backlog=socket.SOMAXCONN)
+    print(f"Сервер (asyncio) запущен на {ip}:{port}, не более {max_connections} клиентов")
+    async with server:
+        await server.serve_forever()
+
+
+def raise_open_files_limit():
+    """Поднятие лимита открытых файлов до максимума для большого числа клиентов"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
 def read_config():
     """Чтение конфигурационного файла"""
     try:
@@ -79,15 +177,8 @@ def read_config():
         return DEFAULT_IP, DEFAULT_PORT
 
 
-def main():
-    """Основная функция сервера"""
-    ip, port = read_config()
-
-    # Создание файла для логов сервера
-    server_file = datetime.now().strftime("%d%m.%Y_%H-%M-%S") + "_server.txt"
-    with open(server_file, 'w', encoding='utf-8') as f:
-        f.write(f"Сервер запущен {datetime.now()}\n")
-
+def serve_threaded(ip, port, log_sink, tracer):
+    """Сервер с отдельным потоком на каждого клиента"""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.bind((ip, port))
         s.listen()
@@ -98,12 +189,76 @@ def main():
                 conn, addr = s.accept()
                 client_thread = threading.Thread(
                     target=handle_client,
-                    args=(conn, addr, server_file)
+                    args=(conn, addr, log_sink, tracer)
                 )
                 client_thread.start()
         except KeyboardInterrupt:
             print("\nСервер остановлен")
 
 
+def main():
+    """Основная функция сервера"""
+    parser = argparse.ArgumentParser(description="TCP сервер")
+    parser.add_argument('--mode', choices=['thread', 'async'], default='thread',
+                        help="поток на клиента или один цикл asyncio")
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help="предел одновременных клиентов (режим async)")
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                        help="отключение неактивного клиента, секунд (режим async)")
+    parser.add_argument('--flush-interval', type=float, default=0.2,
+                        help="максимальная задержка записи журнала, секунд")
+    parser.add_argument('--fsync-interval', type=float, default=None,
+                        help="fsync журнала не чаще раза в N секунд (0 - после каждой пачки)")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="порт HTTP для /metrics и /metrics.json (по умолчанию METRICS_PORT)")
+    parser.add_argument('--stats-file', default=None,
+                        help="файл JSON со статистикой, переписывается раз в секунду "
+                             "(по умолчанию METRICS_FILE)")
+    parser.add_argument('--trace-file', default=None,
+                        help="файл трасс JSONL для сообщений с трассой (по умолчанию TRACE_FILE)")
+    args = parser.parse_args()
+
+    ip, port = read_config()
+
+    # Создание файла для логов сервера
+    server_file = datetime.now().strftime("%d%m.%Y_%H-%M-%S") + "_server.txt"
+    with open(server_file, 'w', encoding='utf-8') as f:
+        f.write(f"Сервер запущен {datetime.now()}\n")
+
+    log_sink = LogSink(server_file, flush_interval=args.flush_interval,
+                       fsync_interval=args.fsync_interval)
+    REGISTRY.gauge('log_queue_depth', "Строки журнала в очереди записи", fn=lambda: log_sink.depth)
+    REGISTRY.gauge('log_lines_rejected', "Строки журнала, отброшенные при полной очереди",
+                   fn=lambda: log_sink.lines_rejected)
+    exporter = start_exporter(args.metrics_port, args.stats_file)
+    if exporter and exporter.port:
+        print(f"Метрики: http://127.0.0.1:{exporter.port}/metrics")
+    tracer = tracer_from_env(RECEIVE, args.trace_file)
+    if tracer.enabled:
+        print(f"Трассировка в {tracer.path}")
+    try:
+        if args.mode == 'async':
+            raise_open_files_limit()
+            try:
+                asyncio.run(serve_async(ip, port, log_sink, tracer, args.max_connections,
+                                        args.idle_timeout))
+            except KeyboardInterrupt:
+                print("\nСервер остановлен")
+        else:
+            serve_threaded(ip, port, log_sink, tracer)
+    finally:
+        if exporter:
+            exporter.close()
+        tracer.close()
+        log_sink.close()
+        stats = log_sink.stats()
+        print(f"Журнал: записано {stats['lines']} строк пачками ({stats['batches']}), "
+              f"наибольшая очередь {stats['max_depth']}")
+        if stats['rejected']:
+            print(f"Строк журнала отброшено при полной очереди: {stats['rejected']}")
+        if stats['errors']:
+            print(f"Ошибок записи журнала: {stats['errors']}, потеряно строк: {stats['dropped']}")
+
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
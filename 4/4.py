@@ -1,70 +1,207 @@
+import os
 import socket
+import sys
 import json
-from datetime import datetime
+import threading
+import time
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout,
-                             QWidget, QTextEdit, QPushButton, QLabel, QComboBox,
-                             QMessageBox)
-from PyQt5.QtCore import QThread, pyqtSignal
-
-
-class UDPMessage:
-    def __init__(self, is_check=False, message=b""):
-        self.IsCheck = is_check
-        self.Message = message
-        self.Length = len(message)
-
-    def to_bytes(self):
-        """Сериализация сообщения в байты"""
-        data = {
-            'IsCheck': self.IsCheck,
-            'Length': self.Length,
-            'Message': self.Message.decode('utf-8') if not self.IsCheck else ''
-        }
-        return json.dumps(data).encode('utf-8')
-
-    @staticmethod
-    def from_bytes(data):
-        """Десериализация сообщения из байтов"""
-        try:
-            decoded = json.loads(data.decode('utf-8'))
-            msg = UDPMessage()
-            msg.IsCheck = decoded['IsCheck']
-            msg.Length = decoded['Length']
-            msg.Message = decoded['Message'].encode('utf-8') if not msg.IsCheck else b""
-            return msg
-        except:
-            return None
+                             QWidget, QTextEdit, QPlainTextEdit, QPushButton, QLabel,
+                             QComboBox, QMessageBox, QFileDialog, QCheckBox)
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from common.store import MessageStore  # noqa: E402
+from common.fragment import MAX_DATAGRAM, Reassembler, fragment, is_fragment  # noqa: E402
+from common.metrics import REGISTRY, start_exporter  # noqa: E402
+from udp_protocol import UDPMessage, CorruptedMessage, MalformedMessage  # noqa: E402
+from reliable import DATA_HEADER, ReliableEndpoint, is_reliable, WINDOW  # noqa: E402
+from probe import ProbeTracker, is_probe_payload  # noqa: E402
+from output import OutputWriter  # noqa: E402
+
+STORE_DIR = 'messages'
+# Не меньше MTU: длинные сообщения приходят фрагментами
+RECV_BUFFER_SIZE = max(4096, MAX_DATAGRAM)
+SOCKET_RCVBUF = 4 * 1024 * 1024
+# Период проверки таймеров повтора в надёжном режиме, секунд
+TICK_INTERVAL = 0.01
+# Период фоновой проверки связи по умолчанию, секунд
+PROBE_INTERVAL = 1.0
+# Поток приёма отдаёт сообщения пачками: по RECV_BATCH штук или
+# не реже чем раз в PUBLISH_INTERVAL секунд
+RECV_BATCH = 256
+PUBLISH_INTERVAL = 0.02
+# Окно выводит накопленные сообщения раз в OUTPUT_INTERVAL мс и хранит
+# не больше MAX_OUTPUT_LINES строк; более старые видны только в истории
+OUTPUT_INTERVAL = 100
+MAX_OUTPUT_LINES = 5000
+EXPORT_NAME_FORMAT = '%d.%m.%Y_%H-%M-%S.txt'
+
+messages_out = REGISTRY.counter('messages_out_total', "Отправлено сообщений")
+bytes_out = REGISTRY.counter('bytes_out_total', "Отправлено байт сообщений")
 
 
 class UDPThread(QThread):
     message_received = pyqtSignal(UDPMessage)
     error_occurred = pyqtSignal(str)
+    probe_result = pyqtSignal(object, float)
+    probe_lost = pyqtSignal(object)
+    send_failed = pyqtSignal(object, int)
 
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, reliable=False, window=WINDOW, writer=None,
+                 max_pending=MAX_OUTPUT_LINES):
         super().__init__()
         self.ip = ip
         self.port = port
         self.running = True
 
-    def run(self):
+        # Сокет создаётся сразу: через него же идёт надёжная отправка,
+        # чтобы подтверждения возвращались в этот поток
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.bind((self.ip, self.port))
+        # Большой буфер сокета, чтобы пачка фрагментов не терялась
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_RCVBUF)
+        # Ошибка привязки передаётся через error_occurred из run(): сигнал,
+        # отправленный из конструктора, ещё некому принять
+        self.bind_error = None
+        try:
+            self.sock.bind((self.ip, self.port))
+        except OSError as e:
+            self.bind_error = e
+        self.sock.settimeout(TICK_INTERVAL)
+        self.reliable = ReliableEndpoint(self.sock, window=window,
+                                         on_failure=self.send_failed.emit) if reliable else None
+        self.reassembler = Reassembler()
+        self.probes = ProbeTracker()
+        # Полученные сообщения идут пачками в writer (история и консоль)
+        # и в ограниченную очередь для окна
+        self.writer = writer
+        self.pending = deque(maxlen=max_pending)
+        self.skipped = 0
+        self._batch = []
+        self._pending_lock = threading.Lock()
+        # Счётчики качества канала
+        self.stats = {'datagrams': 0, 'bytes': 0, 'received': 0, 'corrupted': 0, 'malformed': 0,
+                      'dropped': 0}
+
+    def link_stats(self):
+        """Счётчики приёма вместе с потерями при сборке фрагментов"""
+        stats = dict(self.stats)
+        stats['dropped'] += self.reassembler.stats['expired'] + self.reassembler.stats['evicted']
+        stats['malformed'] += self.reassembler.stats['malformed']
+        if self.reliable:
+            stats['dropped'] += self.reliable.stats['failed']
+        return stats
+
+    def take_messages(self):
+        """Сообщения, накопленные для окна, и число не поместившихся в очередь"""
+        with self._pending_lock:
+            texts = list(self.pending)
+            self.pending.clear()
+            skipped, self.skipped = self.skipped, 0
+        return texts, skipped
+
+    def _publish(self):
+        batch, self._batch = self._batch, []
+        with self._pending_lock:
+            self.skipped += max(len(self.pending) + len(batch) - self.pending.maxlen, 0)
+            self.pending.extend(batch)
+        if self.writer:
+            self.writer.received(batch)
+
+    def send_probe(self, address):
+        """Отправка запроса проверки с отметкой времени; возвращает его номер
+
+        Запрос идёт через сокет этого потока, чтобы ответ пришёл сюда же.
+        """
+        nonce, payload = self.probes.make_probe()
+        self.sock.sendto(UDPMessage(is_check=True, message=payload).to_bytes(), address)
+        return nonce
+
+    def _handle_probe(self, msg, addr):
+        if msg.IsReply:
+            result = self.probes.on_reply(msg.Message)
+            if result:
+                self.probe_result.emit(*result)
+        else:
+            # Ответ отправляется сразу из потока приёма, без очереди окна
+            reply = UDPMessage(is_check=True, message=bytes(msg.Message), is_reply=True)
+            self.sock.sendto(reply.to_bytes(), addr)
 
+    def run(self):
+        if self.bind_error:
+            self.error_occurred.emit(f"Не удалось открыть порт {self.ip}:{self.port}: {self.bind_error}")
+            return
+        published = time.monotonic()
+        next_tick = published
         while self.running:
+            for nonce in self.probes.expire():
+                self.probe_lost.emit(nonce)
+            now = time.monotonic()
+            # Таймеры повтора проверяются по времени, а не по паузам в приёме:
+            # поток обычных датаграмм не должен задерживать повторы
+            if self.reliable and now >= next_tick:
+                self.reliable.tick()
+                next_tick = now + TICK_INTERVAL
+            if self._batch and (len(self._batch) >= RECV_BATCH or now - published >= PUBLISH_INTERVAL):
+                self._publish()
+                published = now
             try:
-                data, addr = self.sock.recvfrom(4096)
-                msg = UDPMessage.from_bytes(data)
-                if msg:
-                    self.message_received.emit(msg)
+                data, addr = self.sock.recvfrom(RECV_BUFFER_SIZE)
+            except socket.timeout:
+                if self._batch:
+                    self._publish()
+                    published = now
+                continue
+            except Exception as e:
+                if self.running:
+                    self.error_occurred.emit(f"Ошибка приема: {str(e)}")
+                continue
+
+            self.stats['datagrams'] += 1
+            self.stats['bytes'] += len(data)
+            try:
+                if is_reliable(data):
+                    if not self.reliable:
+                        self.stats['dropped'] += 1
+                        continue
+                    payloads = self.reliable.on_datagram(data, addr)
                 else:
-                    self.error_occurred.emit("Невозможно декодировать сообщение")
+                    payloads = [data]
+
+                for payload in payloads:
+                    if is_fragment(payload):
+                        payload = self.reassembler.feed(payload, addr)
+                        if payload is None:
+                            continue
+                    try:
+                        msg = UDPMessage.parse(payload)
+                    except CorruptedMessage:
+                        # Повреждённые датаграммы только считаются
+                        self.stats['corrupted'] += 1
+                        continue
+                    except MalformedMessage:
+                        self.stats['malformed'] += 1
+                        self.error_occurred.emit("Невозможно декодировать сообщение")
+                        continue
+                    if msg.Length != len(msg.Message):
+                        self.stats['corrupted'] += 1
+                        continue
+                    self.stats['received'] += 1
+                    if not msg.IsCheck:
+                        self._batch.append(msg.text())
+                    elif is_probe_payload(msg.Message):
+                        self._handle_probe(msg, addr)
+                    else:
+                        self.message_received.emit(msg)
             except Exception as e:
                 self.error_occurred.emit(f"Ошибка приема: {str(e)}")
 
+        if self._batch:
+            self._publish()
+
     def stop(self):
         self.running = False
-        if hasattr(self, 'sock'):
-            self.sock.close()
+        self.sock.close()
 
 
 class MainWindow(QMainWindow):
@@ -76,15 +213,70 @@ class MainWindow(QMainWindow):
         # Загрузка конфигурации
         self.load_config()
 
+        # История сообщений; запись и вывод в консоль идут в отдельном потоке
+        self.store = MessageStore(STORE_DIR)
+        self.writer = OutputWriter(self.store)
+
+        # Один сокет отправки на всё время жизни окна
+        self.target = (self.config['ip'], self.config['port'])
+        self.send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
         # Инициализация UI
         self.init_ui()
 
         # UDP соединение
-        self.udp_thread = UDPThread(self.config['ip'], self.config['port'])
+        self.udp_thread = UDPThread(self.config['ip'], self.config['port'],
+                                    reliable=self.config.get('reliable', False),
+                                    window=self.config.get('window', WINDOW),
+                                    writer=self.writer,
+                                    max_pending=self.config.get('max_output_lines', MAX_OUTPUT_LINES))
+        self.writer.on_error = self.udp_thread.error_occurred.emit
+        self.register_metrics()
         self.udp_thread.message_received.connect(self.handle_message)
         self.udp_thread.error_occurred.connect(self.show_error)
+        self.udp_thread.probe_result.connect(self.handle_probe_result)
+        self.udp_thread.probe_lost.connect(self.handle_probe_lost)
+        self.udp_thread.send_failed.connect(self.handle_send_failed)
         self.udp_thread.start()
 
+        # Запросы проверки, отправленные вручную, ждут вывода в окно
+        self.manual_probes = set()
+        self.probe_timer = QTimer(self)
+        self.probe_timer.setInterval(int(self.config.get('probe_interval', PROBE_INTERVAL) * 1000))
+        self.probe_timer.timeout.connect(self.send_background_probe)
+
+        # Полученные сообщения выводятся пачками по таймеру
+        self.output_timer = QTimer(self)
+        self.output_timer.timeout.connect(self.flush_output)
+        self.output_timer.start(OUTPUT_INTERVAL)
+
+        # Экспорт метрик по ключам metrics_port и stats_file конфигурации
+        self.exporter = start_exporter(self.config.get('metrics_port'), self.config.get('stats_file'))
+
+        # Раз в секунду обновляем счётчики качества канала
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.update_stats)
+        self.stats_timer.start(1000)
+
+    def register_metrics(self):
+        """Метрики приёма читаются из счётчиков потока только при снятии"""
+        thread = self.udp_thread
+        REGISTRY.counter('datagrams_in_total', "Принято датаграмм",
+                         fn=lambda: thread.stats['datagrams'])
+        REGISTRY.counter('bytes_in_total', "Принято байт датаграмм", fn=lambda: thread.stats['bytes'])
+        REGISTRY.counter('messages_in_total', "Принято сообщений", fn=lambda: thread.stats['received'])
+        REGISTRY.counter('decode_failures_total', "Повреждённые и некорректные сообщения",
+                         fn=lambda: thread.stats['corrupted'] + thread.stats['malformed'])
+        REGISTRY.counter('messages_dropped_total', "Сообщения, потерянные при сборке и повторах",
+                         fn=lambda: thread.link_stats()['dropped'])
+        REGISTRY.gauge('output_queue_depth', "Пачки и строки в очереди записи истории",
+                       fn=lambda: self.writer.depth)
+        REGISTRY.gauge('window_queue_depth', "Сообщения, ожидающие вывода в окно",
+                       fn=lambda: len(thread.pending))
+        if thread.reliable:
+            REGISTRY.gauge('reliable_pending', "Неподтверждённые сообщения надёжного режима",
+                           fn=thread.reliable.pending)
+
     def load_config(self):
         """Загрузка конфигурации из файла"""
         try:
@@ -122,22 +314,56 @@ class MainWindow(QMainWindow):
         self.clear_btn = QPushButton("Очистить")
         self.clear_btn.clicked.connect(self.clear_fields)
         btn_layout.addWidget(self.clear_btn)
+
+        self.export_btn = QPushButton("Экспорт истории")
+        self.export_btn.clicked.connect(self.export_history)
+        btn_layout.addWidget(self.export_btn)
+
+        self.probe_check = QCheckBox("Фоновая проверка связи")
+        self.probe_check.toggled.connect(self.toggle_background_probe)
+        btn_layout.addWidget(self.probe_check)
         layout.addLayout(btn_layout)
 
         # Вывод информации
-        self.output_text = QTextEdit()
+        self.output_text = QPlainTextEdit()
         self.output_text.setReadOnly(True)
+        self.output_text.setMaximumBlockCount(self.config.get('max_output_lines', MAX_OUTPUT_LINES))
         layout.addWidget(QLabel("Полученные сообщения:"))
         layout.addWidget(self.output_text)
 
+        self.stats_label = QLabel()
+        layout.addWidget(self.stats_label)
+
         main_widget.setLayout(layout)
         self.setCentralWidget(main_widget)
 
+    def send(self, message=b"", is_check=False, address=None):
+        """Отправка сообщения без участия интерфейса
+
+        message - str или bytes, address - (ip, port), по умолчанию из
+        конфигурации. Возвращает число байт сообщения. В надёжном режиме
+        (ключ "reliable" в config.json) сообщение ставится в очередь
+        и повторяется до подтверждения.
+        """
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        data = UDPMessage(is_check=is_check, message=message).to_bytes()
+        reliable = self.udp_thread.reliable
+        # Длинное сообщение режется на фрагменты по размеру MTU
+        if reliable:
+            for datagram in fragment(data, MAX_DATAGRAM - DATA_HEADER.size):
+                reliable.send(datagram, address or self.target)
+        else:
+            for datagram in fragment(data):
+                self.send_sock.sendto(datagram, address or self.target)
+        messages_out.inc()
+        bytes_out.inc(len(data))
+        return len(data)
+
     def send_message(self):
         """Отправка сообщения"""
         try:
             mode = self.mode_combo.currentIndex()
-            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
             if mode == 0:  # Обычное сообщение
                 text = self.input_text.toPlainText()
@@ -145,61 +371,107 @@ class MainWindow(QMainWindow):
                     QMessageBox.warning(self, "Ошибка", "Введите сообщение")
                     return
 
-                msg = UDPMessage(is_check=False, message=text.encode('utf-8'))
-                sock.sendto(msg.to_bytes(), (self.config['ip'], self.config['port']))
+                self.send(text)
 
                 # Логирование отправки
                 self.log_message(f"Отправлено: {text}")
 
             elif mode == 1:  # Проверка соединения
-                msg = UDPMessage(is_check=True)
-                sock.sendto(msg.to_bytes(), (self.config['ip'], self.config['port']))
+                self.manual_probes.add(self.udp_thread.send_probe(self.target))
                 self.log_message("Отправлен запрос проверки соединения")
 
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Ошибка отправки: {str(e)}")
-        finally:
-            sock.close()
 
     def handle_message(self, msg):
-        """Обработка входящего сообщения"""
-        if msg.IsCheck:
-            # Отправляем ответ на проверку соединения
-            try:
-                response = UDPMessage(is_check=False, message="Проблем не обнаружено".encode('utf-8'))
-                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                sock.sendto(response.to_bytes(), (self.config['ip'], self.config['port']))
-                sock.close()
-                self.log_message("Отправлен ответ на проверку соединения")
-            except Exception as e:
-                self.show_error(f"Ошибка отправки ответа: {str(e)}")
+        """Обработка запроса проверки соединения от прежних версий
+
+        Обычные сообщения сюда не попадают: их выводит flush_output.
+        """
+        # Отправляем ответ на проверку соединения
+        try:
+            self.send("Проблем не обнаружено")
+            self.log_message("Отправлен ответ на проверку соединения")
+        except Exception as e:
+            self.show_error(f"Ошибка отправки ответа: {str(e)}")
+
+    def flush_output(self):
+        """Вывод сообщений, накопленных потоком приёма, одной вставкой"""
+        texts, skipped = self.udp_thread.take_messages()
+        if not texts and not skipped:
+            return
+        lines = [f"Получено: {text}" for text in texts]
+        if skipped:
+            lines.insert(0, f"... пропущено {skipped} сообщений, они сохранены в истории")
+        self.output_text.appendPlainText('\n'.join(lines))
+
+    def handle_probe_result(self, nonce, rtt):
+        """Ответ на запрос проверки соединения"""
+        if nonce in self.manual_probes:
+            self.manual_probes.discard(nonce)
+            self.output_text.appendPlainText(f"Проблем не обнаружено, RTT {rtt * 1000:.2f} мс")
+            self.log_message(f"Получен ответ на проверку соединения за {rtt * 1000:.2f} мс")
+
+    def handle_probe_lost(self, nonce):
+        """Запрос проверки остался без ответа"""
+        if nonce in self.manual_probes:
+            self.manual_probes.discard(nonce)
+            self.output_text.appendPlainText("Нет ответа на проверку соединения")
+            self.log_message("Ошибка: нет ответа на проверку соединения")
+
+    def handle_send_failed(self, address, seq):
+        """Пакет надёжного режима брошен после всех повторов"""
+        self.output_text.appendPlainText(f"Сообщение для {address[0]}:{address[1]} не доставлено")
+        self.log_message(f"Ошибка: пакет №{seq} для {address[0]}:{address[1]} "
+                         f"не подтверждён после всех повторов")
+
+    def toggle_background_probe(self, enabled):
+        if enabled:
+            self.probe_timer.start()
         else:
-            # Проверяем длину сообщения
-            if msg.Length == len(msg.Message):
-                text = msg.Message.decode('utf-8')
-                self.output_text.append(f"Получено: {text}")
-                self.log_message(f"Получено: {text}")
-
-                # Сохранение в файл
-                self.save_to_file(text)
+            self.probe_timer.stop()
+
+    def send_background_probe(self):
+        try:
+            self.udp_thread.send_probe(self.target)
+        except OSError as e:
+            self.log_message(f"Ошибка фоновой проверки: {e}")
+
+    def probe_stats(self):
+        """Сводка RTT: p50/p95/p99, джиттер и последний RTT в секундах, доля потерь"""
+        return self.udp_thread.probes.summary()
+
+    def update_stats(self):
+        """Отображение счётчиков приёма и RTT"""
+        stats = self.udp_thread.link_stats()
+        text = (f"Датаграмм: {stats['datagrams']}, сообщений: {stats['received']}, "
+                f"повреждено: {stats['corrupted']}, некорректных: {stats['malformed']}, "
+                f"потеряно: {stats['dropped']}")
+
+        probes = self.probe_stats()
+        if probes['sent']:
+            if probes['p50'] is not None:
+                text += (f"\nRTT p50/p95/p99: {probes['p50'] * 1000:.2f}/{probes['p95'] * 1000:.2f}/"
+                         f"{probes['p99'] * 1000:.2f} мс, джиттер {probes['jitter'] * 1000:.2f} мс, ")
             else:
-                self.output_text.append("Сообщение повреждено!")
-                self.log_message("Ошибка: получено поврежденное сообщение")
+                text += "\n"
+            text += f"потери проверок {probes['loss_rate'] * 100:.1f}%"
+        self.stats_label.setText(text)
 
     def log_message(self, message):
-        """Логирование в консоль"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"[{timestamp}] {message}")
-
-    def save_to_file(self, message):
-        """Сохранение сообщения в файл"""
-        filename = datetime.now().strftime("%d.%m.%Y_%H-%M-%S.txt")
+        """Логирование в консоль через поток вывода"""
+        self.writer.log(message)
+
+    def export_history(self):
+        """Выгрузка истории в отдельные файлы прежнего формата"""
+        directory = QFileDialog.getExistingDirectory(self, "Каталог для экспорта")
+        if not directory:
+            return
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(message)
-            self.log_message(f"Сообщение сохранено в {filename}")
+            exported = self.store.export(directory, EXPORT_NAME_FORMAT)
+            self.log_message(f"Выгружено {len(exported)} сообщений в {directory}")
         except Exception as e:
-            self.show_error(f"Ошибка сохранения файла: {str(e)}")
+            self.show_error(f"Ошибка экспорта: {str(e)}")
 
     def show_error(self, error):
         """Отображение ошибки"""
@@ -212,8 +484,15 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, event):
         """Обработка закрытия окна"""
+        self.probe_timer.stop()
+        if self.exporter:
+            self.exporter.close()
         self.udp_thread.stop()
         self.udp_thread.wait()
+        self.output_timer.stop()
+        self.send_sock.close()
+        self.writer.close()
+        self.store.close()
         event.accept()
 
 
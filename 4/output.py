@@ -0,0 +1,95 @@
+"""Вывод в консоль и запись истории вне потока интерфейса
+
+Поток приёма передаёт полученные сообщения пачками, окно - отдельные
+строки журнала. Поток-писатель забирает из очереди всё накопившееся,
+дописывает сообщения в хранилище одной пачкой и печатает строки одним
+вызовом write, поэтому поток интерфейса не ждёт ни диска, ни консоли.
+"""
+import queue
+import sys
+import threading
+from datetime import datetime
+
+from common.store import RECEIVED
+
+_STOP = object()
+
+
+class OutputWriter:
+    """Очередь вывода с единственным потоком-писателем
+
+    on_error вызывается из потока-писателя с текстом ошибки.
+    """
+
+    def __init__(self, store, stream=None, max_queue=1024, on_error=None):
+        self.store = store
+        self.stream = stream or sys.stdout
+        self.on_error = on_error
+        self.saved = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="OutputWriter", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """Число пачек и строк в очереди"""
+        return self._queue.qsize()
+
+    def log(self, message):
+        """Строка журнала с отметкой времени"""
+        self._queue.put((datetime.now(), message))
+
+    def received(self, texts):
+        """Пачка полученных сообщений: в историю и в журнал
+
+        При переполнении очереди ждёт писателя, чтобы не терять историю.
+        """
+        if texts:
+            self._queue.put((datetime.now(), list(texts)))
+
+    def close(self):
+        """Вывод оставшегося и остановка потока"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items = [self._queue.get()]
+            # Всё, что накопилось за время предыдущей записи, выводится разом
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if items[-1] is _STOP:
+                stopping = True
+                items.pop()
+
+            lines = []
+            for timestamp, item in items:
+                prefix = timestamp.strftime("[%H:%M:%S] ")
+                if isinstance(item, str):
+                    lines.append(prefix + item)
+                    continue
+                lines.extend(f"{prefix}Получено: {text}" for text in item)
+                try:
+                    first = self.store.append_many([text.encode('utf-8') for text in item],
+                                                   kind=RECEIVED)
+                    self.saved += len(item)
+                    if len(item) == 1:
+                        lines.append(f"{prefix}Сообщение сохранено в историю под номером {first + 1}")
+                    else:
+                        lines.append(f"{prefix}Сообщения сохранены в историю под номерами "
+                                     f"{first + 1}-{first + len(item)}")
+                except Exception as e:
+                    lines.append(f"{prefix}Ошибка: ошибка сохранения файла: {e}")
+                    if self.on_error:
+                        self.on_error(f"Ошибка сохранения файла: {str(e)}")
+
+            if lines:
+                try:
+                    self.stream.write('\n'.join(lines) + '\n')
+                    self.stream.flush()
+                except (OSError, ValueError):
+                    pass
@@ -0,0 +1,110 @@
+"""Измерение RTT запросами проверки соединения
+
+Запрос IsCheck несёт PROBE: случайный номер (nonce) и время отправки
+по time.monotonic_ns. Получатель сразу возвращает те же байты с флагом
+ответа, отправитель по номеру находит свой запрос и считает RTT.
+Последние window измерений дают процентили, джиттер и долю потерь.
+"""
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+
+# номер запроса, время отправки в наносекундах
+PROBE = struct.Struct('!QQ')
+PROBE_WINDOW = 1000
+PROBE_TIMEOUT = 2.0
+
+
+def is_probe_payload(payload):
+    return len(payload) == PROBE.size
+
+
+def percentile(sorted_values, fraction):
+    """Процентиль по ближайшему рангу"""
+    if not sorted_values:
+        return None
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class ProbeTracker:
+    """Учёт отправленных запросов и статистика RTT"""
+
+    def __init__(self, window=PROBE_WINDOW, timeout=PROBE_TIMEOUT):
+        self.timeout = timeout
+        self.sent = 0
+        self.received = 0
+        self.lost = 0
+        self.late = 0
+        self.jitter = 0.0
+        self.last_rtt = None
+        self._rtts = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def make_probe(self):
+        """Новый запрос; возвращает (nonce, байты для сообщения IsCheck)"""
+        nonce = int.from_bytes(os.urandom(8), 'big')
+        sent_ns = time.monotonic_ns()
+        with self._lock:
+            self._pending[nonce] = sent_ns
+            self.sent += 1
+        return nonce, PROBE.pack(nonce, sent_ns)
+
+    def on_reply(self, payload):
+        """Обработка ответа; возвращает (nonce, RTT в секундах) или None"""
+        now_ns = time.monotonic_ns()
+        nonce, sent_ns = PROBE.unpack_from(payload)
+        with self._lock:
+            # Время берётся из своей записи, а не из ответа
+            if self._pending.pop(nonce, None) != sent_ns:
+                self.late += 1
+                return None
+            rtt = (now_ns - sent_ns) / 1e9
+            if self.last_rtt is not None:
+                # Сглаженный джиттер как в RFC 3550
+                self.jitter += (abs(rtt - self.last_rtt) - self.jitter) / 16
+            self.last_rtt = rtt
+            self.received += 1
+            self._rtts.append(rtt)
+            self._outcomes.append(True)
+        return nonce, rtt
+
+    def expire(self):
+        """Запросы без ответа дольше timeout считаются потерянными"""
+        if not self._pending:
+            return []
+        deadline = time.monotonic_ns() - int(self.timeout * 1e9)
+        lost = []
+        with self._lock:
+            while self._pending:
+                nonce, sent_ns = next(iter(self._pending.items()))
+                if sent_ns > deadline:
+                    break
+                del self._pending[nonce]
+                self.lost += 1
+                self._outcomes.append(False)
+                lost.append(nonce)
+        return lost
+
+    def summary(self):
+        """Сводка по последним измерениям, времена в секундах"""
+        with self._lock:
+            rtts = sorted(self._rtts)
+            outcomes = list(self._outcomes)
+            summary = {
+                'sent': self.sent,
+                'received': self.received,
+                'lost': self.lost,
+                'late': self.late,
+                'last': self.last_rtt,
+                'jitter': self.jitter if rtts else None,
+            }
+        summary['p50'] = percentile(rtts, 0.50)
+        summary['p95'] = percentile(rtts, 0.95)
+        summary['p99'] = percentile(rtts, 0.99)
+        summary['loss_rate'] = outcomes.count(False) / len(outcomes) if outcomes else 0.0
+        return summary
@@ -0,0 +1,334 @@
+"""Надёжная доставка датаграмм поверх UDP
+
+Каждый пакет DATA несёт номер сеанса отправителя и порядковый номер.
+Получатель отвечает пакетом ACK: накопительное подтверждение (номер
+следующего ожидаемого пакета) и до MAX_SACK_BLOCKS диапазонов уже
+полученных пакетов за разрывом (выборочное подтверждение). Пакет без
+подтверждения повторяется по таймеру, который считается по измеренному
+RTT (RFC 6298). RTT меряется только по пакету, номер которого ACK
+повторяет, поэтому задержанные подтверждения не завышают оценку.
+Одновременно в пути не больше window пакетов на адрес.
+
+Пакеты доставляются приложению по порядку, но потеря одного пакета
+задерживает только пакеты того же адреса.
+
+Номер пакета - 32 бита без перехода через ноль: в одном сеансе на один
+адрес можно отправить не больше MAX_SEQ пакетов (при 100 тысячах пакетов
+в секунду - около 12 часов), дальше send() вызывает OverflowError.
+Перезапуск отправителя начинает новый сеанс с нулевого номера.
+
+Пакет, не подтверждённый после max_retries повторов, отбрасывается
+(вызывается on_failure), а получателю уходит пакет SKIP с номером
+самого раннего ещё ожидающего подтверждения пакета: получатель
+пропускает недостающие номера ниже него и отдаёт накопленные за
+разрывом пакеты. SKIP повторяется, пока накопительное подтверждение
+не дойдёт до этого номера.
+"""
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+MAGIC = 0xb5
+DATA = 1
+ACK = 2
+SKIP = 3
+
+# метка, тип, сеанс, номер пакета; у SKIP - номер, с которого
+# продолжается приём
+DATA_HEADER = struct.Struct('!BBII')
+# метка, тип, сеанс, накопительное подтверждение, номер пакета,
+# вызвавшего подтверждение, число диапазонов
+ACK_HEADER = struct.Struct('!BBIIIB')
+SACK_BLOCK = struct.Struct('!II')
+MAX_SACK_BLOCKS = 16
+# Пакет считается потерянным без ожидания таймера, если подтверждены
+# DUP_THRESHOLD более поздних пакетов (быстрый повтор)
+DUP_THRESHOLD = 3
+
+WINDOW = 64
+INITIAL_RTO = 0.2
+MIN_RTO = 0.02
+MAX_RTO = 2.0
+MAX_RETRIES = 30
+# Номера пакетов сравниваются как обычные числа, без арифметики по модулю
+MAX_SEQ = 2 ** 32
+
+
+def is_reliable(data):
+    """Проверка, что датаграмма относится к надёжному режиму"""
+    return data[:1] == bytes([MAGIC])
+
+
+class RttEstimator:
+    """Оценка RTT и таймаута повтора по RFC 6298"""
+
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(max(self.srtt + 4 * self.rttvar, self.min_rto), self.max_rto)
+
+
+class _Outstanding:
+    __slots__ = ('packet', 'sent_at', 'deadline', 'retries')
+
+    def __init__(self, packet, now, rto):
+        self.packet = packet
+        self.sent_at = now
+        self.deadline = now + rto
+        self.retries = 0
+
+
+class _Peer:
+    """Состояние обмена с одним адресом"""
+
+    def __init__(self, rtt):
+        # Отправка
+        self.next_seq = 0
+        self.unacked = {}
+        self.backlog = deque()
+        self.rtt = rtt
+        # Номер, до которого получатель должен пропустить брошенные пакеты
+        self.skip_to = None
+        self.skip_deadline = 0.0
+        self.skip_retries = 0
+        # Приём
+        self.remote_session = None
+        self.expected = 0
+        self.out_of_order = {}
+
+
+class ReliableEndpoint:
+    """Надёжная отправка и приём через один UDP сокет
+
+    send() можно вызывать из любого потока. Поток приёма передаёт
+    каждую датаграмму режима в on_datagram() и регулярно вызывает
+    tick() для повторов по таймеру.
+    """
+
+    def __init__(self, sock, window=WINDOW, max_retries=MAX_RETRIES,
+                 min_rto=MIN_RTO, max_rto=MAX_RTO, on_failure=None):
+        self.sock = sock
+        self.window = window
+        self.max_retries = max_retries
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.on_failure = on_failure
+        self.session = int.from_bytes(os.urandom(4), 'big')
+        self.stats = {
+            'sent': 0, 'retransmitted': 0, 'acked': 0, 'failed': 0,
+            'delivered': 0, 'duplicates': 0, 'acks_sent': 0, 'skipped': 0,
+        }
+        self._peers = {}
+        self._lock = threading.Lock()
+
+    def _peer(self, addr):
+        peer = self._peers.get(addr)
+        if peer is None:
+            peer = self._peers[addr] = _Peer(RttEstimator(min_rto=self.min_rto, max_rto=self.max_rto))
+        return peer
+
+    def send(self, payload, addr):
+        """Постановка сообщения в очередь надёжной отправки"""
+        with self._lock:
+            peer = self._peer(addr)
+            if peer.next_seq + len(peer.backlog) >= MAX_SEQ:
+                raise OverflowError(f"Исчерпаны номера пакетов сеанса для {addr}")
+            peer.backlog.append(payload)
+            self._fill_window(peer, addr)
+
+    def _fill_window(self, peer, addr):
+        now = time.monotonic()
+        while peer.backlog and len(peer.unacked) < self.window:
+            packet = DATA_HEADER.pack(MAGIC, DATA, self.session, peer.next_seq) + peer.backlog.popleft()
+            peer.unacked[peer.next_seq] = _Outstanding(packet, now, peer.rtt.rto)
+            peer.next_seq += 1
+            self.sock.sendto(packet, addr)
+            self.stats['sent'] += 1
+
+    def pending(self, addr=None):
+        """Число неподтверждённых и ожидающих окна сообщений"""
+        with self._lock:
+            peers = [self._peers[addr]] if addr in self._peers else (
+                [] if addr is not None else list(self._peers.values()))
+            return sum(len(peer.unacked) + len(peer.backlog) for peer in peers)
+
+    def rtt(self, addr):
+        """Сглаженный RTT до адреса в секундах или None"""
+        with self._lock:
+            peer = self._peers.get(addr)
+            return peer.rtt.srtt if peer else None
+
+    def on_datagram(self, data, addr):
+        """Обработка датаграммы DATA/ACK/SKIP; возвращает доставленные по порядку сообщения"""
+        view = memoryview(data)
+        kind = view[1] if len(view) > 1 else None
+        with self._lock:
+            if kind == DATA and len(view) >= DATA_HEADER.size:
+                _, _, session, seq = DATA_HEADER.unpack_from(view)
+                return self._on_data(session, seq, bytes(view[DATA_HEADER.size:]), addr)
+            if kind == ACK and len(view) >= ACK_HEADER.size:
+                self._on_ack(view, addr)
+            elif kind == SKIP and len(view) >= DATA_HEADER.size:
+                _, _, session, floor = DATA_HEADER.unpack_from(view)
+                return self._on_skip(session, floor, addr)
+        return []
+
+    def _receiving_peer(self, session, addr):
+        peer = self._peer(addr)
+        if peer.remote_session != session:
+            # Отправитель перезапущен - нумерация начинается заново
+            peer.remote_session = session
+            peer.expected = 0
+            peer.out_of_order = {}
+        return peer
+
+    def _on_data(self, session, seq, payload, addr):
+        peer = self._receiving_peer(session, addr)
+        delivered = []
+        if seq < peer.expected or seq in peer.out_of_order:
+            self.stats['duplicates'] += 1
+        elif seq == peer.expected:
+            delivered.append(payload)
+            peer.expected += 1
+            while peer.expected in peer.out_of_order:
+                delivered.append(peer.out_of_order.pop(peer.expected))
+                peer.expected += 1
+        elif seq < peer.expected + self.window * 4:
+            peer.out_of_order[seq] = payload
+
+        self.stats['delivered'] += len(delivered)
+        self._send_ack(peer, session, seq, addr)
+        return delivered
+
+    def _on_skip(self, session, floor, addr):
+        """Отправитель бросил пакеты ниже floor: приём продолжается с floor"""
+        peer = self._receiving_peer(session, addr)
+        delivered = []
+        if floor > peer.expected:
+            for seq in sorted(peer.out_of_order):
+                if seq >= floor:
+                    break
+                delivered.append(peer.out_of_order.pop(seq))
+            self.stats['skipped'] += floor - peer.expected - len(delivered)
+            peer.expected = floor
+            while peer.expected in peer.out_of_order:
+                delivered.append(peer.out_of_order.pop(peer.expected))
+                peer.expected += 1
+        self.stats['delivered'] += len(delivered)
+        # Повторяется номер ниже floor: такого пакета у отправителя уже нет,
+        # и ответ на SKIP не попадёт в замер RTT
+        self._send_ack(peer, session, max(floor, 1) - 1, addr)
+        return delivered
+
+    def _send_ack(self, peer, session, echo_seq, addr):
+        blocks = []
+        for seq in sorted(peer.out_of_order):
+            if blocks and blocks[-1][1] == seq:
+                blocks[-1][1] = seq + 1
+            else:
+                blocks.append([seq, seq + 1])
+        # Сообщаются самые свежие диапазоны: старые уже были в прошлых ACK
+        blocks = blocks[-MAX_SACK_BLOCKS:]
+        packet = ACK_HEADER.pack(MAGIC, ACK, session, peer.expected, echo_seq, len(blocks))
+        packet += b''.join(SACK_BLOCK.pack(start, end) for start, end in blocks)
+        self.sock.sendto(packet, addr)
+        self.stats['acks_sent'] += 1
+
+    def _on_ack(self, view, addr):
+        _, _, session, cumulative, echo_seq, count = ACK_HEADER.unpack_from(view)
+        peer = self._peers.get(addr)
+        if peer is None or session != self.session:
+            return
+
+        now = time.monotonic()
+        echoed = peer.unacked.get(echo_seq)
+        # Алгоритм Карна: RTT меряется только по пакетам без повторов
+        if echoed is not None and not echoed.retries:
+            peer.rtt.sample(now - echoed.sent_at)
+
+        if peer.skip_to is not None and cumulative >= peer.skip_to:
+            peer.skip_to = None
+
+        acked = [seq for seq in peer.unacked if seq < cumulative]
+        for i in range(count):
+            offset = ACK_HEADER.size + i * SACK_BLOCK.size
+            if offset + SACK_BLOCK.size > len(view):
+                break
+            start, end = SACK_BLOCK.unpack_from(view, offset)
+            acked.extend(seq for seq in range(start, min(end, start + self.window))
+                         if seq in peer.unacked)
+
+        highest = -1
+        for seq in acked:
+            if peer.unacked.pop(seq, None) is not None:
+                self.stats['acked'] += 1
+                highest = max(highest, seq)
+
+        # Быстрый повтор пропусков ниже подтверждённых пакетов
+        for seq, entry in peer.unacked.items():
+            if seq + DUP_THRESHOLD <= highest and not entry.retries:
+                entry.retries = 1
+                entry.deadline = now + min(peer.rtt.rto * 2, self.max_rto)
+                self.sock.sendto(entry.packet, addr)
+                self.stats['retransmitted'] += 1
+        self._fill_window(peer, addr)
+
+    def _send_skip(self, peer, addr, now):
+        packet = DATA_HEADER.pack(MAGIC, SKIP, self.session, peer.skip_to)
+        peer.skip_deadline = now + min(peer.rtt.rto * 2 ** peer.skip_retries, self.max_rto)
+        self.sock.sendto(packet, addr)
+
+    def tick(self):
+        """Повтор пакетов с истёкшим таймером"""
+        now = time.monotonic()
+        failed = []
+        with self._lock:
+            for addr, peer in self._peers.items():
+                abandoned = False
+                expired = [seq for seq, entry in peer.unacked.items() if entry.deadline <= now]
+                for seq in expired:
+                    entry = peer.unacked[seq]
+                    if self.max_retries is not None and entry.retries >= self.max_retries:
+                        del peer.unacked[seq]
+                        self.stats['failed'] += 1
+                        failed.append((addr, seq))
+                        abandoned = True
+                        continue
+                    # Экспоненциальная задержка у каждого пакета своя, чтобы
+                    # одна потеря не замедляла повторы остальных пакетов
+                    entry.retries += 1
+                    entry.deadline = now + min(peer.rtt.rto * 2 ** entry.retries, self.max_rto)
+                    self.sock.sendto(entry.packet, addr)
+                    self.stats['retransmitted'] += 1
+
+                if abandoned:
+                    # Всё ниже самого раннего ожидающего пакета подтверждено
+                    # или брошено - получатель может не ждать этих номеров
+                    floor = min(peer.unacked) if peer.unacked else peer.next_seq
+                    peer.skip_to = max(floor, peer.skip_to or 0)
+                    peer.skip_retries = 0
+                    self._send_skip(peer, addr, now)
+                elif peer.skip_to is not None and peer.skip_deadline <= now:
+                    if self.max_retries is not None and peer.skip_retries >= self.max_retries:
+                        peer.skip_to = None
+                    else:
+                        peer.skip_retries += 1
+                        self._send_skip(peer, addr, now)
+                self._fill_window(peer, addr)
+
+        if self.on_failure:
+            for addr, seq in failed:
+                self.on_failure(addr, seq)
@@ -0,0 +1,132 @@
+"""Формат датаграмм протокола v4
+
+Версия 1 - JSON {"IsCheck", "Length", "Message"}, версия 2 - двоичная:
+заголовок HEADER (метка MAGIC, версия, флаги, длина) и сразу за ним
+байты сообщения. Версия 3 добавляет после заголовка CRC32 заголовка и
+сообщения. Версия определяется по первому байту датаграммы: JSON
+всегда начинается с '{', двоичный формат - с MAGIC.
+"""
+import json
+import struct
+import zlib
+
+JSON_VERSION = 1
+BINARY_VERSION = 2
+CRC_VERSION = 3
+VERSION = CRC_VERSION
+
+MAGIC = 0xb4
+FLAG_CHECK = 0x01
+FLAG_REPLY = 0x02
+# метка, версия, флаги, длина сообщения
+HEADER = struct.Struct('!BBBI')
+CRC = struct.Struct('!I')
+
+
+class MalformedMessage(ValueError):
+    """Датаграмма не соответствует формату"""
+
+
+class CorruptedMessage(MalformedMessage):
+    """Не совпала контрольная сумма или длина сообщения"""
+
+
+def checksum(header, payload):
+    """CRC32 заголовка и сообщения, считается по memoryview без копий"""
+    return zlib.crc32(payload, zlib.crc32(header))
+
+
+class UDPMessage:
+    __slots__ = ('IsCheck', 'IsReply', 'Length', 'Message')
+
+    def __init__(self, is_check=False, message=b"", is_reply=False):
+        self.IsCheck = is_check
+        self.IsReply = is_reply
+        self.Message = message
+        self.Length = len(message)
+
+    def text(self):
+        """Текст сообщения; Message может быть bytes или memoryview"""
+        return str(self.Message, 'utf-8')
+
+    def to_bytes(self, version=VERSION):
+        """Сериализация сообщения в байты"""
+        if version == JSON_VERSION:
+            return self.to_json_bytes()
+        flags = (FLAG_CHECK if self.IsCheck else 0) | (FLAG_REPLY if self.IsReply else 0)
+        if version == BINARY_VERSION:
+            return HEADER.pack(MAGIC, BINARY_VERSION, flags, self.Length) + self.Message
+        header = HEADER.pack(MAGIC, CRC_VERSION, flags, self.Length)
+        return header + CRC.pack(checksum(header, self.Message)) + self.Message
+
+    def to_json_bytes(self):
+        """Сериализация в прежний формат JSON"""
+        data = {
+            'IsCheck': self.IsCheck,
+            'Length': self.Length,
+            'Message': self.text() if not self.IsCheck else ''
+        }
+        return json.dumps(data).encode('utf-8')
+
+    @staticmethod
+    def from_bytes(data):
+        """Десериализация сообщения из байтов; None, если данные не разобрать"""
+        try:
+            return UDPMessage.parse(data)
+        except MalformedMessage:
+            return None
+
+    @staticmethod
+    def parse(data):
+        """Разбор датаграммы с проверкой целостности
+
+        Для двоичного формата Message - memoryview поверх data, без
+        копирования. Повреждённое сообщение версии 3 отбрасывается
+        исключением CorruptedMessage ещё до декодирования UTF-8,
+        прочие ошибки формата - MalformedMessage.
+        """
+        if data[:1] == b'{':
+            try:
+                return UDPMessage._from_json(data)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise MalformedMessage(f"Некорректный JSON: {e}") from None
+
+        view = memoryview(data)
+        if len(view) < HEADER.size:
+            raise MalformedMessage("Датаграмма короче заголовка")
+        magic, version, flags, length = HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise MalformedMessage("Неизвестный формат датаграммы")
+
+        if version == CRC_VERSION:
+            start = HEADER.size + CRC.size
+            if len(view) - start != length:
+                raise CorruptedMessage(f"Длина {len(view) - start} вместо {length}")
+            (expected,) = CRC.unpack_from(view, HEADER.size)
+            payload = view[start:]
+            if checksum(view[:HEADER.size], payload) != expected:
+                raise CorruptedMessage("Неверная контрольная сумма")
+        elif version == BINARY_VERSION:
+            # Лишние байты после сообщения бывают, например, у версии 3
+            # с повреждённым номером версии
+            if len(view) > HEADER.size + length:
+                raise CorruptedMessage("Данные после конца сообщения")
+            payload = view[HEADER.size:HEADER.size + length]
+        else:
+            raise MalformedMessage(f"Неподдерживаемая версия {version}")
+
+        msg = UDPMessage()
+        msg.IsCheck = bool(flags & FLAG_CHECK)
+        msg.IsReply = bool(flags & FLAG_REPLY)
+        msg.Length = length
+        msg.Message = payload
+        return msg
+
+    @staticmethod
+    def _from_json(data):
+        decoded = json.loads(bytes(data).decode('utf-8'))
+        msg = UDPMessage()
+        msg.IsCheck = decoded['IsCheck']
+        msg.Length = decoded['Length']
+        msg.Message = decoded['Message'].encode('utf-8') if not msg.IsCheck else b""
+        return msg
@@ -0,0 +1,305 @@
+"""Микробенчмарк кодеков: кодирование, декодирование, кодовые страницы
+
+Замеряются чисто процессорные горячие пути:
+    codec.*      - строка кодов common.codec (2/2.py, 3/) и упакованный формат
+    entropy.*    - энтропийный код common.entropy
+    codepage.*   - encode_text/decode_bytes окна EncodingApp (1/encoding_core)
+                   для четырёх кодовых страниц и перевод байтов между ними
+    udp4.*       - UDPMessage.to_bytes/from_bytes протокола 4/4.py
+
+Входные данные - постоянные корпуса нескольких размеров: русская проза
+(ru), смесь латиницы и кириллицы (mixed) и случайные байты с постоянным
+зерном (noise). Для каждого случая выводятся наносекунды на единицу
+входа (символ текста или байт) по лучшему из повторов и пик выделенной
+при одном вызове памяти по tracemalloc.
+
+Результат сравнивается с сохранённым базовым CODEC_BASELINE: время
+масштабируется по калибровочной нагрузке, замеренной при сохранении и
+сейчас, поэтому базовый файл переносим между машинами с точностью до
+десятков процентов. Случай, время которого вышло за допуск, замеряется
+ещё до RETRIES раз вместе с калибровкой, чтобы кратковременная нагрузка
+на машину не считалась регрессией. Программа завершается с кодом 1, если время или
+память какого-либо случая выросли больше допуска.
+
+Пример:
+    python bench/codec_bench.py                      # сравнение с базовым
+    python bench/codec_bench.py --filter codepage --sizes 65536
+    python bench/codec_bench.py --save-baseline      # после намеренных изменений
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, '1'))
+sys.path.insert(0, os.path.join(ROOT, '4'))
+from common import codec, entropy  # noqa: E402
+from encoding_core import CODEPAGES, decode_bytes, encode_text, translate_bytes  # noqa: E402
+from udp_protocol import UDPMessage  # noqa: E402
+from loopback import git_revision, int_list  # noqa: E402
+
+CODEC_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'codec_baseline.json')
+CORPORA = ['ru', 'mixed', 'noise']
+SIZES = [64, 4096, 65536]
+NOISE_SEED = 20240501
+REPEAT = 5
+MIN_TIME = 0.02
+# Допуски: время - доля от ожидаемого, память - доля плюс постоянная часть
+TIME_TOLERANCE = 0.5
+ALLOC_TOLERANCE = 0.1
+ALLOC_SLACK = 1024
+RETRIES = 3
+
+RU_PROSE = (
+    "Поезд пришёл на станцию поздно вечером, когда в окнах вокзала уже горел свет. "
+    "На платформе стояли люди с чемоданами, кто-то искал носильщика, кто-то встречал "
+    "родных. Старый смотритель неторопливо прошёл вдоль вагонов, проверяя буксы, и "
+    "остановился у последнего, где всегда ехали почтовые мешки. Ночь обещала быть "
+    "тихой: ветер стих, а над лесом поднималась жёлтая луна.\n"
+)
+MIXED_TEXT = (
+    "Отчёт за март: сервер build-03 обработал 1250 запросов, среднее время ответа 42 мс. "
+    "Ошибка Connection reset by peer повторялась на узле Gateway West; see ticket NET-17. "
+    "Пакет numpy обновлён до версии 1.26, тесты test_transport и test_codec прошли. "
+    "Next step - проверить конфигурацию Nginx и лимиты ulimit на новых машинах.\n"
+)
+
+
+def make_corpus(name, size):
+    """(текст, байты) корпуса; размер - в символах текста или в байтах для noise"""
+    if name == 'noise':
+        data = random.Random(NOISE_SEED).randbytes(size)
+        # Текстовые функции получают те же байты, прочитанные как cp1251
+        return data.decode('cp1251', errors='replace'), data
+    sample = RU_PROSE if name == 'ru' else MIXED_TEXT
+    text = (sample * (size // len(sample) + 1))[:size]
+    return text, text.encode('utf-8')
+
+
+def _codepage_bytes(corpus, text, data, encoding):
+    return data if corpus == 'noise' else encode_text(text, encoding)
+
+
+def build_cases():
+    """Случаи: имя -> prepare(корпус, текст, байты) -> (функция, аргумент, единиц входа)"""
+    cases = {
+        'codec.encode_text': lambda corpus, text, data: (codec.encode_text, text, len(text)),
+        'codec.decode_text': lambda corpus, text, data: (codec.decode_text, codec.encode_text(text), len(text)),
+        'codec.pack_text': lambda corpus, text, data: (codec.pack_text, text, len(text)),
+        'codec.unpack_text': lambda corpus, text, data: (codec.unpack_text, codec.pack_text(text), len(text)),
+        'entropy.encode': lambda corpus, text, data: (entropy.encode, text, len(text)),
+        'entropy.decode': lambda corpus, text, data: (entropy.decode, entropy.encode(text), len(text)),
+        'udp4.to_bytes': lambda corpus, text, data: (
+            lambda message: message.to_bytes(), UDPMessage(message=data), len(data)),
+        'udp4.from_bytes': lambda corpus, text, data: (
+            UDPMessage.from_bytes, UDPMessage(message=data).to_bytes(), len(data)),
+    }
+    for encoding in CODEPAGES:
+        cases[f'codepage.encode[{encoding}]'] = (
+            lambda corpus, text, data, encoding=encoding: (
+                lambda value: encode_text(value, encoding), text, len(text)))
+        cases[f'codepage.decode[{encoding}]'] = (
+            lambda corpus, text, data, encoding=encoding: (
+                lambda value: decode_bytes(value, encoding),
+                _codepage_bytes(corpus, text, data, encoding), len(text) if corpus != 'noise' else len(data)))
+    # Перевод по кругу: каждая кодовая страница один раз источник и один раз результат
+    for src, dst in zip(CODEPAGES, CODEPAGES[1:] + CODEPAGES[:1]):
+        cases[f'codepage.translate[{src}>{dst}]'] = (
+            lambda corpus, text, data, src=src, dst=dst: (
+                lambda value: translate_bytes(value, src, dst),
+                _codepage_bytes(corpus, text, data, src), len(_codepage_bytes(corpus, text, data, src))))
+    return cases
+
+
+def measure(fn, arg, repeat=REPEAT, min_time=MIN_TIME):
+    """Лучшее время одного вызова в наносекундах"""
+    timer = timeit.Timer(lambda: fn(arg))
+    # Число вызовов подбирается так, чтобы один повтор шёл не меньше min_time
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time * 1.2 / max(elapsed, 1e-9)))
+    return min([elapsed] + timer.repeat(repeat - 1, number)) / number * 1e9
+
+
+def measure_alloc(fn, arg):
+    """Пик памяти, выделенной за один вызов, в байтах"""
+    fn(arg)  # Кэши и таблицы строятся до замера
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn(arg)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return max(0, peak - before)
+
+
+def calibrate(repeat=REPEAT):
+    """Время постоянной нагрузки: мера скорости машины для переноса базового результата"""
+    text = RU_PROSE * 16
+    table = {ord(char): char.upper() for char in set(text)}
+
+    def workload():
+        sum(map(ord, text))
+        text.translate(table).encode('utf-8').decode('utf-8')
+
+    return measure(lambda _: workload(), None, repeat)
+
+
+def run_case(name, prepare, corpus, size, repeat):
+    text, data = make_corpus(corpus, size)
+    fn, arg, units = prepare(corpus, text, data)
+    ns = measure(fn, arg, repeat)
+    alloc = measure_alloc(fn, arg)
+    return {
+        'case': name,
+        'corpus': corpus,
+        'size': size,
+        'units': units,
+        'ns_per_call': ns,
+        'ns_per_char': ns / max(units, 1),
+        'alloc_bytes': alloc,
+        'alloc_per_char': alloc / max(units, 1),
+    }
+
+
+def case_key(result):
+    return f"{result['case']} {result['corpus']} {result['size']}"
+
+
+def format_result(result):
+    return (f"{case_key(result):<48} {result['ns_per_char']:>9.2f} нс/симв "
+            f"{result['ns_per_call'] / 1000:>10.1f} мкс/вызов {result['alloc_per_char']:>7.2f} Б/симв")
+
+
+def check(report, baseline, time_tolerance, alloc_tolerance, remeasure=None):
+    """Сравнение с базовым результатом; возвращает список регрессий
+
+    remeasure(результат) - повторный замер случая, вышедшего за допуск
+    по времени: (результат, калибровка рядом с замером). Засчитывается
+    лучшее отношение ко времени базового результата.
+    """
+    base_calibration = baseline['meta']['calibration_ns']
+    old_results = {case_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        old = old_results.get(case_key(result))
+        if old is None:
+            continue
+        scale = report['meta']['calibration_ns'] / base_calibration
+        ratio = result['ns_per_char'] / (old['ns_per_char'] * scale)
+        for _ in range(RETRIES if remeasure else 0):
+            if ratio <= 1 + time_tolerance:
+                break
+            retry, calibration = remeasure(result)
+            ratio = min(ratio, retry['ns_per_char'] / (old['ns_per_char'] * calibration / base_calibration))
+        line = f"{case_key(result)}: {(ratio - 1) * 100:+.1f}% времени"
+        if ratio > 1 + time_tolerance:
+            regressions.append(f"{line} (допуск {time_tolerance * 100:.0f}%)")
+        if result['alloc_bytes'] > old['alloc_bytes'] * (1 + alloc_tolerance) + ALLOC_SLACK:
+            regressions.append(f"{case_key(result)}: память {old['alloc_bytes']} -> {result['alloc_bytes']} Б")
+    return regressions
+
+
+def name_list(value):
+    return [item for item in value.split(',') if item]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарк кодеков с проверкой регрессий")
+    parser.add_argument('--corpora', type=name_list, default=CORPORA,
+                        help=f"корпуса через запятую: {', '.join(CORPORA)}")
+    parser.add_argument('--sizes', type=int_list, default=SIZES,
+                        help="размеры корпусов в символах (noise - в байтах) через запятую")
+    parser.add_argument('--filter', default='', help="только случаи, в имени которых есть строка")
+    parser.add_argument('--repeat', type=int, default=REPEAT, help="число повторов замера")
+    parser.add_argument('--baseline', default=CODEC_BASELINE, help="файл базового результата")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="записать результат как базовый вместо проверки")
+    parser.add_argument('--tolerance', type=float, default=TIME_TOLERANCE,
+                        help="допустимый рост времени, доля (0.5 - на 50%%)")
+    parser.add_argument('--output', help="файл для результата JSON")
+    args = parser.parse_args(argv)
+
+    for corpus in args.corpora:
+        if corpus not in CORPORA:
+            parser.error(f"неизвестный корпус {corpus}, допустимы: {', '.join(CORPORA)}")
+    cases = {name: prepare for name, prepare in build_cases().items() if args.filter in name}
+    if not cases:
+        parser.error(f"нет случаев с '{args.filter}' в имени")
+
+    calibration = calibrate(args.repeat)
+    results = []
+    for (name, prepare), corpus, size in itertools.product(cases.items(), args.corpora, args.sizes):
+        result = run_case(name, prepare, corpus, size, args.repeat)
+        print(format_result(result), file=sys.stderr)
+        results.append(result)
+
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            # Лучшая из калибровок до и после замеров
+            'calibration_ns': min(calibration, calibrate(args.repeat)),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        if os.path.exists(args.baseline):
+            # Случаи, не входившие в этот прогон, сохраняются из прежнего файла
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+            if previous['meta']['calibration_ns']:
+                scale = report['meta']['calibration_ns'] / previous['meta']['calibration_ns']
+                measured = {case_key(result) for result in results}
+                for result in previous['results']:
+                    if case_key(result) not in measured:
+                        for field in ('ns_per_call', 'ns_per_char'):
+                            result[field] *= scale
+                        report['results'].append(result)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        print(f"Базовый результат записан в {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Нет базового результата {args.baseline}, запустите с --save-baseline", file=sys.stderr)
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    def remeasure(result):
+        calibration = calibrate(args.repeat)
+        retry = run_case(result['case'], cases[result['case']], result['corpus'], result['size'], args.repeat)
+        return retry, min(calibration, calibrate(args.repeat))
+
+    regressions = check(report, baseline, args.tolerance, ALLOC_TOLERANCE, remeasure)
+    if regressions:
+        print("Регрессии относительно базового результата:", file=sys.stderr)
+        for line in regressions:
+            print(f"  {line}", file=sys.stderr)
+        return 1
+    print(f"Регрессий нет ({len(results)} случаев)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
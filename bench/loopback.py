@@ -0,0 +1,441 @@
+"""Нагрузочный прогон транспортов на петлевом интерфейсе
+
+Без интерфейса запускаются получатель и несколько процессов-отправителей
+для каждого транспорта:
+    udp2          - UDP из 2/2.py: строка кодов common.codec, фрагментация
+    udp2-packed   - то же в упакованном формате (байт на символ)
+    tcp3          - TCP из 3/: строка кодов в кадрах common.framing
+    udp4          - протокол 4/4.py, двоичный формат с CRC32
+    udp4-json     - протокол 4/4.py в прежнем формате JSON
+    udp4-reliable - протокол 4/4.py в надёжном режиме (4/reliable.py)
+
+Каждое сообщение несёт номер отправителя, порядковый номер и время
+отправки по time.monotonic_ns, получатель декодирует его так же, как
+соответствующая программа, и считает задержку. Перебираются все
+сочетания размера сообщения, числа отправителей и темпа. Результат -
+JSON с параметрами прогона и для каждого случая сообщений в секунду,
+МБ/с, потерь и процентилей задержки; --compare сравнивает его с
+сохранённым результатом прошлой версии.
+
+Пример:
+    python bench/loopback.py --transports udp2,tcp3,udp4 --sizes 16,1024 --senders 1,4 \\
+        --output results.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import selectors
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, '4'))
+from common.codec import encode_text, decode_text, pack_text, unpack_text, PACKED_HEADER  # noqa: E402
+from common.fragment import MAX_DATAGRAM, Reassembler, fragment, is_fragment  # noqa: E402
+from common.framing import FrameReader, frame  # noqa: E402
+from udp_protocol import JSON_VERSION, VERSION, UDPMessage  # noqa: E402
+from reliable import DATA_HEADER, ReliableEndpoint, is_reliable  # noqa: E402
+from probe import percentile  # noqa: E402
+
+TRANSPORTS = ['udp2', 'udp2-packed', 'tcp3', 'udp4', 'udp4-json', 'udp4-reliable']
+# номер отправителя, порядковый номер, время отправки в наносекундах
+BENCH_HEADER = struct.Struct('!IIQ')
+SOCKET_BUFFER = 4 * 1024 * 1024
+RECV_TIMEOUT = 0.05
+# Получатель завершает работу, если после остановки отправителей
+# ничего не приходило DRAIN_TIME секунд
+DRAIN_TIME = 0.5
+RELIABLE_TIMEOUT = 30.0
+TEXT_SAMPLE = "Съешь же ещё этих мягких французских булок да выпей чаю The quick brown fox "
+
+
+def make_text(size):
+    """Текст из size символов алфавита кодека"""
+    return (TEXT_SAMPLE * (size // len(TEXT_SAMPLE) + 1))[:size]
+
+
+# Кодирование и разбор сообщения каждого транспорта. encode возвращает
+# байты одного сообщения до фрагментации, decode - (заголовок, текст).
+
+def encode_message(transport, header, text):
+    if transport == 'udp2' or transport == 'tcp3':
+        return header + encode_text(text).encode('utf-8')
+    if transport == 'udp2-packed':
+        return header + PACKED_HEADER + pack_text(text)
+    if transport == 'udp4-json':
+        # Сообщение JSON - текст, поэтому заголовок передаётся в hex
+        return UDPMessage(message=(header.hex() + text).encode('utf-8')).to_bytes(JSON_VERSION)
+    return UDPMessage(message=header + text.encode('utf-8')).to_bytes(VERSION)
+
+
+def decode_message(transport, data):
+    if transport == 'udp2' or transport == 'tcp3':
+        return bytes(data[:BENCH_HEADER.size]), decode_text(str(data[BENCH_HEADER.size:], 'utf-8'))
+    if transport == 'udp2-packed':
+        return (bytes(data[:BENCH_HEADER.size]),
+                unpack_text(memoryview(data)[BENCH_HEADER.size + len(PACKED_HEADER):]))
+    msg = UDPMessage.parse(data)
+    if transport == 'udp4-json':
+        text = msg.text()
+        return bytes.fromhex(text[:BENCH_HEADER.size * 2]), text[BENCH_HEADER.size * 2:]
+    return bytes(msg.Message[:BENCH_HEADER.size]), str(msg.Message[BENCH_HEADER.size:], 'utf-8')
+
+
+class Tally:
+    """Учёт принятых сообщений получателем"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.received = 0
+        self.duplicates = 0
+        self.errors = 0
+        self.wire_bytes = 0
+        self.latencies = []
+        self.first = None
+        self.last = None
+        self._seen = set()
+
+    def on_message(self, data):
+        try:
+            header, _ = decode_message(self.transport, data)
+            sender_id, seq, sent_ns = BENCH_HEADER.unpack(header)
+        except Exception:
+            self.errors += 1
+            return
+        now = time.monotonic_ns()
+        if (sender_id, seq) in self._seen:
+            self.duplicates += 1
+            return
+        self._seen.add((sender_id, seq))
+        self.received += 1
+        self.wire_bytes += len(data)
+        self.latencies.append((now - sent_ns) / 1e6)
+        self.first = sent_ns if self.first is None else min(self.first, sent_ns)
+        self.last = now
+
+    def result(self):
+        return {
+            'received': self.received,
+            'duplicates': self.duplicates,
+            'errors': self.errors,
+            'wire_bytes': self.wire_bytes,
+            'latencies': self.latencies,
+            'first': self.first,
+            'last': self.last,
+        }
+
+
+def receive_udp(transport, ports, stop, results):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER)
+    sock.bind(('127.0.0.1', 0))
+    sock.settimeout(RECV_TIMEOUT)
+    reliable = ReliableEndpoint(sock) if transport == 'udp4-reliable' else None
+    reassembler = Reassembler()
+    tally = Tally(transport)
+    buffer = bytearray(max(4096, MAX_DATAGRAM))
+    ports.put(sock.getsockname()[1])
+
+    idle_since = None
+    while True:
+        try:
+            nbytes, addr = sock.recvfrom_into(buffer)
+        except socket.timeout:
+            if reliable:
+                reliable.tick()
+            if stop.is_set():
+                idle_since = idle_since or time.monotonic()
+                if time.monotonic() - idle_since >= DRAIN_TIME:
+                    break
+            continue
+        idle_since = None
+        data = bytes(buffer[:nbytes])
+        if reliable and is_reliable(data):
+            payloads = reliable.on_datagram(data, addr)
+        else:
+            payloads = [data]
+        for payload in payloads:
+            if is_fragment(payload):
+                payload = reassembler.feed(payload, addr)
+                if payload is None:
+                    continue
+            tally.on_message(payload)
+
+    sock.close()
+    results.put(tally.result())
+
+
+def receive_tcp(transport, ports, stop, results):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(socket.SOMAXCONN)
+    listener.setblocking(False)
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ)
+    tally = Tally(transport)
+    ports.put(listener.getsockname()[1])
+
+    idle_since = None
+    while True:
+        events = selector.select(RECV_TIMEOUT)
+        if not events and stop.is_set():
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since >= DRAIN_TIME:
+                break
+            continue
+        idle_since = None
+        for key, _ in events:
+            if key.fileobj is listener:
+                conn, _ = listener.accept()
+                conn.setblocking(False)
+                selector.register(conn, selectors.EVENT_READ, FrameReader())
+                continue
+            data = key.fileobj.recv(64 * 1024)
+            if not data:
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                continue
+            for message in key.data.feed(data):
+                tally.on_message(message)
+
+    for key in list(selector.get_map().values()):
+        key.fileobj.close()
+    results.put(tally.result())
+
+
+def receiver(transport, ports, stop, results):
+    if transport == 'tcp3':
+        receive_tcp(transport, ports, stop, results)
+    else:
+        receive_udp(transport, ports, stop, results)
+
+
+def sender(transport, port, sender_id, count, size, rate, results):
+    """Отправка count сообщений с темпом rate в секунду (0 - без ограничения)"""
+    text = make_text(size)
+    target = ('127.0.0.1', port)
+    if transport == 'tcp3':
+        sock = socket.create_connection(target)
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER)
+
+    reliable = None
+    acks = None
+    if transport == 'udp4-reliable':
+        sock.bind(('127.0.0.1', 0))
+        sock.settimeout(RECV_TIMEOUT)
+        reliable = ReliableEndpoint(sock)
+        acks = threading.Thread(target=_ack_loop, args=(sock, reliable), daemon=True)
+        acks.start()
+
+    started = time.monotonic()
+    sent_bytes = 0
+    for seq in range(count):
+        if rate:
+            delay = started + seq / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        data = encode_message(transport, BENCH_HEADER.pack(sender_id, seq, time.monotonic_ns()), text)
+        sent_bytes += len(data)
+        if transport == 'tcp3':
+            sock.sendall(frame(data))
+        elif reliable:
+            for datagram in fragment(data, MAX_DATAGRAM - DATA_HEADER.size):
+                reliable.send(datagram, target)
+        else:
+            for datagram in fragment(data):
+                sock.sendto(datagram, target)
+    elapsed = time.monotonic() - started
+
+    if reliable:
+        deadline = time.monotonic() + RELIABLE_TIMEOUT
+        while reliable.pending() and time.monotonic() < deadline:
+            time.sleep(RECV_TIMEOUT)
+    sock.close()
+    results.put({'sent': count, 'sent_bytes': sent_bytes, 'send_time': elapsed,
+                 'retransmitted': reliable.stats['retransmitted'] if reliable else 0})
+
+
+def _ack_loop(sock, reliable):
+    """Приём подтверждений и повторы по таймеру для надёжного режима"""
+    try:
+        while True:
+            try:
+                data, addr = sock.recvfrom(4096)
+                reliable.on_datagram(data, addr)
+            except socket.timeout:
+                pass
+            reliable.tick()
+    except OSError:
+        # Сокет закрыт отправителем
+        return
+
+
+def run_case(transport, size, senders, rate, count):
+    """Один прогон: получатель и senders отправителей по count сообщений"""
+    ports = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    receiver_process = multiprocessing.Process(target=receiver, args=(transport, ports, stop, results))
+    receiver_process.start()
+    port = ports.get()
+
+    sender_results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=sender,
+                                args=(transport, port, sender_id, count, size, rate, sender_results))
+        for sender_id in range(senders)
+    ]
+    for process in processes:
+        process.start()
+    sent = [sender_results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    stop.set()
+    received = results.get()
+    receiver_process.join()
+
+    total_sent = sum(item['sent'] for item in sent)
+    latencies = sorted(received['latencies'])
+    duration = ((received['last'] - received['first']) / 1e9) if received['received'] else 0.0
+    return {
+        'transport': transport,
+        'size': size,
+        'senders': senders,
+        'rate': rate,
+        'sent': total_sent,
+        'received': received['received'],
+        'duplicates': received['duplicates'],
+        'errors': received['errors'],
+        'retransmitted': sum(item['retransmitted'] for item in sent),
+        'loss': (total_sent - received['received']) / total_sent if total_sent else 0.0,
+        'duration': duration,
+        'msgs_per_sec': received['received'] / duration if duration else 0.0,
+        'mb_per_sec': received['wire_bytes'] / duration / (1024 * 1024) if duration else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50),
+            'p90': percentile(latencies, 0.90),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else None,
+        },
+    }
+
+
+def case_key(result):
+    return (result['transport'], result['size'], result['senders'], result['rate'])
+
+
+def compare(results, baseline_path):
+    """Изменение скорости и p99 задержки относительно прошлого результата"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {case_key(result): result for result in json.load(f)['results']}
+    for result in results:
+        old = baseline.get(case_key(result))
+        if old is None:
+            print(f"{format_case(result)}: нет в {baseline_path}", file=sys.stderr)
+            continue
+        speed = _change(result['msgs_per_sec'], old['msgs_per_sec'])
+        p99 = _change(result['latency_ms']['p99'], old['latency_ms']['p99'])
+        print(f"{format_case(result)}: сообщений/с {speed}, p99 {p99}, "
+              f"потери {old['loss'] * 100:.2f}% -> {result['loss'] * 100:.2f}%", file=sys.stderr)
+
+
+def _change(new, old):
+    if not old or new is None:
+        return "н/д"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def format_case(result):
+    return (f"{result['transport']} размер={result['size']} отправителей={result['senders']} "
+            f"темп={result['rate'] or 'макс'}")
+
+
+def format_result(result):
+    latency = result['latency_ms']
+    p50 = f"{latency['p50']:.3f}" if latency['p50'] is not None else "н/д"
+    p99 = f"{latency['p99']:.3f}" if latency['p99'] is not None else "н/д"
+    return (f"{format_case(result)}: {result['msgs_per_sec']:.0f} сообщений/с, "
+            f"{result['mb_per_sec']:.2f} МБ/с, потери {result['loss'] * 100:.2f}%, "
+            f"задержка p50 {p50} мс, p99 {p99} мс")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',') if item]
+
+
+def transport_list(value):
+    names = [item for item in value.split(',') if item]
+    for name in names:
+        if name not in TRANSPORTS:
+            raise argparse.ArgumentTypeError(
+                f"неизвестный транспорт {name}, допустимы: {', '.join(TRANSPORTS)}")
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон транспортов на петлевом интерфейсе")
+    parser.add_argument('--transports', type=transport_list, default=['udp2', 'tcp3', 'udp4'],
+                        help=f"транспорты через запятую: {', '.join(TRANSPORTS)}")
+    parser.add_argument('--sizes', type=int_list, default=[16, 256, 4096],
+                        help="размеры сообщений в символах через запятую")
+    parser.add_argument('--senders', type=int_list, default=[1, 4],
+                        help="числа процессов-отправителей через запятую")
+    parser.add_argument('--rates', type=int_list, default=[0],
+                        help="темп одного отправителя, сообщений в секунду (0 - без ограничения)")
+    parser.add_argument('--count', type=int, default=2000, help="сообщений на одного отправителя")
+    parser.add_argument('--output', help="файл для результата JSON (по умолчанию вывод в stdout)")
+    parser.add_argument('--compare', help="результат прошлого прогона для сравнения")
+    args = parser.parse_args(argv)
+
+    results = []
+    for transport, size, senders, rate in itertools.product(args.transports, args.sizes,
+                                                           args.senders, args.rates):
+        result = run_case(transport, size, senders, rate, args.count)
+        print(format_result(result), file=sys.stderr)
+        results.append(result)
+
+    report = {
+        'meta': {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'count': args.count,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(report, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
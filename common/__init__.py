@@ -0,0 +1 @@
+"""Общие модули для программ из каталогов 2/, 3/ и 4/"""
@@ -0,0 +1,140 @@
+"""Табличный кодек 8-битного алфавита (русский и английский)
+
+Таблицы символ -> код и код -> символ строятся один раз при импорте,
+после чего строка кодируется и декодируется целиком, без цепочки
+if/elif на каждый символ. Результат совпадает с прежними функциями
+encode_text/decode_text побайтно.
+"""
+
+SPACE_CODE = '00000000'
+
+
+def _build_encode_table():
+    """Таблица ord(символ) -> 'код ' для str.translate"""
+    table = {}
+    for prefix, first, count in (('0', 'a', 26), ('1', 'A', 26),
+                                 ('2', 'а', 32), ('3', 'А', 32)):
+        for i in range(count):
+            table[ord(first) + i] = f'{prefix}{i:07b} '
+    table[ord('ё')] = '21100101 '
+    table[ord('Ё')] = '31100101 '
+    table[ord(' ')] = SPACE_CODE + ' '
+    return table
+
+
+def _decode_code(code):
+    """Декодирование одного кода (логика прежней decode_text)"""
+    if len(code) != 8:
+        return ' '
+
+    prefix = code[0]
+    char_code = int(code[1:], 2)
+
+    if code == SPACE_CODE:
+        return ' '
+    elif prefix == '0':  # Английская строчная
+        return chr(char_code + ord('a'))
+    elif prefix == '1':  # Английская заглавная
+        return chr(char_code + ord('A')).upper()
+    elif prefix == '2':  # Русская строчная
+        if code == '21100101':  # Специальный код для 'ё'
+            return 'ё'
+        return chr(char_code + ord('а'))
+    elif prefix == '3':  # Русская заглавная
+        if code == '31100101':  # Специальный код для 'Ё'
+            return 'Ё'
+        return chr(char_code + ord('А')).upper()
+    return ' '
+
+
+def _build_decode_table():
+    """Таблица всех корректных 8-битных кодов с префиксами 0-3"""
+    table = {}
+    for prefix in '0123':
+        for i in range(128):
+            code = f'{prefix}{i:07b}'
+            table[code] = _decode_code(code)
+    return table
+
+
+class _EncodeTable(dict):
+    """Символы вне алфавита кодируются как пробел"""
+
+    def __missing__(self, key):
+        return SPACE_CODE + ' '
+
+
+ENCODE_TABLE = _EncodeTable(_build_encode_table())
+DECODE_TABLE = _build_decode_table()
+
+
+def encode_text(text):
+    """Кодирование текста с поддержкой русского и английского алфавитов"""
+    return text.translate(ENCODE_TABLE)[:-1]
+
+
+def decode_text(binary_str):
+    """Декодирование бинарной строки с поддержкой русского и английского алфавитов"""
+    codes = binary_str.split()
+    try:
+        return ''.join(map(DECODE_TABLE.__getitem__, codes))
+    except KeyError:
+        # Нестандартные коды (другая длина, префикс 4-9 и т.п.)
+        # разбираем по одному, как раньше
+        return ''.join([DECODE_TABLE.get(code) or _decode_code(code) for code in codes])
+
+
+# Упакованный формат: один код алфавита - один байт.
+# Старшие 2 бита - префикс кода (0-3), младшие 6 - номер буквы;
+# номер 32 зарезервирован под 'ё'/'Ё' (7-битный код 1100101).
+PACKED_MAGIC = b'\xb1'
+PACKED_VERSION = 1
+PACKED_HEADER = PACKED_MAGIC + bytes([PACKED_VERSION])
+_YO_VALUE = 0b1100101
+_YO_SLOT = 32
+
+
+def _code_to_byte(code):
+    value = int(code[1:], 2)
+    if value == _YO_VALUE:
+        value = _YO_SLOT
+    return int(code[0]) << 6 | value
+
+
+def _byte_to_code(byte):
+    value = byte & 0x3f
+    if value == _YO_SLOT:
+        value = _YO_VALUE
+    return f'{byte >> 6}{value:07b}'
+
+
+class _PackTable(dict):
+    """Символы вне алфавита упаковываются как пробел"""
+
+    def __missing__(self, key):
+        return '\x00'
+
+
+PACK_TABLE = _PackTable({key: chr(_code_to_byte(code[:-1])) for key, code in ENCODE_TABLE.items()})
+UNPACK_TABLE = {byte: DECODE_TABLE[_byte_to_code(byte)] for byte in range(256)}
+UNPACK_CODES_TABLE = {byte: _byte_to_code(byte) + ' ' for byte in range(256)}
+
+
+def pack_text(text):
+    """Кодирование текста в упакованный формат (байт на символ)"""
+    return text.translate(PACK_TABLE).encode('latin-1')
+
+
+def unpack_text(data):
+    """Декодирование упакованных байтов в текст"""
+    return bytes(data).decode('latin-1').translate(UNPACK_TABLE)
+
+
+def unpack_codes(data):
+    """Перевод упакованных байтов в строку кодов, как у encode_text"""
+    return bytes(data).decode('latin-1').translate(UNPACK_CODES_TABLE)[:-1]
+
+
+def is_packed(data):
+    """Проверка, что датаграмма отправлена в упакованном формате"""
+    return data[:1] == PACKED_MAGIC
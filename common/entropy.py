@@ -0,0 +1,285 @@
+"""Энтропийное кодирование текста каноническими кодами Хаффмана
+
+Частые буквы получают короткие коды, редкие - длинные; биты пишутся
+подряд, без выравнивания по байтам. Алфавит ALPHABET - пробел, русские
+и английские буквы, цифры и основная пунктуация. Любой другой символ
+не теряется: он передаётся кодом ESCAPE и следом 21 битом своего
+номера в Unicode.
+
+Статическая таблица строится по частотам букв русского и английского
+текста (DEFAULT_WEIGHTS) и известна обеим сторонам. Адаптивная таблица
+строится по самому сообщению или по всем сообщениям сеанса
+(SessionEncoder) и передаётся в заголовке длинами кодов по 4 бита на
+символ; выбирается та, с которой сообщение короче.
+
+Формат: ENTROPY_MAGIC, байт флагов (бит 0 - таблица в сообщении,
+биты 1-3 - число битов дополнения в последнем байте), таблица длин
+при флаге и биты кодов.
+"""
+import heapq
+from collections import Counter
+
+ENTROPY_MAGIC = 0xb7
+FLAG_TABLE = 0x01
+MAX_CODE_LENGTH = 12
+ESCAPE_BITS = 21
+
+_RUSSIAN = dict(zip('оеаинтсрвлкмдпуяыьгзбчйхжшюцщэфъё', (
+    10.97, 8.45, 8.01, 7.35, 6.70, 6.26, 5.47, 4.73, 4.54, 4.40, 3.49, 3.21, 2.98, 2.81, 2.62, 2.01,
+    1.90, 1.74, 1.70, 1.65, 1.59, 1.44, 1.21, 0.97, 0.94, 0.73, 0.64, 0.48, 0.36, 0.32, 0.26, 0.04,
+    0.04)))
+_ENGLISH = dict(zip('etaoinshrdlcumwfgypbvkjxqz', (
+    12.70, 9.06, 8.17, 7.51, 6.97, 6.75, 6.33, 6.09, 5.99, 4.25, 4.03, 2.78, 2.76, 2.41, 2.36, 2.23,
+    2.02, 1.97, 1.93, 1.29, 0.98, 0.77, 0.15, 0.15, 0.10, 0.07)))
+_PUNCTUATION = {'.': 1.0, ',': 1.2, '-': 0.3, '!': 0.1, '?': 0.1, ':': 0.1, ';': 0.05,
+                '"': 0.1, "'": 0.05, '(': 0.05, ')': 0.05, '\n': 0.3}
+# Английский текст реже русского, заглавные реже строчных
+ENGLISH_SHARE = 0.3
+UPPER_SHARE = 0.05
+
+
+def _default_weights():
+    weights = {' ': 15.0}
+    for letters, share in ((_RUSSIAN, 1.0), (_ENGLISH, ENGLISH_SHARE)):
+        for char, weight in letters.items():
+            weights[char] = weight * share
+            weights[char.upper()] = weight * share * UPPER_SHARE
+    for digit in '0123456789':
+        weights[digit] = 0.2
+    weights.update(_PUNCTUATION)
+    return weights
+
+
+DEFAULT_WEIGHTS = _default_weights()
+ALPHABET = ''.join(DEFAULT_WEIGHTS)
+ESCAPE = len(ALPHABET)
+SYMBOL_COUNT = len(ALPHABET) + 1
+ESCAPE_WEIGHT = 0.05
+_INDEX = {char: index for index, char in enumerate(ALPHABET)}
+_BYTE_BITS = [f'{byte:08b}' for byte in range(256)]
+
+
+def _code_lengths(weights):
+    """Длины кодов Хаффмана для целых весов; 0 - символа нет в таблице"""
+    present = [(weight, symbol) for symbol, weight in enumerate(weights) if weight]
+    lengths = [0] * len(weights)
+    if len(present) == 1:
+        lengths[present[0][1]] = 1
+        return lengths
+
+    # В куче - (вес, порядковый номер, символы поддерева)
+    heap = [(weight, symbol, [symbol]) for weight, symbol in present]
+    heapq.heapify(heap)
+    order = len(weights)
+    while len(heap) > 1:
+        weight1, _, symbols1 = heapq.heappop(heap)
+        weight2, _, symbols2 = heapq.heappop(heap)
+        for symbol in symbols1 + symbols2:
+            lengths[symbol] += 1
+        heapq.heappush(heap, (weight1 + weight2, order, symbols1 + symbols2))
+        order += 1
+    return lengths
+
+
+class _EncodeTable(dict):
+    """Символы без своего кода передаются через ESCAPE"""
+
+    def __init__(self, codes, escape):
+        super().__init__(codes)
+        self.escape = escape
+
+    def __missing__(self, key):
+        return f'{self.escape}{key:0{ESCAPE_BITS}b}'
+
+
+class HuffmanTable:
+    """Канонический код: определяется одними длинами кодов символов"""
+
+    def __init__(self, lengths):
+        if len(lengths) != SYMBOL_COUNT or not lengths[ESCAPE]:
+            raise ValueError("Таблица должна содержать все символы алфавита и ESCAPE")
+        self.lengths = list(lengths)
+        self.max_length = max(self.lengths)
+        # Неравенство Крафта: иначе длины не задают префиксный код
+        if sum(1 << (self.max_length - length) for length in self.lengths if length) > 1 << self.max_length:
+            raise ValueError("Длины кодов не образуют префиксный код")
+        self.codes = {}
+        code = 0
+        previous = 0
+        for length, symbol in sorted((length, symbol) for symbol, length in enumerate(self.lengths)
+                                     if length):
+            code <<= length - previous
+            self.codes[symbol] = f'{code:0{length}b}'
+            code += 1
+            previous = length
+
+        escape = self.codes[ESCAPE]
+        self._encode = _EncodeTable({ord(ALPHABET[symbol]): code for symbol, code in self.codes.items()
+                                     if symbol != ESCAPE}, escape)
+        self._decode = None
+
+    @classmethod
+    def from_weights(cls, weights, max_length=MAX_CODE_LENGTH):
+        """Таблица по весам символов (словарь символ -> вес)
+
+        Если самый длинный код длиннее max_length, веса сглаживаются,
+        пока коды не уложатся в ограничение.
+        """
+        scaled = [0] * SYMBOL_COUNT
+        total = sum(weights.values()) or 1
+        for char, weight in weights.items():
+            if char in _INDEX and weight > 0:
+                scaled[_INDEX[char]] = max(1, int(weight / total * 1e6))
+        scaled[ESCAPE] = max(1, int(weights.get(None, ESCAPE_WEIGHT) / total * 1e6))
+
+        lengths = _code_lengths(scaled)
+        while max(lengths) > max_length:
+            scaled = [weight // 2 + 1 if weight else 0 for weight in scaled]
+            lengths = _code_lengths(scaled)
+        return cls(lengths)
+
+    @classmethod
+    def from_text(cls, text):
+        """Таблица по частотам символов текста"""
+        counts = Counter(char for char in text if char in _INDEX)
+        counts[None] = sum(1 for char in text if char not in _INDEX) + 1
+        return cls.from_weights(counts)
+
+    def to_bytes(self):
+        """Длины кодов по 4 бита на символ"""
+        lengths = self.lengths + [0] * (len(self.lengths) % 2)
+        return bytes(lengths[i] << 4 | lengths[i + 1] for i in range(0, len(lengths), 2))
+
+    @classmethod
+    def from_bytes(cls, data):
+        lengths = []
+        for byte in data[:TABLE_SIZE]:
+            lengths += (byte >> 4, byte & 0x0f)
+        return cls(lengths[:SYMBOL_COUNT])
+
+    def encode_bits(self, text):
+        """Текст в строку из '0' и '1'"""
+        return text.translate(self._encode)
+
+    def _decode_table(self):
+        """Таблица: первые max_length битов -> (символ, длина кода)"""
+        if self._decode is None:
+            table = {}
+            for symbol, code in self.codes.items():
+                free = self.max_length - len(code)
+                for suffix in range(1 << free):
+                    table[code + (f'{suffix:0{free}b}' if free else '')] = (symbol, len(code))
+            self._decode = table
+        return self._decode
+
+    def decode_bits(self, bits):
+        table = self._decode_table()
+        width = self.max_length
+        padded = bits + '0' * width
+        result = []
+        position = 0
+        try:
+            while position < len(bits):
+                symbol, length = table[padded[position:position + width]]
+                position += length
+                if symbol == ESCAPE:
+                    result.append(chr(int(bits[position:position + ESCAPE_BITS], 2)))
+                    position += ESCAPE_BITS
+                else:
+                    result.append(ALPHABET[symbol])
+        except (KeyError, ValueError):
+            raise ValueError("Повреждённые данные энтропийного кода") from None
+        if position != len(bits):
+            raise ValueError("Повреждённые данные энтропийного кода")
+        return ''.join(result)
+
+
+TABLE_SIZE = (SYMBOL_COUNT + 1) // 2
+DEFAULT_TABLE = HuffmanTable.from_weights(DEFAULT_WEIGHTS)
+
+
+def _pack(bits, table=None):
+    padding = -len(bits) % 8
+    flags = padding << 1 | (FLAG_TABLE if table else 0)
+    bits += '0' * padding
+    payload = int(bits, 2).to_bytes(len(bits) // 8, 'big') if bits else b''
+    return bytes([ENTROPY_MAGIC, flags]) + (table.to_bytes() if table else b'') + payload
+
+
+def encode(text, adaptive=False):
+    """Кодирование текста; adaptive=True - своя таблица, если так короче"""
+    bits = DEFAULT_TABLE.encode_bits(text)
+    if adaptive:
+        table = HuffmanTable.from_text(text)
+        own = table.encode_bits(text)
+        if len(own) + TABLE_SIZE * 8 < len(bits):
+            return _pack(own, table)
+    return _pack(bits)
+
+
+def _split(data):
+    """(таблица, строка битов) сообщения"""
+    data = bytes(data)
+    if len(data) < 2 or data[0] != ENTROPY_MAGIC:
+        raise ValueError("Сообщение не в энтропийном формате")
+    flags = data[1]
+    offset = 2
+    table = DEFAULT_TABLE
+    if flags & FLAG_TABLE:
+        if len(data) < offset + TABLE_SIZE:
+            raise ValueError("Сообщение короче таблицы кодов")
+        table = HuffmanTable.from_bytes(data[offset:offset + TABLE_SIZE])
+        offset += TABLE_SIZE
+    bits = ''.join(map(_BYTE_BITS.__getitem__, data[offset:]))
+    padding = flags >> 1 & 0x07
+    return table, bits[:len(bits) - padding]
+
+
+def decode(data):
+    """Декодирование сообщения в текст; ValueError при повреждении"""
+    table, bits = _split(data)
+    return table.decode_bits(bits)
+
+
+def entropy_bits(data):
+    """Биты кодов сообщения - для вывода вместо строки кодов алфавита"""
+    return _split(data)[1]
+
+
+def is_entropy(data):
+    """Проверка, что сообщение закодировано энтропийным кодом"""
+    return data[:1] == bytes([ENTROPY_MAGIC])
+
+
+class SessionEncoder:
+    """Кодирование сообщений сеанса таблицей по всем его сообщениям
+
+    Таблица сеанса передаётся в каждом сообщении, где она выгоднее
+    статической, поэтому получателю не нужно хранить состояние и
+    потеря сообщения не нарушает декодирование следующих.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.escapes = 1
+        self._table = None
+
+    def encode(self, text):
+        self.counts.update(char for char in text if char in _INDEX)
+        self.escapes += sum(1 for char in text if char not in _INDEX)
+        self._table = None
+
+        bits = DEFAULT_TABLE.encode_bits(text)
+        table = self.table
+        own = table.encode_bits(text)
+        if len(own) + TABLE_SIZE * 8 < len(bits):
+            return _pack(own, table)
+        return _pack(bits)
+
+    @property
+    def table(self):
+        if self._table is None:
+            weights = dict(self.counts)
+            weights[None] = self.escapes
+            self._table = HuffmanTable.from_weights(weights)
+        return self._table
@@ -0,0 +1,141 @@
+"""Фрагментация больших сообщений для UDP
+
+Сообщение длиннее одной датаграммы режется на фрагменты с заголовком
+FRAGMENT_HEADER: метка, номер сообщения, номер и число фрагментов,
+полная длина и смещение фрагмента. Получатель собирает сообщение в
+заранее выделенный буфер полной длины. Незавершённые сообщения
+удаляются по таймауту и при превышении общего лимита памяти.
+"""
+import itertools
+import os
+import struct
+import time
+from collections import OrderedDict
+
+FRAGMENT_MAGIC = 0xb6
+# метка, номер сообщения, номер фрагмента, число фрагментов, длина, смещение
+FRAGMENT_HEADER = struct.Struct('!BIHHII')
+
+# Ethernet MTU 1500 минус заголовки IPv4 (20) и UDP (8)
+MTU = 1500
+MAX_DATAGRAM = MTU - 20 - 8
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+REASSEMBLY_TIMEOUT = 5.0
+REASSEMBLY_MEMORY = 64 * 1024 * 1024
+
+_message_ids = itertools.count(int.from_bytes(os.urandom(4), 'big'))
+
+
+def is_fragment(data):
+    """Проверка, что датаграмма - фрагмент сообщения"""
+    return data[:1] == bytes([FRAGMENT_MAGIC])
+
+
+def fragment(payload, max_datagram=MAX_DATAGRAM):
+    """Разбиение сообщения на датаграммы не длиннее max_datagram
+
+    Короткое сообщение возвращается как есть, одной датаграммой.
+    """
+    if len(payload) <= max_datagram:
+        return [payload]
+    if len(payload) > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Сообщение длиннее {MAX_MESSAGE_SIZE} байт")
+
+    chunk = max_datagram - FRAGMENT_HEADER.size
+    count = (len(payload) + chunk - 1) // chunk
+    message_id = next(_message_ids) & 0xffffffff
+    view = memoryview(payload)
+    return [
+        FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, message_id, index, count, len(payload), offset)
+        + view[offset:offset + chunk]
+        for index, offset in enumerate(range(0, len(payload), chunk))
+    ]
+
+
+class _Partial:
+    __slots__ = ('buffer', 'received', 'remaining', 'created')
+
+    def __init__(self, total, count, now):
+        self.buffer = bytearray(total)
+        self.received = bytearray(count)
+        self.remaining = count
+        self.created = now
+
+
+class Reassembler:
+    """Сборка сообщений из фрагментов от разных отправителей"""
+
+    def __init__(self, timeout=REASSEMBLY_TIMEOUT, max_memory=REASSEMBLY_MEMORY,
+                 max_message_size=MAX_MESSAGE_SIZE):
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.max_message_size = max_message_size
+        self.memory = 0
+        self.stats = {'completed': 0, 'expired': 0, 'evicted': 0, 'malformed': 0, 'duplicates': 0}
+        self._partials = OrderedDict()
+
+    @property
+    def pending(self):
+        """Число незавершённых сообщений"""
+        return len(self._partials)
+
+    def feed(self, data, addr):
+        """Приём фрагмента; возвращает собранное сообщение или None"""
+        now = time.monotonic()
+        self.expire(now)
+
+        if len(data) < FRAGMENT_HEADER.size:
+            self.stats['malformed'] += 1
+            return None
+        _, message_id, index, count, total, offset = FRAGMENT_HEADER.unpack_from(data)
+        chunk = memoryview(data)[FRAGMENT_HEADER.size:]
+        if (index >= count or total > self.max_message_size
+                or offset + len(chunk) > total):
+            self.stats['malformed'] += 1
+            return None
+
+        key = (addr, message_id)
+        partial = self._partials.get(key)
+        if partial is None:
+            if total > self.max_memory:
+                self.stats['malformed'] += 1
+                return None
+            self._make_room(total)
+            partial = self._partials[key] = _Partial(total, count, now)
+            self.memory += total
+        elif len(partial.buffer) != total or len(partial.received) != count:
+            self.stats['malformed'] += 1
+            return None
+
+        if partial.received[index]:
+            self.stats['duplicates'] += 1
+            return None
+        partial.buffer[offset:offset + len(chunk)] = chunk
+        partial.received[index] = 1
+        partial.remaining -= 1
+        if partial.remaining:
+            return None
+
+        del self._partials[key]
+        self.memory -= total
+        self.stats['completed'] += 1
+        return partial.buffer
+
+    def _make_room(self, size):
+        """Вытеснение самых старых незавершённых сообщений"""
+        while self._partials and self.memory + size > self.max_memory:
+            _, partial = self._partials.popitem(last=False)
+            self.memory -= len(partial.buffer)
+            self.stats['evicted'] += 1
+
+    def expire(self, now=None):
+        """Удаление сообщений, не собранных за timeout секунд"""
+        if now is None:
+            now = time.monotonic()
+        while self._partials:
+            key, partial = next(iter(self._partials.items()))
+            if now - partial.created < self.timeout:
+                break
+            del self._partials[key]
+            self.memory -= len(partial.buffer)
+            self.stats['expired'] += 1
@@ -0,0 +1,67 @@
+"""Кадрирование сообщений поверх TCP
+
+Каждое сообщение передаётся кадром: байт FRAME_MAGIC, длина в 4 байтах
+(сетевой порядок) и само сообщение. TCP может склеивать и разрезать
+отправленные данные, кадры позволяют восстановить границы сообщений.
+"""
+import struct
+
+FRAME_MAGIC = 0xb2
+FRAME_HEADER = struct.Struct('!BI')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+class FramingError(ValueError):
+    """Поток не соответствует формату кадров"""
+
+
+def frame(payload):
+    """Упаковка сообщения в кадр"""
+    if len(payload) > MAX_FRAME_SIZE:
+        raise FramingError(f"Сообщение длиннее {MAX_FRAME_SIZE} байт")
+    return FRAME_HEADER.pack(FRAME_MAGIC, len(payload)) + payload
+
+
+class FrameReader:
+    """Буферизованный разбор потока на сообщения
+
+    feed() принимает очередной фрагмент из recv() и возвращает список
+    всех сообщений, завершённых этим фрагментом. Если поток начинается
+    не с FRAME_MAGIC, клиент считается старым: каждый фрагмент
+    возвращается как отдельное сообщение, как было раньше.
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self.framed = None
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        if self.framed is None and data:
+            self.framed = data[0] == FRAME_MAGIC
+        if not self.framed:
+            return [bytes(data)] if data else []
+
+        buffer = self._buffer
+        buffer += data
+        messages = []
+        offset = 0
+        while len(buffer) - offset >= FRAME_HEADER.size:
+            magic, length = FRAME_HEADER.unpack_from(buffer, offset)
+            if magic != FRAME_MAGIC:
+                raise FramingError(f"Неверный заголовок кадра на смещении {offset}")
+            if length > self.max_frame_size:
+                raise FramingError(f"Кадр длиной {length} байт превышает предел")
+            end = offset + FRAME_HEADER.size + length
+            if len(buffer) < end:
+                break
+            messages.append(bytes(buffer[offset + FRAME_HEADER.size:end]))
+            offset = end
+        # Разобранные кадры удаляются одним срезом
+        del buffer[:offset]
+        return messages
+
+    @property
+    def pending(self):
+        """Число байт незавершённого кадра в буфере"""
+        return len(self._buffer)
@@ -0,0 +1,164 @@
+"""Запись журнала одним потоком-писателем
+
+Строки кладутся в ограниченную очередь, отдельный поток забирает их
+пачками и пишет в постоянно открытый файл. Сброс на диск происходит
+при накоплении batch_size строк или по истечении flush_interval секунд.
+Пачка, которую не удалось записать (диск заполнен, ошибка ввода-вывода),
+отбрасывается и учитывается в stats(), а поток продолжает разбирать
+очередь, чтобы производители не зависли на полной очереди.
+"""
+import os
+import queue
+import sys
+import threading
+import time
+
+from common.metrics import REGISTRY
+
+_STOP = object()
+# Период проверки, жив ли писатель, пока очередь полна
+_PUT_TIMEOUT = 0.5
+_write_time = REGISTRY.histogram('log_write_seconds', "Время записи пачки строк журнала")
+
+
+class LogSink:
+    """Очередь строк журнала с единственным писателем
+
+    fsync_interval: None - не вызывать fsync, 0 - после каждой пачки,
+    больше нуля - не чаще чем раз в указанное число секунд.
+    """
+
+    def __init__(self, path, max_queue=10000, batch_size=256, flush_interval=0.2,
+                 fsync_interval=None, encoding='utf-8'):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.encoding = encoding
+        self.lines_written = 0
+        self.batches_written = 0
+        self.max_depth = 0
+        self.errors = 0
+        self.lines_dropped = 0
+        self.lines_rejected = 0
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="LogSink", daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self):
+        """Текущее число строк в очереди"""
+        return self._queue.qsize()
+
+    def _put(self, item):
+        while True:
+            if not self._thread.is_alive():
+                raise RuntimeError(f"Поток записи журнала {self.path} остановлен: {self.last_error}")
+            try:
+                self._queue.put(item, timeout=_PUT_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, line):
+        """Постановка строки в очередь; при переполнении ждёт писателя
+
+        Если поток записи остановлен, вызывает RuntimeError.
+        """
+        self._put(line)
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def write_nowait(self, line):
+        """Постановка строки без ожидания, для цикла событий
+
+        При полной очереди строка отбрасывается и учитывается в
+        stats()['rejected']; возвращает, принята ли строка.
+        """
+        try:
+            self._queue.put_nowait(line)
+        except queue.Full:
+            self.lines_rejected += 1
+            return False
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def close(self):
+        """Запись оставшихся строк и остановка потока"""
+        try:
+            self._put(_STOP)
+        except RuntimeError:
+            return
+        self._thread.join()
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'lines': self.lines_written,
+            'batches': self.batches_written,
+            'errors': self.errors,
+            'dropped': self.lines_dropped,
+            'rejected': self.lines_rejected,
+        }
+
+    def _failed(self, error, lines):
+        self.errors += 1
+        self.lines_dropped += lines
+        if self.last_error is None:
+            print(f"Ошибка записи журнала {self.path}: {error}", file=sys.stderr)
+        self.last_error = error
+
+    def _run(self):
+        try:
+            f = open(self.path, 'a', encoding=self.encoding)
+        except OSError as e:
+            self._failed(e, 0)
+            return
+        last_fsync = time.monotonic()
+        try:
+            batch = []
+            deadline = None
+            stopping = False
+            while not stopping:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                try:
+                    line = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    line = None
+
+                if line is _STOP:
+                    stopping = True
+                elif line is not None:
+                    batch.append(line)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+
+                if batch and (stopping or len(batch) >= self.batch_size
+                              or time.monotonic() >= deadline):
+                    try:
+                        with _write_time.time():
+                            f.write(''.join(batch))
+                            f.flush()
+                        self.lines_written += len(batch)
+                        self.batches_written += 1
+
+                        now = time.monotonic()
+                        if self.fsync_interval is not None and (
+                                stopping or now - last_fsync >= self.fsync_interval):
+                            os.fsync(f.fileno())
+                            last_fsync = now
+                    except OSError as e:
+                        self._failed(e, len(batch))
+                    batch = []
+                    deadline = None
+        finally:
+            try:
+                f.close()
+            except OSError as e:
+                # Остаток буфера, который не удалось дописать при закрытии
+                self._failed(e, 0)
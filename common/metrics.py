@@ -0,0 +1,317 @@
+"""Счётчики и гистограммы работы процесса
+
+Реестр MetricsRegistry хранит именованные счётчики, показатели и
+гистограммы. Запись в горячем пути - одно сложение под блокировкой
+(гистограмма добавляет поиск корзины), значения же, которые программа и
+так ведёт сама (длина очереди, счётчики приёма), передаются функцией и
+читаются только при снятии. Снимок отдаётся по HTTP (/metrics в
+текстовом формате Prometheus и /metrics.json) и/или периодически
+переписывается в файл JSON.
+
+Модули пишут в общий реестр REGISTRY. Экспорт включается вызовом
+start_exporter(); порт и файл по умолчанию берутся из переменных
+окружения METRICS_PORT и METRICS_FILE.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограмм времени: от 1 мкс до ~8 с с шагом x2
+TIME_BUCKETS = tuple(1e-6 * 2 ** i for i in range(24))
+STATS_INTERVAL = 1.0
+
+
+class Counter:
+    """Монотонно растущий счётчик"""
+
+    def __init__(self, name, description='', fn=None):
+        self.name = name
+        self.description = description
+        self.fn = fn
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self.fn() if self.fn else self._value
+
+
+class Gauge:
+    """Текущее значение: число соединений, длина очереди"""
+
+    def __init__(self, name, description='', fn=None):
+        self.name = name
+        self.description = description
+        self.fn = fn
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    @property
+    def value(self):
+        return self.fn() if self.fn else self._value
+
+
+class Histogram:
+    """Распределение значений по корзинам с фиксированными границами"""
+
+    def __init__(self, name, description='', buckets=TIME_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self):
+        """Контекстный менеджер: длительность блока в секундах"""
+        return _Timer(self)
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        count = sum(counts)
+        return {
+            'count': count,
+            'sum': total,
+            'p50': self._quantile(counts, count, 0.50),
+            'p95': self._quantile(counts, count, 0.95),
+            'p99': self._quantile(counts, count, 0.99),
+            'buckets': counts,
+        }
+
+    def _quantile(self, counts, count, fraction):
+        """Оценка процентиля сверху: граница корзины, в которую он попал"""
+        if not count:
+            return None
+        rank = fraction * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class _Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class MetricsRegistry:
+    """Именованные метрики процесса
+
+    Повторный запрос метрики с тем же именем возвращает уже созданную,
+    поэтому модули могут объявлять метрики независимо друг от друга.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Метрика {name} уже объявлена другого типа")
+            return metric
+
+    def counter(self, name, description='', fn=None):
+        return self._bind(self._get(Counter, name, description, fn), fn)
+
+    def gauge(self, name, description='', fn=None):
+        return self._bind(self._get(Gauge, name, description, fn), fn)
+
+    @staticmethod
+    def _bind(metric, fn):
+        if fn is not None:
+            # Новая функция заменяет прежнюю, например для нового окна
+            metric.fn = fn
+        return metric
+
+    def histogram(self, name, description='', buckets=TIME_BUCKETS):
+        return self._get(Histogram, name, description, buckets)
+
+    def snapshot(self):
+        """Все значения в виде словаря для JSON"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {'time': time.time(), 'uptime': time.time() - self.started,
+                    'counters': {}, 'gauges': {}, 'histograms': {}}
+        for metric in metrics:
+            try:
+                if isinstance(metric, Counter):
+                    snapshot['counters'][metric.name] = metric.value
+                elif isinstance(metric, Gauge):
+                    snapshot['gauges'][metric.name] = metric.value
+                else:
+                    histogram = metric.snapshot()
+                    del histogram['buckets']
+                    snapshot['histograms'][metric.name] = histogram
+            except Exception:
+                # Функция показателя могла сломаться при остановке программы
+                continue
+        return snapshot
+
+    def render_text(self):
+        """Текстовый формат Prometheus"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            try:
+                samples = self._render_samples(metric)
+            except Exception:
+                # Метрика без значения не попадает в вывод целиком, вместе с HELP и TYPE
+                continue
+            if metric.description:
+                lines.append(f"# HELP {metric.name} {metric.description}")
+            lines += samples
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_samples(metric):
+        if isinstance(metric, Histogram):
+            data = metric.snapshot()
+            lines = [f"# TYPE {metric.name} histogram"]
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), data['buckets']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{metric.name}_bucket{{le="{le}"}} {cumulative}')
+            lines.append(f"{metric.name}_sum {data['sum']}")
+            lines.append(f"{metric.name}_count {data['count']}")
+            return lines
+        kind = 'counter' if isinstance(metric, Counter) else 'gauge'
+        return [f"# TYPE {metric.name} {kind}", f"{metric.name} {metric.value}"]
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = self.registry.render_text().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path == '/metrics.json':
+            body = json.dumps(self.registry.snapshot(), ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Запросы снимков не засоряют вывод программы
+        pass
+
+
+class Exporter:
+    """Отдача снимков по HTTP и/или запись в файл в фоновых потоках"""
+
+    def __init__(self, registry=REGISTRY, http_port=None, stats_file=None,
+                 interval=STATS_INTERVAL, host='127.0.0.1'):
+        self.registry = registry
+        self.stats_file = stats_file
+        self.interval = interval
+        self.server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+        if http_port is not None:
+            handler = type('Handler', (_Handler,), {'registry': registry})
+            self.server = ThreadingHTTPServer((host, http_port), handler)
+            self.server.daemon_threads = True
+            self._start(self.server.serve_forever)
+        if stats_file:
+            self._start(self._write_loop)
+
+    @property
+    def port(self):
+        return self.server.server_address[1] if self.server else None
+
+    def _start(self, target):
+        thread = threading.Thread(target=target, name="MetricsExporter", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def write_stats(self):
+        """Атомарная перезапись файла снимка"""
+        temp_path = f"{self.stats_file}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.registry.snapshot(), f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.stats_file)
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write_stats()
+            except OSError:
+                continue
+
+    def close(self):
+        self._stop.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.stats_file:
+            try:
+                self.write_stats()
+            except OSError:
+                pass
+
+
+def start_exporter(http_port=None, stats_file=None, interval=STATS_INTERVAL, registry=REGISTRY):
+    """Запуск экспорта; без параметров берутся METRICS_PORT и METRICS_FILE
+
+    Возвращает Exporter или None, если экспорт не настроен.
+    """
+    if http_port is None and os.environ.get('METRICS_PORT'):
+        http_port = int(os.environ['METRICS_PORT'])
+    if stats_file is None:
+        stats_file = os.environ.get('METRICS_FILE')
+    if http_port is None and not stats_file:
+        return None
+    return Exporter(registry, http_port, stats_file, interval)
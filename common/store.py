@@ -0,0 +1,264 @@
+"""Хранилище сообщений из сегментов только для дописывания
+
+Сообщения дописываются подряд в файлы сегментов segment_NNNNNN.dat,
+при достижении segment_size начинается новый сегмент. Для каждого
+сообщения в index.bin добавляется запись фиксированного размера:
+время, тип (отправлено/получено), номер сегмента, смещение и длины.
+Чтение идёт через mmap, поиск по времени - двоичным поиском по индексу.
+
+Открытое с read_only=True хранилище только читает: файлы не
+восстанавливаются и не обрезаются, поэтому его можно открыть, пока
+процесс-писатель дописывает сообщения.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from common.metrics import REGISTRY
+
+RECEIVED = 0
+SENT = 1
+KIND_NAMES = {RECEIVED: 'receive', SENT: 'send'}
+
+SEGMENT_SIZE = 64 * 1024 * 1024
+INDEX_FILE = 'index.bin'
+# время, тип, сегмент, смещение, длина адреса, длина сообщения
+INDEX_ENTRY = struct.Struct('<dBIQHI')
+
+Record = namedtuple('Record', 'timestamp kind peer payload')
+
+_write_time = REGISTRY.histogram('store_write_seconds', "Время записи пачки сообщений в хранилище")
+
+
+class MessageStore:
+    """Сегментированный журнал сообщений с индексом"""
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, read_only=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._maps = {}
+        self._segment = None
+        if read_only:
+            self._index = open(os.path.join(directory, INDEX_FILE), 'rb')
+            self._load_position()
+            return
+        os.makedirs(directory, exist_ok=True)
+
+        self._index = open(os.path.join(directory, INDEX_FILE), 'a+b')
+        self._recover()
+        self._segment = open(self._segment_path(self._segment_no), 'ab')
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f"segment_{number:06d}.dat")
+
+    def _recover(self):
+        """Восстановление позиции записи после предыдущего запуска
+
+        Неполная запись индекса отбрасывается, хвост сегмента за
+        последним проиндексированным сообщением обрезается, а сегменты
+        после него удаляются: их мог начать сбой сразу после смены сегмента.
+        """
+        whole = self._load_position()
+        if whole != os.fstat(self._index.fileno()).st_size:
+            self._index.truncate(whole)
+
+        path = self._segment_path(self._segment_no)
+        if os.path.exists(path) and os.path.getsize(path) > self._segment_offset:
+            with open(path, 'r+b') as f:
+                f.truncate(self._segment_offset)
+        self._remove_segments_after(self._segment_no)
+
+    def _remove_segments_after(self, number):
+        for name in os.listdir(self.directory):
+            base, ext = os.path.splitext(name)
+            if (ext == '.dat' and base.startswith('segment_') and base[8:].isdigit()
+                    and int(base[8:]) > number):
+                os.remove(os.path.join(self.directory, name))
+
+    def _load_position(self):
+        """Число сообщений и позиция записи по целым записям индекса
+
+        Возвращает размер целых записей индекса в байтах.
+        """
+        size = os.fstat(self._index.fileno()).st_size
+        whole = size - size % INDEX_ENTRY.size
+        self._count = whole // INDEX_ENTRY.size
+        self._last_timestamp = 0.0
+        self._segment_no = 1
+        self._segment_offset = 0
+
+        if self._count:
+            self._index.seek(whole - INDEX_ENTRY.size)
+            timestamp, _, segment, offset, peer_len, length = INDEX_ENTRY.unpack(
+                self._index.read(INDEX_ENTRY.size))
+            self._last_timestamp = timestamp
+            self._segment_no = segment
+            self._segment_offset = offset + peer_len + length
+        return whole
+
+    def __len__(self):
+        return self._count
+
+    def append(self, payload, peer='', kind=RECEIVED, timestamp=None):
+        """Дописывание сообщения; возвращает его номер"""
+        return self.append_many([payload], peer, kind, timestamp)
+
+    def append_many(self, payloads, peer='', kind=RECEIVED, timestamp=None):
+        """Дописывание пачки сообщений с одним сбросом на диск
+
+        Возвращает номер первого сообщения пачки.
+        """
+        if self.read_only:
+            raise ValueError("Хранилище открыто только для чтения")
+        peer_bytes = str(peer).encode('utf-8')
+
+        with self._lock, _write_time.time():
+            # Время в индексе не убывает, чтобы работал двоичный поиск
+            timestamp = max(time.time() if timestamp is None else timestamp, self._last_timestamp)
+            # Позиция меняется только после записи индекса: при ошибке
+            # (например, нет места на диске) счётчики не опережают index.bin
+            segment_no, offset = self._segment_no, self._segment_offset
+            entries = []
+            try:
+                for payload in payloads:
+                    record_size = len(peer_bytes) + len(payload)
+                    if offset and offset + record_size > self.segment_size:
+                        self._segment.close()
+                        segment_no += 1
+                        offset = 0
+                        self._segment = open(self._segment_path(segment_no), 'ab')
+
+                    self._segment.write(peer_bytes)
+                    self._segment.write(payload)
+                    entries.append(INDEX_ENTRY.pack(timestamp, kind, segment_no,
+                                                    offset, len(peer_bytes), len(payload)))
+                    offset += record_size
+
+                # Сначала данные, потом индекс: запись индекса не должна
+                # опережать сообщение, на которое ссылается
+                self._segment.flush()
+                self._index.write(b''.join(entries))
+                self._index.flush()
+            except BaseException:
+                self._rollback()
+                raise
+
+            first = self._count
+            self._count += len(entries)
+            self._segment_no = segment_no
+            self._segment_offset = offset
+            self._last_timestamp = timestamp
+        return first
+
+    def _rollback(self):
+        """Возврат файлов к последней целиком записанной пачке"""
+        for f in (self._segment, self._index):
+            try:
+                f.close()
+            except OSError:
+                pass  # Недописанный буфер отбрасывается
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        os.truncate(index_path, self._count * INDEX_ENTRY.size)
+        os.truncate(self._segment_path(self._segment_no), self._segment_offset)
+        self._remove_segments_after(self._segment_no)
+        self._index = open(index_path, 'a+b')
+        self._segment = open(self._segment_path(self._segment_no), 'ab')
+
+    def _entry(self, index_map, number):
+        return INDEX_ENTRY.unpack_from(index_map, number * INDEX_ENTRY.size)
+
+    def _map(self, path, min_size):
+        """mmap файла; отображение обновляется, если файл вырос"""
+        current = self._maps.get(path)
+        if current is None or len(current) < min_size:
+            if current is not None:
+                current.close()
+            with open(path, 'rb') as f:
+                current = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[path] = current
+        return current
+
+    def _bisect(self, index_map, count, timestamp):
+        """Номер первого сообщения не раньше timestamp"""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(index_map, middle)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def query(self, start=None, end=None, peer=None, kind=None):
+        """Сообщения в интервале времени [start, end) с фильтрами
+
+        start и end - datetime или время в секундах от эпохи.
+        """
+        with self._lock:
+            count = self._count
+        if not count:
+            return
+
+        if isinstance(start, datetime):
+            start = start.timestamp()
+        if isinstance(end, datetime):
+            end = end.timestamp()
+
+        index_map = self._map(os.path.join(self.directory, INDEX_FILE), count * INDEX_ENTRY.size)
+        first = 0 if start is None else self._bisect(index_map, count, start)
+        for number in range(first, count):
+            timestamp, entry_kind, segment, offset, peer_len, length = self._entry(index_map, number)
+            if end is not None and timestamp >= end:
+                break
+            if kind is not None and entry_kind != kind:
+                continue
+            if not peer_len + length:
+                if peer in (None, ''):
+                    yield Record(timestamp, entry_kind, '', b'')
+                continue
+            data = self._map(self._segment_path(segment), offset + peer_len + length)
+            entry_peer = data[offset:offset + peer_len].decode('utf-8')
+            if peer is not None and entry_peer != str(peer):
+                continue
+            yield Record(timestamp, entry_kind, entry_peer,
+                         data[offset + peer_len:offset + peer_len + length])
+
+    def export(self, directory, name_format, **filters):
+        """Выгрузка сообщений в отдельные файлы старого формата
+
+        name_format передаётся в strftime, {kind} заменяется на
+        send/receive. При совпадении имён добавляется суффикс _N,
+        чтобы сообщения одной секунды не затирали друг друга.
+        """
+        os.makedirs(directory, exist_ok=True)
+        exported = []
+        used = set()
+        for record in self.query(**filters):
+            name = datetime.fromtimestamp(record.timestamp).strftime(
+                name_format.replace('{kind}', KIND_NAMES.get(record.kind, 'message')))
+            base, ext = os.path.splitext(name)
+            suffix = 1
+            while name in used or os.path.exists(os.path.join(directory, name)):
+                name = f"{base}_{suffix}{ext}"
+                suffix += 1
+            used.add(name)
+            path = os.path.join(directory, name)
+            with open(path, 'wb') as f:
+                f.write(record.payload)
+            exported.append(path)
+        return exported
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+            self._index.close()
+            for current in self._maps.values():
+                current.close()
+            self._maps.clear()
@@ -0,0 +1,273 @@
+"""Трассировка задержек сообщения у отправителя, в сети и у получателя
+
+Отправитель для выбранной доли сообщений (sample_rate) начинает трассу:
+случайный номер и время отправки по time.time_ns записываются в
+заголовок TRACE_HEADER перед сообщением. Этапы (encode, send, receive,
+decode, output, persist) замеряются по time.perf_counter_ns на своей
+стороне; этап wire - от упаковки заголовка до прихода сообщения, он
+включает отправку, и точен настолько, насколько согласованы часы
+отправителя и получателя. Сообщения без трассы не меняются.
+
+Каждая сторона пишет по строке JSON на сообщение:
+    {"id": 123, "side": "send", "stages": {"encode": 5100, "send": 21000}}
+Запись идёт одним вызовом os.write в файл, открытый на дозапись, поэтому
+отправитель и получатели могут писать в один файл. Файл и доля
+сообщений по умолчанию берутся из TRACE_FILE и TRACE_SAMPLE.
+
+Разбор трасс по этапам:
+    python -m common.tracing trace.jsonl [trace2.jsonl ...]
+"""
+import argparse
+import json
+import os
+import random
+import struct
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+TRACE_MAGIC = 0xb8
+# магический байт, номер трассы, время упаковки в наносекундах (time.time_ns)
+TRACE_HEADER = struct.Struct('!BQQ')
+SEND = 'send'
+RECEIVE = 'recv'
+FLUSH_INTERVAL = 1.0
+FLUSH_RECORDS = 256
+
+now = time.perf_counter_ns
+
+
+def is_traced(data):
+    return len(data) >= TRACE_HEADER.size and data[0] == TRACE_MAGIC
+
+
+def unwrap(data):
+    """(номер трассы, время упаковки, сообщение); у сообщения без трассы номер None"""
+    if not is_traced(data):
+        return None, None, data
+    _, trace_id, sent_ns = TRACE_HEADER.unpack_from(data)
+    return trace_id, sent_ns, data[TRACE_HEADER.size:]
+
+
+class _Stage:
+    __slots__ = ('trace', 'name', 'started')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = now()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, now() - self.started)
+
+
+class Trace:
+    """Этапы одного сообщения на одной стороне"""
+
+    __slots__ = ('tracer', 'id', 'stages')
+    enabled = True
+
+    def __init__(self, tracer, trace_id):
+        self.tracer = tracer
+        self.id = trace_id
+        self.stages = {}
+
+    def stage(self, name):
+        """Контекстный менеджер: длительность этапа в наносекундах"""
+        return _Stage(self, name)
+
+    def add(self, name, duration):
+        self.stages[name] = self.stages.get(name, 0) + duration
+
+    def wrap(self, payload):
+        """Заголовок трассы перед сообщением; время - момент упаковки"""
+        return TRACE_HEADER.pack(TRACE_MAGIC, self.id, time.time_ns()) + bytes(payload)
+
+    def finish(self):
+        self.tracer.write(self)
+
+
+class _NullTrace:
+    """Сообщение без трассы: этапы не замеряются"""
+
+    enabled = False
+    _stage = nullcontext()
+
+    def stage(self, name):
+        return self._stage
+
+    def add(self, name, duration):
+        pass
+
+    def wrap(self, payload):
+        return payload
+
+    def finish(self):
+        pass
+
+
+NULL_TRACE = _NullTrace()
+
+
+class Tracer:
+    """Начало трасс и запись их этапов в файл
+
+    Без path трассировка выключена: start() и resume() возвращают
+    NULL_TRACE, заголовки не добавляются.
+    """
+
+    def __init__(self, path=None, sample_rate=1.0, side=SEND):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.side = side
+        self.records = 0
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644) if path else None
+        self._lines = []
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    @property
+    def enabled(self):
+        return self._fd is not None
+
+    def start(self):
+        """Трасса нового сообщения с вероятностью sample_rate"""
+        if self._fd is None or self._random.random() >= self.sample_rate:
+            return NULL_TRACE
+        return Trace(self, self._random.getrandbits(64))
+
+    def resume(self, trace_id, sent_ns, arrived):
+        """Трасса принятого сообщения
+
+        arrived - отметка now() при приёме: от неё до вызова считается
+        этап receive (сборка фрагментов, ожидание за сообщениями, пришедшими
+        тем же recv, разбор заголовка).
+        """
+        if self._fd is None or trace_id is None:
+            return NULL_TRACE
+        receive = now() - arrived
+        trace = Trace(self, trace_id)
+        trace.add('wire', time.time_ns() - receive - sent_ns)
+        trace.add('receive', receive)
+        return trace
+
+    def write(self, trace):
+        line = json.dumps({'id': trace.id, 'side': self.side, 'stages': trace.stages},
+                          separators=(',', ':'))
+        with self._lock:
+            if self._fd is None:
+                return
+            self._lines.append(line)
+            self.records += 1
+            if len(self._lines) >= FLUSH_RECORDS or time.monotonic() - self._flushed > FLUSH_INTERVAL:
+                self._flush()
+
+    def _flush(self):
+        if self._lines:
+            # Целые строки одним вызовом: записи процессов не перемешиваются
+            os.write(self._fd, ('\n'.join(self._lines) + '\n').encode('utf-8'))
+            self._lines = []
+        self._flushed = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                self._flush()
+                os.close(self._fd)
+                self._fd = None
+
+
+def tracer_from_env(side, path=None, sample_rate=None):
+    """Трассировщик; без параметров берутся TRACE_FILE и TRACE_SAMPLE"""
+    if path is None:
+        path = os.environ.get('TRACE_FILE')
+    if sample_rate is None:
+        sample_rate = float(os.environ.get('TRACE_SAMPLE', 1.0))
+    return Tracer(path, sample_rate, side)
+
+
+def percentile(sorted_values, fraction):
+    """Процентиль по ближайшему рангу"""
+    if not sorted_values:
+        return None
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def load(paths):
+    """Записи трасс: номер -> {сторона: {этап: наносекунды}}"""
+    traces = defaultdict(dict)
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    traces[record['id']][record['side']] = record['stages']
+                except (ValueError, KeyError, TypeError):
+                    continue  # Недописанная строка при аварийной остановке
+    return traces
+
+
+def summarize(traces):
+    """Статистика по этапам: список (сторона, этап, отсортированные длительности)
+
+    Последняя строка - полная задержка сообщений, трассы которых есть
+    у обеих сторон: кодирование, wire (он уже включает отправку) и этапы
+    получателя. Запись истории отправителем идёт после отправки и в
+    полную задержку не входит.
+    """
+    stages = defaultdict(list)
+    totals = []
+    for sides in traces.values():
+        for side, durations in sides.items():
+            for name, duration in durations.items():
+                stages[side, name].append(duration)
+        if SEND in sides and RECEIVE in sides:
+            totals.append(sides[SEND].get('encode', 0) + sum(sides[RECEIVE].values()))
+
+    order = {SEND: 0, RECEIVE: 1}
+    rows = [(side, name, sorted(values)) for (side, name), values in stages.items()]
+    rows.sort(key=lambda row: (order.get(row[0], 2), _STAGE_ORDER.get(row[1], len(_STAGE_ORDER)), row[1]))
+    if totals:
+        rows.append(('', 'total', sorted(totals)))
+    return rows
+
+
+_STAGE_ORDER = {name: index for index, name in enumerate(
+    ('encode', 'send', 'wire', 'receive', 'decode', 'output', 'persist'))}
+
+
+def format_report(rows):
+    lines = [f"{'сторона':<8}{'этап':<10}{'число':>8}{'среднее':>11}{'p50':>11}{'p90':>11}"
+             f"{'p99':>11}{'макс':>11}  (мкс)"]
+    for side, name, values in rows:
+        cells = [sum(values) / len(values)] + [percentile(values, fraction) for fraction in (0.5, 0.9, 0.99)]
+        cells.append(values[-1])
+        lines.append(f"{side:<8}{name:<10}{len(values):>8}"
+                     + ''.join(f"{value / 1000:>11.1f}" for value in cells))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Разбор трасс задержек по этапам")
+    parser.add_argument('paths', nargs='+', help="файлы трасс JSONL")
+    args = parser.parse_args(argv)
+
+    traces = load(args.paths)
+    if not traces:
+        print("Нет записей трасс")
+        return 1
+    matched = sum(1 for sides in traces.values() if SEND in sides and RECEIVE in sides)
+    print(f"Трасс: {len(traces)}, с обеих сторон: {matched}")
+    print(format_report(summarize(traces)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
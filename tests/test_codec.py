@@ -0,0 +1,133 @@
+"""Совпадение табличного кодека common.codec с прежними функциями
+
+baseline_encode_text и baseline_decode_text - прежние реализации
+encode_text/decode_text из 2/2.py и 3/ (в обоих местах они совпадали).
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from common.codec import decode_text, encode_text  # noqa: E402
+
+ALPHABET = ('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+            'абвгдежзийклмнопрстуфхцчшщъыьэюяАБВГДЕЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯёЁ ')
+OTHER = '0123456789.,!?-:;()"\'\t\n№«»éßΩ中😀'
+
+
+def baseline_encode_text(text):
+    """Кодирование текста с поддержкой русского и английского алфавитов"""
+    encoded = []
+    for char in text:
+        # Пробел
+        if char == ' ':
+            encoded.append('00000000')
+        # Английские строчные буквы (a-z)
+        elif 'a' <= char <= 'z':
+            encoded.append(f'0{ord(char) - ord("a"):07b}')
+        # Английские заглавные буквы (A-Z)
+        elif 'A' <= char <= 'Z':
+            encoded.append(f'1{ord(char) - ord("A"):07b}')
+        # Русские строчные буквы (а-я)
+        elif 'а' <= char <= 'я':
+            encoded.append(f'2{ord(char) - ord("а"):07b}')
+        # Русские заглавные буквы (А-Я)
+        elif 'А' <= char <= 'Я':
+            encoded.append(f'3{ord(char) - ord("А"):07b}')
+        # Буква 'ё' и 'Ё'
+        elif char == 'ё':
+            encoded.append('21100101')  # Код для 'ё'
+        elif char == 'Ё':
+            encoded.append('31100101')  # Код для 'Ё'
+        # Все остальные символы кодируем как пробел
+        else:
+            encoded.append('00000000')
+    return ' '.join(encoded)
+
+
+def baseline_decode_text(binary_str):
+    """Декодирование бинарной строки с поддержкой русского и английского алфавитов"""
+    binary_list = binary_str.split()
+    decoded = []
+    for code in binary_list:
+        if len(code) != 8:
+            decoded.append(' ')
+            continue
+
+        prefix = code[0]
+        char_code = int(code[1:], 2)
+
+        if code == '00000000':
+            decoded.append(' ')
+        elif prefix == '0':  # Английская строчная
+            decoded.append(chr(char_code + ord('a')))
+        elif prefix == '1':  # Английская заглавная
+            decoded.append(chr(char_code + ord('A')).upper())
+        elif prefix == '2':  # Русская строчная
+            if code == '21100101':  # Специальный код для 'ё'
+                decoded.append('ё')
+            else:
+                decoded.append(chr(char_code + ord('а')))
+        elif prefix == '3':  # Русская заглавная
+            if code == '31100101':  # Специальный код для 'Ё'
+                decoded.append('Ё')
+            else:
+                decoded.append(chr(char_code + ord('А')).upper())
+        else:
+            decoded.append(' ')
+    return ''.join(decoded)
+
+
+class CodecParityTest(unittest.TestCase):
+
+    def assert_same(self, text):
+        encoded = encode_text(text)
+        self.assertEqual(encoded, baseline_encode_text(text))
+        self.assertEqual(decode_text(encoded), baseline_decode_text(encoded))
+
+    def test_alphabet(self):
+        for char in ALPHABET:
+            self.assert_same(char)
+        self.assert_same(ALPHABET)
+        # Код 'a' совпадает с кодом пробела - так было и прежде
+        self.assertEqual(decode_text(encode_text(ALPHABET)), ' ' + ALPHABET[1:])
+
+    def test_unknown_characters(self):
+        for char in OTHER:
+            self.assert_same(char)
+        self.assert_same(OTHER)
+        self.assert_same('')
+
+    def test_random_strings(self):
+        rng = random.Random(1)
+        chars = ALPHABET + OTHER
+        for _ in range(500):
+            self.assert_same(''.join(rng.choice(chars) for _ in range(rng.randrange(64))))
+
+    def test_every_code(self):
+        for prefix in '0123456789':
+            for value in range(128):
+                code = f'{prefix}{value:07b}'
+                self.assertEqual(decode_text(code), baseline_decode_text(code))
+
+    def test_random_codes(self):
+        rng = random.Random(2)
+        for _ in range(500):
+            codes = [''.join(rng.choice('0123456789') if i == 0 else rng.choice('01')
+                             for i in range(rng.choice((1, 7, 8, 8, 8, 9))))
+                     for _ in range(rng.randrange(16))]
+            binary_str = rng.choice((' ', '  ', '\n')).join(codes)
+            self.assertEqual(decode_text(binary_str), baseline_decode_text(binary_str))
+
+    def test_invalid_digits(self):
+        for binary_str in ('0000000x', '2abcdefg 00000000'):
+            with self.assertRaises(ValueError):
+                baseline_decode_text(binary_str)
+            with self.assertRaises(ValueError):
+                decode_text(binary_str)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+"""Логика кодирования 1/encoding_core.py: разбор байтов, позиции ошибок и перевод таблицей"""
+import ast
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+import warnings
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, '1'))
+
+from encoding_core import (CODEPAGES, PARSE_BLOCK, REPLACEMENT_BYTE, ByteParseError,  # noqa: E402
+                           format_byte_values, format_unmappable, is_codepage_pair, parse_byte_values,
+                           transcode_file, translate_bytes, translation_table)
+
+
+def random_bytes(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+class ParseNumbersTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for data in (b'', b'\x00', bytes(range(256)), random_bytes(1000)):
+            self.assertEqual(parse_byte_values(format_byte_values(data)), data)
+
+    def test_empty(self):
+        for text in ('', '   ', '\n\t '):
+            self.assertEqual(parse_byte_values(text), b'')
+
+    def test_hex_and_whitespace(self):
+        self.assertEqual(parse_byte_values('0xff 0x0A\t7\n\n 255 0X1'), b'\xff\n\x07\xff\x01')
+
+    def test_several_blocks(self):
+        data = random_bytes(3 * PARSE_BLOCK // 2, 1)
+        text = format_byte_values(data)
+        self.assertGreater(len(text), 2 * PARSE_BLOCK)
+        self.assertEqual(parse_byte_values(text), data)
+        # Длинная строка без пробелов на границе блока
+        text = '1 ' * (PARSE_BLOCK // 2 - 1) + '0x01' + ' 2' * 10
+        self.assertEqual(parse_byte_values(text), b'\x01' * (PARSE_BLOCK // 2) + b'\x02' * 10)
+
+    def assertParseError(self, text, position, length, line, column):
+        with self.assertRaises(ByteParseError) as caught:
+            parse_byte_values(text)
+        error = caught.exception
+        self.assertEqual((error.position, error.length, error.line, error.column),
+                         (position, length, line, column))
+        self.assertIn(f'(строка {line}, столбец {column})', str(error))
+        return error
+
+    def test_bad_token(self):
+        self.assertParseError('1 2\n 3 abc', 7, 3, 2, 4)
+        self.assertParseError('0x', 0, 2, 1, 1)
+        self.assertParseError('12,13', 0, 5, 1, 1)
+
+    def test_out_of_range(self):
+        error = self.assertParseError('1 2 256', 4, 3, 1, 5)
+        self.assertIn('256', str(error))
+        self.assertParseError('0x100', 0, 5, 1, 1)
+        self.assertEqual(parse_byte_values('255 0xff'), b'\xff\xff')
+
+    def test_python_int_syntax_rejected(self):
+        for text in ('+5', '1_0', '-0', '0b1', '0o7'):
+            with self.assertRaises(ByteParseError):
+                parse_byte_values(text)
+
+    def test_error_in_later_block(self):
+        prefix = '1\n' * PARSE_BLOCK
+        self.assertParseError(prefix + '9 x1', len(prefix) + 2, 2, PARSE_BLOCK + 1, 3)
+
+    def test_is_value_error(self):
+        self.assertTrue(issubclass(ByteParseError, ValueError))
+
+
+class ParseLiteralTest(unittest.TestCase):
+
+    LITERALS = [
+        "b''",
+        "b'abc'",
+        'b"a\'b"',
+        "b'a\"'",
+        r"b'\x00\xff\n\t\r\\\'q'",
+        r"b'\0\7\77\101\377'",
+        r"b'\a\b\f\v'",
+        r"b'\q\8'",
+        "b'a\\\nb'",
+        "  b'x'\n",
+    ]
+
+    def test_matches_literal_eval(self):
+        for text in self.LITERALS:
+            with self.subTest(text=text), warnings.catch_warnings():
+                # Неизвестные escape-последовательности Python оставляет как есть с предупреждением
+                warnings.simplefilter('ignore', DeprecationWarning)
+                warnings.simplefilter('ignore', SyntaxWarning)
+                self.assertEqual(parse_byte_values(text), ast.literal_eval(text.strip()))
+
+    def test_repr_round_trip(self):
+        for data in (bytes(range(256)), random_bytes(5000, 2), b"'\"" * 10):
+            self.assertEqual(parse_byte_values(repr(data)), data)
+
+    def test_long_literal(self):
+        data = random_bytes(2 * PARSE_BLOCK, 3)
+        self.assertEqual(parse_byte_values(repr(data)), data)
+
+    def assertParseError(self, text, message, position, length):
+        with self.assertRaises(ByteParseError) as caught:
+            parse_byte_values(text)
+        error = caught.exception
+        self.assertIn(message, str(error))
+        self.assertEqual((error.position, error.length), (position, length))
+
+    def test_unterminated(self):
+        self.assertParseError("b'abc", 'Нет закрывающей кавычки', 0, 2)
+        self.assertParseError("b'abc\\'", 'Нет закрывающей кавычки', 0, 2)
+
+    def test_trailing_text(self):
+        self.assertParseError("b'a' x", 'Лишние символы', 5, 1)
+        self.assertParseError("b'a'b'c'", 'Лишние символы', 4, 4)
+
+    def test_bad_hex_escape(self):
+        self.assertParseError("b'\\x4g'", 'две шестнадцатеричные цифры', 2, 2)
+        self.assertParseError("b'ab\\x'", 'две шестнадцатеричные цифры', 4, 2)
+
+    def test_octal_out_of_range(self):
+        self.assertParseError("b'\\777'", 'вне диапазона', 2, 4)
+
+    def test_non_ascii(self):
+        self.assertParseError("b'я'", 'не ASCII', 2, 1)
+        with self.assertRaises(ByteParseError) as caught:
+            parse_byte_values("\n  b'\\x00€'")
+        self.assertEqual((caught.exception.line, caught.exception.column), (2, 9))
+
+
+def reference(data, src_encoding, dst_encoding):
+    """Перекодирование через str, как в decode_bytes и encode_text"""
+    return data.decode(src_encoding, errors='replace').encode(dst_encoding, errors='replace')
+
+
+class TranslateTest(unittest.TestCase):
+
+    PAIRS = [(src, dst) for src in CODEPAGES for dst in CODEPAGES]
+
+    def test_codepage_pairs(self):
+        self.assertTrue(is_codepage_pair('cp1251', 'IBM866'))
+        self.assertTrue(is_codepage_pair('KOI8-R', 'KOI8-R'))
+        self.assertFalse(is_codepage_pair('Windows-1251', 'UTF-8'))
+        self.assertFalse(is_codepage_pair('Windows-1251', 'no-such-encoding'))
+
+    def test_all_bytes_match_codecs(self):
+        data = bytes(range(256))
+        for src, dst in self.PAIRS:
+            with self.subTest(src=src, dst=dst):
+                self.assertEqual(translate_bytes(data, src, dst), reference(data, src, dst))
+
+    def test_random_data_match_codecs(self):
+        data = random_bytes(10000, 4)
+        for src, dst in self.PAIRS:
+            with self.subTest(src=src, dst=dst):
+                self.assertEqual(translate_bytes(data, src, dst), reference(data, src, dst))
+
+    def test_same_encoding(self):
+        table, unmappable = translation_table('KOI8-R', 'KOI8-R')
+        self.assertEqual(table, bytes(range(256)))
+        self.assertEqual(unmappable, b'')
+
+    def test_unmappable_counter(self):
+        _, missing = translation_table('Windows-1251', 'KOI8-R')
+        self.assertTrue(missing)
+        data = bytes(missing[:1]) * 3 + b'\xc0' + bytes(missing[-1:])
+        counter = Counter()
+        result = translate_bytes(data, 'Windows-1251', 'KOI8-R', counter)
+        self.assertEqual(result.count(REPLACEMENT_BYTE), 4)
+        self.assertEqual(counter, Counter({missing[0]: 3, missing[-1]: 1}))
+        # Переводимые данные счётчик не меняют
+        translate_bytes(b'\xc0\xc1', 'Windows-1251', 'KOI8-R', counter)
+        self.assertEqual(sum(counter.values()), 4)
+
+    def test_format_unmappable(self):
+        self.assertEqual(format_unmappable(Counter()), '')
+        self.assertEqual(format_unmappable(Counter({0x98: 3, 0xa0: 1})), '0x98 x3, 0xA0 x1')
+        self.assertEqual(format_unmappable(Counter(range(20)), limit=2).count(','), 2)
+        self.assertTrue(format_unmappable(Counter(range(20)), limit=2).endswith('...'))
+
+
+class TranscodeFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.data = bytes(range(256)) * 50 + random_bytes(5000, 5)
+        self.src = self.path('src.txt')
+        with open(self.src, 'wb') as f:
+            f.write(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+    def test_codepage_path(self):
+        progress = []
+        counter = Counter()
+        done = transcode_file(self.src, self.path('dst'), 'CP866', 'ISO-8859-5', chunk_size=1000,
+                              progress=lambda done, total: progress.append((done, total)), unmappable=counter)
+        self.assertEqual(done, len(self.data))
+        self.assertEqual(self.read('dst'), reference(self.data, 'CP866', 'ISO-8859-5'))
+        self.assertEqual(progress[-1], (len(self.data), len(self.data)))
+        self.assertEqual(sum(counter.values()), self.read('dst').count(REPLACEMENT_BYTE) - self.data.count(b'?'))
+
+    def test_codec_path(self):
+        transcode_file(self.src, self.path('utf8'), 'KOI8-R', 'UTF-8', chunk_size=1000)
+        self.assertEqual(self.read('utf8'), reference(self.data, 'KOI8-R', 'UTF-8'))
+        # Строгий режим идёт через codecs и не заменяет байты молча
+        with self.assertRaises(UnicodeError):
+            transcode_file(self.src, self.path('strict'), 'Windows-1251', 'KOI8-R', errors='strict')
+
+    def test_same_file(self):
+        with self.assertRaises(ValueError):
+            transcode_file(self.src, self.src, 'KOI8-R', 'CP866')
+        with self.assertRaises(ValueError):
+            transcode_file(self.src, os.path.join(self.directory, '.', 'src.txt'), 'KOI8-R', 'UTF-8')
+        with open(self.src, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+"""Энтропийный код common.entropy: кодирование, ESCAPE и повреждённые данные"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from common.entropy import (ALPHABET, DEFAULT_TABLE, ENTROPY_MAGIC, ESCAPE, ESCAPE_BITS,  # noqa: E402
+                            FLAG_TABLE, MAX_CODE_LENGTH, SYMBOL_COUNT, TABLE_SIZE, HuffmanTable,
+                            SessionEncoder, decode, encode, entropy_bits, is_entropy)
+
+OTHER = '№«»éßΩ中😀\t\x00\U0010ffff'
+
+
+class EntropyRoundTripTest(unittest.TestCase):
+
+    def test_alphabet(self):
+        for char in ALPHABET:
+            self.assertEqual(decode(encode(char)), char)
+        self.assertEqual(decode(encode(ALPHABET)), ALPHABET)
+        self.assertEqual(decode(encode(ALPHABET, adaptive=True)), ALPHABET)
+
+    def test_empty(self):
+        data = encode('')
+        self.assertEqual(data, bytes([ENTROPY_MAGIC, 0]))
+        self.assertEqual(decode(data), '')
+        self.assertEqual(entropy_bits(data), '')
+
+    def test_escape(self):
+        for char in OTHER:
+            bits = DEFAULT_TABLE.encode_bits(char)
+            self.assertEqual(bits, DEFAULT_TABLE.codes[ESCAPE] + f'{ord(char):0{ESCAPE_BITS}b}')
+            self.assertEqual(decode(encode(char)), char)
+        text = 'Привет, ' + OTHER + ' world'
+        self.assertEqual(decode(encode(text)), text)
+        self.assertEqual(decode(encode(text, adaptive=True)), text)
+
+    def test_random_texts(self):
+        rng = random.Random(1)
+        chars = ALPHABET + OTHER
+        for _ in range(300):
+            text = ''.join(rng.choice(chars) for _ in range(rng.randrange(200)))
+            for adaptive in (False, True):
+                self.assertEqual(decode(encode(text, adaptive)), text)
+
+    def test_adaptive_table_in_header(self):
+        text = 'ъъъъъъъъ' * 200
+        data = encode(text, adaptive=True)
+        self.assertTrue(data[1] & FLAG_TABLE)
+        self.assertLess(len(data), len(encode(text)))
+        self.assertEqual(decode(data), text)
+
+    def test_padding_flags(self):
+        for text in ('о', 'оо', 'hello', 'Съешь же ещё'):
+            data = encode(text)
+            bits = DEFAULT_TABLE.encode_bits(text)
+            self.assertEqual(data[1] >> 1, -len(bits) % 8)
+            self.assertEqual(entropy_bits(data), bits)
+
+    def test_session_encoder(self):
+        session = SessionEncoder()
+        messages = ['ъъъ ффф эээ ' * 50, 'ффф ъъъ', 'Hello ' + OTHER, '']
+        encoded = [session.encode(text) for text in messages]
+        # Сообщения декодируются без состояния сеанса и в любом порядке
+        for data, text in reversed(list(zip(encoded, messages))):
+            self.assertEqual(decode(data), text)
+        self.assertTrue(is_entropy(encoded[0]))
+
+
+class HuffmanTableTest(unittest.TestCase):
+
+    def test_prefix_free(self):
+        codes = sorted(DEFAULT_TABLE.codes.values())
+        for code, following in zip(codes, codes[1:]):
+            self.assertFalse(following.startswith(code))
+        self.assertLessEqual(DEFAULT_TABLE.max_length, MAX_CODE_LENGTH)
+
+    def test_bytes_round_trip(self):
+        table = HuffmanTable.from_text('абракадабра abracadabra')
+        data = table.to_bytes()
+        self.assertEqual(len(data), TABLE_SIZE)
+        self.assertEqual(HuffmanTable.from_bytes(data).codes, table.codes)
+
+    def test_max_length_limit(self):
+        weights = {char: 2 ** index for index, char in enumerate(ALPHABET[:40])}
+        table = HuffmanTable.from_weights(weights)
+        self.assertLessEqual(table.max_length, MAX_CODE_LENGTH)
+        self.assertEqual(table.decode_bits(table.encode_bits(ALPHABET)), ALPHABET)
+
+    def test_invalid_lengths(self):
+        with self.assertRaises(ValueError):
+            HuffmanTable([1] * SYMBOL_COUNT)
+        lengths = [0] * SYMBOL_COUNT
+        lengths[0] = 1
+        with self.assertRaises(ValueError):
+            HuffmanTable(lengths)
+        with self.assertRaises(ValueError):
+            HuffmanTable([8] * (SYMBOL_COUNT - 1))
+
+
+class EntropyCorruptionTest(unittest.TestCase):
+
+    def test_not_entropy(self):
+        for data in (b'', b'\xb7', b'\x00\x00', b'00000000'):
+            with self.assertRaises(ValueError):
+                decode(data)
+        self.assertFalse(is_entropy(b'00000000'))
+
+    def test_truncated(self):
+        text = 'Съешь же ещё этих мягких французских булок ' + OTHER
+        for adaptive in (False, True):
+            data = encode(text, adaptive)
+            for length in range(2, len(data)):
+                try:
+                    result = decode(data[:length])
+                except ValueError:
+                    continue
+                # Обрезка по границе символа даёт начало текста
+                self.assertTrue(text.startswith(result))
+
+    def test_truncated_table(self):
+        data = encode('ъъъъъъъъ' * 200, adaptive=True)
+        with self.assertRaises(ValueError):
+            decode(data[:2 + TABLE_SIZE - 1])
+
+    def test_truncated_escape(self):
+        bits = DEFAULT_TABLE.encode_bits('中')
+        for cut in range(1, ESCAPE_BITS):
+            with self.assertRaises(ValueError):
+                DEFAULT_TABLE.decode_bits(bits[:-cut])
+
+    def test_escape_out_of_range(self):
+        bits = DEFAULT_TABLE.codes[ESCAPE] + '1' * ESCAPE_BITS
+        with self.assertRaises(ValueError):
+            DEFAULT_TABLE.decode_bits(bits)
+
+    def test_random_corruption(self):
+        rng = random.Random(2)
+        text = 'Hello, мир! ' * 20 + OTHER
+        data = bytearray(encode(text))
+        for _ in range(300):
+            corrupted = bytearray(data)
+            corrupted[rng.randrange(2, len(corrupted))] ^= 1 << rng.randrange(8)
+            try:
+                decode(bytes(corrupted))
+            except ValueError:
+                pass
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""Фрагментация UDP common.fragment: сборка, порядок, таймаут и лимиты"""
+import os
+import random
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from common.fragment import (FRAGMENT_HEADER, FRAGMENT_MAGIC, MAX_DATAGRAM, MAX_MESSAGE_SIZE,  # noqa: E402
+                             Reassembler, fragment, is_fragment)
+
+ADDR = ('127.0.0.1', 5005)
+
+
+def payload(size, seed=0):
+    return random.Random(seed).randbytes(size)
+
+
+class FragmentTest(unittest.TestCase):
+
+    def test_short_message_unchanged(self):
+        data = b'x' * MAX_DATAGRAM
+        self.assertEqual(fragment(data), [data])
+
+    def test_fragment_sizes(self):
+        data = payload(10 * MAX_DATAGRAM + 7)
+        datagrams = fragment(data)
+        self.assertGreater(len(datagrams), 10)
+        for datagram in datagrams:
+            self.assertTrue(is_fragment(datagram))
+            self.assertLessEqual(len(datagram), MAX_DATAGRAM)
+
+    def test_too_long(self):
+        with self.assertRaises(ValueError):
+            fragment(b'x' * (MAX_MESSAGE_SIZE + 1))
+
+
+class ReassemblerTest(unittest.TestCase):
+
+    def feed_all(self, reassembler, datagrams, addr=ADDR):
+        results = [reassembler.feed(datagram, addr) for datagram in datagrams]
+        return [bytes(result) for result in results if result is not None]
+
+    def test_in_order(self):
+        data = payload(5000)
+        reassembler = Reassembler()
+        self.assertEqual(self.feed_all(reassembler, fragment(data, 600)), [data])
+        self.assertEqual(reassembler.pending, 0)
+        self.assertEqual(reassembler.memory, 0)
+
+    def test_out_of_order(self):
+        rng = random.Random(1)
+        for size in (601, 5000, 65536):
+            data = payload(size, size)
+            datagrams = fragment(data, 600)
+            rng.shuffle(datagrams)
+            self.assertEqual(self.feed_all(Reassembler(), datagrams), [data])
+
+    def test_interleaved_senders(self):
+        first, second = payload(3000, 1), payload(3000, 2)
+        reassembler = Reassembler()
+        datagrams = [(datagram, 'a') for datagram in fragment(first, 500)]
+        datagrams += [(datagram, 'b') for datagram in fragment(second, 500)]
+        random.Random(3).shuffle(datagrams)
+        results = {}
+        for datagram, addr in datagrams:
+            result = reassembler.feed(datagram, addr)
+            if result is not None:
+                results[addr] = bytes(result)
+        self.assertEqual(results, {'a': first, 'b': second})
+
+    def test_duplicates(self):
+        data = payload(2000)
+        datagrams = fragment(data, 500)
+        reassembler = Reassembler()
+        self.assertEqual(self.feed_all(reassembler, datagrams[:1] * 3 + datagrams[1:]), [data])
+        self.assertEqual(reassembler.stats['duplicates'], 2)
+
+    def test_malformed(self):
+        reassembler = Reassembler(max_message_size=1000)
+        header = FRAGMENT_HEADER.pack
+        for datagram in (
+            bytes([FRAGMENT_MAGIC]) + b'\x00' * 5,          # короче заголовка
+            header(FRAGMENT_MAGIC, 1, 2, 2, 100, 0) + b'x',  # номер не меньше числа
+            header(FRAGMENT_MAGIC, 1, 0, 2, 2000, 0) + b'x',  # длиннее предела
+            header(FRAGMENT_MAGIC, 1, 0, 2, 100, 99) + b'xy',  # за концом сообщения
+        ):
+            self.assertIsNone(reassembler.feed(datagram, ADDR))
+        self.assertEqual(reassembler.stats['malformed'], 4)
+        self.assertEqual(reassembler.pending, 0)
+
+    def test_inconsistent_fragments(self):
+        reassembler = Reassembler()
+        header = FRAGMENT_HEADER.pack
+        self.assertIsNone(reassembler.feed(header(FRAGMENT_MAGIC, 7, 0, 2, 10, 0) + b'x', ADDR))
+        # Тот же номер сообщения с другим числом фрагментов
+        self.assertIsNone(reassembler.feed(header(FRAGMENT_MAGIC, 7, 1, 3, 10, 1) + b'y', ADDR))
+        self.assertEqual(reassembler.stats['malformed'], 1)
+
+    def test_timeout(self):
+        data = payload(3000)
+        datagrams = fragment(data, 500)
+        reassembler = Reassembler(timeout=0.05)
+        self.assertEqual(self.feed_all(reassembler, datagrams[:-1]), [])
+        self.assertEqual(reassembler.pending, 1)
+        time.sleep(0.06)
+        reassembler.expire()
+        self.assertEqual(reassembler.pending, 0)
+        self.assertEqual(reassembler.memory, 0)
+        self.assertEqual(reassembler.stats['expired'], 1)
+        # Последний фрагмент после таймаута начинает новую, неполную сборку
+        self.assertIsNone(reassembler.feed(datagrams[-1], ADDR))
+
+    def test_memory_limit(self):
+        reassembler = Reassembler(max_memory=5000)
+        first, second = fragment(payload(3000, 1), 500), fragment(payload(3000, 2), 500)
+        reassembler.feed(first[0], ADDR)
+        reassembler.feed(second[0], ADDR)
+        # Первое сообщение вытеснено, чтобы поместилось второе
+        self.assertEqual(reassembler.stats['evicted'], 1)
+        self.assertLessEqual(reassembler.memory, 5000)
+        self.assertEqual(self.feed_all(reassembler, second[1:]), [payload(3000, 2)])
+        self.assertIsNone(reassembler.feed(fragment(payload(6000), 500)[0], ADDR))
+        self.assertEqual(reassembler.stats['malformed'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Кадрирование TCP common.framing: разбор потока, границы и ошибки"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from common.framing import FRAME_HEADER, FRAME_MAGIC, FrameReader, FramingError, frame  # noqa: E402
+
+MESSAGES = [b'', b'a', b'00000000 20010000', bytes(range(256)), b'\xb2' * 10, b'x' * 70000]
+
+
+class FrameReaderTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        reader = FrameReader()
+        stream = b''.join(map(frame, MESSAGES))
+        self.assertEqual(reader.feed(stream), MESSAGES)
+        self.assertEqual(reader.pending, 0)
+
+    def test_byte_by_byte(self):
+        reader = FrameReader()
+        received = []
+        for byte in b''.join(map(frame, MESSAGES)):
+            received += reader.feed(bytes([byte]))
+        self.assertEqual(received, MESSAGES)
+        self.assertEqual(reader.pending, 0)
+
+    def test_random_splits(self):
+        rng = random.Random(1)
+        stream = b''.join(map(frame, MESSAGES * 3))
+        for _ in range(50):
+            reader = FrameReader()
+            received = []
+            position = 0
+            while position < len(stream):
+                size = rng.randrange(1, 20000)
+                received += reader.feed(stream[position:position + size])
+                position += size
+            self.assertEqual(received, MESSAGES * 3)
+
+    def test_pending_partial_frame(self):
+        reader = FrameReader()
+        data = frame(b'hello')
+        self.assertEqual(reader.feed(data[:3]), [])
+        self.assertEqual(reader.pending, 3)
+        self.assertEqual(reader.feed(data[3:] + data[:FRAME_HEADER.size]), [b'hello'])
+        self.assertEqual(reader.pending, FRAME_HEADER.size)
+
+    def test_legacy_stream(self):
+        reader = FrameReader()
+        self.assertEqual(reader.feed(b''), [])
+        self.assertIsNone(reader.framed)
+        self.assertEqual(reader.feed(b'00000000 20010000'), [b'00000000 20010000'])
+        self.assertFalse(reader.framed)
+        # Старый клиент: каждый фрагмент - отдельное сообщение, даже с меткой кадра
+        self.assertEqual(reader.feed(frame(b'x')), [frame(b'x')])
+
+    def test_bad_magic(self):
+        reader = FrameReader()
+        with self.assertRaises(FramingError):
+            reader.feed(frame(b'ok') + b'\x00' + frame(b'next')[1:])
+
+    def test_length_limit(self):
+        reader = FrameReader(max_frame_size=10)
+        self.assertEqual(reader.feed(frame(b'x' * 10)), [b'x' * 10])
+        with self.assertRaises(FramingError):
+            reader.feed(FRAME_HEADER.pack(FRAME_MAGIC, 11))
+
+    def test_frame_limit(self):
+        from common import framing
+        with self.assertRaises(FramingError):
+            frame(b'x' * (framing.MAX_FRAME_SIZE + 1))
+        self.assertTrue(issubclass(FramingError, ValueError))
+
+
+if __name__ == "__main__":
+    unittest.main()
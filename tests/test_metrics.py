@@ -0,0 +1,145 @@
+"""Метрики common.metrics: снимок JSON, текстовый формат Prometheus и экспорт"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from common.metrics import Counter, Exporter, Gauge, Histogram, MetricsRegistry, start_exporter  # noqa: E402
+
+
+def filled_registry():
+    registry = MetricsRegistry()
+    registry.counter('messages_total', 'Принято сообщений').inc(3)
+    registry.gauge('queue_length', fn=lambda: 7)
+    histogram = registry.histogram('handle_seconds', 'Время обработки', buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    return registry
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_counter_and_gauge(self):
+        counter = Counter('c')
+        counter.inc()
+        counter.inc(4)
+        self.assertEqual(counter.value, 5)
+        gauge = Gauge('g')
+        gauge.set(10)
+        gauge.dec(3)
+        self.assertEqual(gauge.value, 7)
+        self.assertEqual(Gauge('f', fn=lambda: 42).value, 42)
+
+    def test_histogram_buckets(self):
+        histogram = Histogram('h', buckets=(1, 2, 4))
+        for value in (0.5, 1, 1.5, 3, 100):
+            histogram.observe(value)
+        data = histogram.snapshot()
+        # Граница корзины входит в неё: 1 попадает в корзину le=1
+        self.assertEqual(data['buckets'], [2, 1, 1, 1])
+        self.assertEqual((data['count'], data['sum']), (5, 106))
+        self.assertEqual((data['p50'], data['p95']), (2, float('inf')))
+
+    def test_empty_histogram(self):
+        data = Histogram('h', buckets=(1,)).snapshot()
+        self.assertEqual(data['count'], 0)
+        self.assertIsNone(data['p50'])
+
+    def test_same_name(self):
+        registry = MetricsRegistry()
+        first = registry.counter('x')
+        self.assertIs(registry.counter('x'), first)
+        with self.assertRaises(ValueError):
+            registry.gauge('x')
+        # Новая функция заменяет прежнюю
+        registry.gauge('y', fn=lambda: 1)
+        self.assertEqual(registry.gauge('y', fn=lambda: 2).value, 2)
+
+    def test_snapshot(self):
+        snapshot = filled_registry().snapshot()
+        self.assertEqual(snapshot['counters'], {'messages_total': 3})
+        self.assertEqual(snapshot['gauges'], {'queue_length': 7})
+        histogram = snapshot['histograms']['handle_seconds']
+        self.assertEqual(set(histogram), {'count', 'sum', 'p50', 'p95', 'p99'})
+        self.assertEqual(histogram['count'], 4)
+        self.assertGreaterEqual(snapshot['uptime'], 0)
+        json.dumps(snapshot)
+
+    def test_render_text(self):
+        lines = filled_registry().render_text().splitlines()
+        self.assertEqual(lines, [
+            '# HELP handle_seconds Время обработки',
+            '# TYPE handle_seconds histogram',
+            'handle_seconds_bucket{le="0.1"} 2',
+            'handle_seconds_bucket{le="1"} 3',
+            'handle_seconds_bucket{le="+Inf"} 4',
+            'handle_seconds_sum 2.65',
+            'handle_seconds_count 4',
+            '# HELP messages_total Принято сообщений',
+            '# TYPE messages_total counter',
+            'messages_total 3',
+            '# TYPE queue_length gauge',
+            'queue_length 7',
+        ])
+
+    def test_broken_function_skipped(self):
+        registry = MetricsRegistry()
+        registry.counter('ok').inc()
+        registry.gauge('broken', fn=lambda: 1 / 0)
+        self.assertEqual(registry.snapshot()['gauges'], {})
+        # Сломанная метрика пропускается целиком, без строки TYPE
+        self.assertEqual(registry.render_text(), '# TYPE ok counter\nok 1\n')
+
+
+class ExporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_http(self):
+        exporter = Exporter(filled_registry(), http_port=0)
+        try:
+            base = f'http://127.0.0.1:{exporter.port}'
+            with urllib.request.urlopen(base + '/metrics') as response:
+                self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+                self.assertIn('messages_total 3', response.read().decode('utf-8'))
+            with urllib.request.urlopen(base + '/metrics.json') as response:
+                self.assertEqual(json.load(response)['gauges'], {'queue_length': 7})
+            with self.assertRaises(urllib.error.HTTPError) as caught:
+                urllib.request.urlopen(base + '/other')
+            self.assertEqual(caught.exception.code, 404)
+            caught.exception.close()
+        finally:
+            exporter.close()
+
+    def test_stats_file(self):
+        path = os.path.join(self.directory, 'stats.json')
+        exporter = Exporter(filled_registry(), stats_file=path, interval=60)
+        exporter.close()
+        with open(path, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['counters'], {'messages_total': 3})
+        self.assertEqual(os.listdir(self.directory), ['stats.json'])
+
+    def test_start_exporter_environment(self):
+        with mock.patch.dict(os.environ, {'METRICS_PORT': '', 'METRICS_FILE': ''}):
+            self.assertIsNone(start_exporter(registry=MetricsRegistry()))
+        path = os.path.join(self.directory, 'env.json')
+        with mock.patch.dict(os.environ, {'METRICS_PORT': '', 'METRICS_FILE': path}):
+            exporter = start_exporter(registry=filled_registry(), interval=60)
+        exporter.close()
+        self.assertIsNone(exporter.port)
+        self.assertTrue(os.path.exists(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,259 @@
+"""Надёжная доставка 4/reliable.py: SACK, повторы по таймеру, Карн и SKIP"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, '4'))
+
+from reliable import (ACK, ACK_HEADER, DATA, DATA_HEADER, DUP_THRESHOLD, MAGIC,  # noqa: E402
+                      MAX_SEQ, SACK_BLOCK, SKIP, ReliableEndpoint, RttEstimator, is_reliable)
+
+SENDER = ('127.0.0.1', 1)
+RECEIVER = ('127.0.0.1', 2)
+
+
+class FakeSocket:
+    """Датаграммы не уходят в сеть, а копятся в списке"""
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((bytes(data), addr))
+
+    def packets(self):
+        return [data for data, _ in self.sent]
+
+    def take(self):
+        sent, self.sent = self.sent, []
+        return [data for data, _ in sent]
+
+
+def kind(packet):
+    return packet[1]
+
+
+def parse_ack(packet):
+    _, _, session, cumulative, echo_seq, count = ACK_HEADER.unpack_from(packet)
+    blocks = [SACK_BLOCK.unpack_from(packet, ACK_HEADER.size + i * SACK_BLOCK.size) for i in range(count)]
+    return cumulative, echo_seq, blocks
+
+
+def seq_of(packet):
+    return DATA_HEADER.unpack_from(packet)[3]
+
+
+class Link:
+    """Отправитель и получатель, связанные списками датаграмм"""
+
+    def __init__(self, **kwargs):
+        self.sender_sock = FakeSocket()
+        self.receiver_sock = FakeSocket()
+        self.failed = []
+        self.sender = ReliableEndpoint(self.sender_sock, on_failure=lambda addr, seq: self.failed.append(seq),
+                                       **kwargs)
+        self.receiver = ReliableEndpoint(self.receiver_sock)
+        self.delivered = []
+
+    def to_receiver(self, packets):
+        for packet in packets:
+            self.delivered += self.receiver.on_datagram(packet, SENDER)
+
+    def to_sender(self, packets):
+        for packet in packets:
+            self.sender.on_datagram(packet, RECEIVER)
+
+    def pump(self, drop=lambda packet: False):
+        while self.sender_sock.sent or self.receiver_sock.sent:
+            self.to_receiver(packet for packet in self.sender_sock.take() if not drop(packet))
+            self.to_sender(self.receiver_sock.take())
+
+    def expire_all(self):
+        """Истечение всех таймеров отправителя без ожидания"""
+        for peer in self.sender._peers.values():
+            for entry in peer.unacked.values():
+                entry.deadline = 0
+            peer.skip_deadline = 0
+        self.sender.tick()
+
+
+class RttEstimatorTest(unittest.TestCase):
+
+    def test_first_and_next_samples(self):
+        rtt = RttEstimator(min_rto=0.001, max_rto=10)
+        rtt.sample(0.1)
+        self.assertAlmostEqual(rtt.srtt, 0.1)
+        self.assertAlmostEqual(rtt.rttvar, 0.05)
+        self.assertAlmostEqual(rtt.rto, 0.3)
+        rtt.sample(0.2)
+        self.assertAlmostEqual(rtt.rttvar, 0.75 * 0.05 + 0.25 * 0.1)
+        self.assertAlmostEqual(rtt.srtt, 0.875 * 0.1 + 0.125 * 0.2)
+
+    def test_bounds(self):
+        rtt = RttEstimator(min_rto=0.05, max_rto=1)
+        rtt.sample(0.0001)
+        self.assertEqual(rtt.rto, 0.05)
+        rtt.sample(100)
+        self.assertEqual(rtt.rto, 1)
+
+
+class ReliableEndpointTest(unittest.TestCase):
+
+    def test_in_order_delivery(self):
+        link = Link()
+        for index in range(10):
+            link.sender.send(b'm%d' % index, RECEIVER)
+        self.assertTrue(all(is_reliable(packet) for packet, _ in link.sender_sock.sent))
+        link.pump()
+        self.assertEqual(link.delivered, [b'm%d' % index for index in range(10)])
+        self.assertEqual(link.sender.pending(), 0)
+        self.assertIsNotNone(link.sender.rtt(RECEIVER))
+
+    def test_window(self):
+        link = Link(window=4)
+        for index in range(10):
+            link.sender.send(b'm%d' % index, RECEIVER)
+        self.assertEqual(len(link.sender_sock.sent), 4)
+        self.assertEqual(link.sender.pending(RECEIVER), 10)
+        link.pump()
+        self.assertEqual(len(link.delivered), 10)
+
+    def test_out_of_order_and_sack(self):
+        link = Link()
+        for index in range(6):
+            link.sender.send(b'm%d' % index, RECEIVER)
+        packets = link.sender_sock.take()
+        # Пакеты 1 и 4 потеряны
+        link.to_receiver([packets[0], packets[2], packets[3], packets[5]])
+        self.assertEqual(link.delivered, [b'm0'])
+        cumulative, echo_seq, blocks = parse_ack(link.receiver_sock.sent[-1][0])
+        self.assertEqual((cumulative, echo_seq), (1, 5))
+        self.assertEqual(blocks, [(2, 4), (5, 6)])
+
+        link.to_sender(link.receiver_sock.take())
+        self.assertEqual(sorted(link.sender._peers[RECEIVER].unacked), [1, 4])
+        link.to_receiver([packets[1]])
+        self.assertEqual(link.delivered, [b'm0', b'm1', b'm2', b'm3'])
+        link.to_receiver([packets[4]])
+        self.assertEqual(link.delivered, [b'm%d' % index for index in range(6)])
+
+    def test_duplicates(self):
+        link = Link()
+        link.sender.send(b'once', RECEIVER)
+        packet = link.sender_sock.take()[0]
+        link.to_receiver([packet, packet, packet])
+        self.assertEqual(link.delivered, [b'once'])
+        self.assertEqual(link.receiver.stats['duplicates'], 2)
+        # Каждый повтор подтверждается, чтобы отправитель перестал слать
+        self.assertEqual(len(link.receiver_sock.sent), 3)
+
+    def test_fast_retransmit(self):
+        link = Link()
+        for index in range(DUP_THRESHOLD + 1):
+            link.sender.send(b'm%d' % index, RECEIVER)
+        packets = link.sender_sock.take()
+        link.to_receiver(packets[1:])
+        link.to_sender(link.receiver_sock.take())
+        # Потерянный пакет повторён без ожидания таймера
+        self.assertEqual([seq_of(packet) for packet in link.sender_sock.packets()], [0])
+        self.assertEqual(link.sender.stats['retransmitted'], 1)
+        link.pump()
+        self.assertEqual(len(link.delivered), DUP_THRESHOLD + 1)
+
+    def test_timer_retransmit_and_karn(self):
+        link = Link()
+        link.sender.send(b'slow', RECEIVER)
+        link.sender_sock.take()
+        link.expire_all()
+        self.assertEqual([seq_of(packet) for packet in link.sender_sock.packets()], [0])
+        entry = link.sender._peers[RECEIVER].unacked[0]
+        self.assertEqual(entry.retries, 1)
+        # Экспоненциальная задержка следующего повтора
+        self.assertGreater(entry.deadline - entry.sent_at, link.sender._peers[RECEIVER].rtt.rto)
+        link.pump()
+        self.assertEqual(link.delivered, [b'slow'])
+        # ACK повторённого пакета не даёт замера RTT
+        self.assertIsNone(link.sender.rtt(RECEIVER))
+
+    def test_give_up_and_skip(self):
+        link = Link(max_retries=1)
+        for index in range(6):
+            link.sender.send(b'm%d' % index, RECEIVER)
+        lost = lambda packet: kind(packet) == DATA and seq_of(packet) == 0  # noqa: E731
+        link.pump(drop=lost)
+        self.assertEqual(link.delivered, [])
+        link.expire_all()
+        link.pump(drop=lost)
+        link.expire_all()
+        link.pump(drop=lost)
+        self.assertEqual(link.failed, [0])
+        self.assertEqual(link.delivered, [b'm%d' % index for index in range(1, 6)])
+        self.assertEqual(link.receiver.stats['skipped'], 1)
+        self.assertIsNone(link.sender._peers[RECEIVER].skip_to)
+        self.assertEqual(link.sender.pending(), 0)
+
+    def test_skip_retransmitted_until_acked(self):
+        link = Link(max_retries=1)
+        link.sender.send(b'lost', RECEIVER)
+        link.sender.send(b'kept', RECEIVER)
+        packets = link.sender_sock.take()
+        link.to_receiver(packets[1:])
+        link.to_sender(link.receiver_sock.take())
+        link.expire_all()
+        link.sender_sock.take()
+        link.expire_all()
+        skip = [packet for packet in link.sender_sock.take() if kind(packet) == SKIP]
+        self.assertEqual(len(skip), 1)
+        self.assertEqual(link.sender._peers[RECEIVER].skip_to, 2)
+        # Потерянный SKIP отправляется снова
+        link.expire_all()
+        resent = [packet for packet in link.sender_sock.packets() if kind(packet) == SKIP]
+        self.assertEqual(len(resent), 1)
+        link.pump()
+        self.assertEqual(link.delivered, [b'kept'])
+        self.assertIsNone(link.sender._peers[RECEIVER].skip_to)
+
+    def test_skip_ack_does_not_sample_rtt(self):
+        link = Link()
+        link.sender.send(b'x', RECEIVER)
+        packet = link.sender_sock.take()[0]
+        session = DATA_HEADER.unpack_from(packet)[2]
+        link.receiver.on_datagram(DATA_HEADER.pack(MAGIC, SKIP, session, 1), SENDER)
+        _, echo_seq, _ = parse_ack(link.receiver_sock.sent[-1][0])
+        self.assertEqual(echo_seq, 0)
+        self.assertEqual(link.receiver._peers[SENDER].expected, 1)
+
+    def test_new_session_resets_receiver(self):
+        link = Link()
+        link.sender.send(b'first', RECEIVER)
+        link.pump()
+        restarted = ReliableEndpoint(FakeSocket())
+        restarted.send(b'again', RECEIVER)
+        link.to_receiver(restarted.sock.take())
+        self.assertEqual(link.delivered, [b'first', b'again'])
+
+    def test_foreign_session_ack_ignored(self):
+        link = Link()
+        link.sender.send(b'x', RECEIVER)
+        link.sender_sock.take()
+        ack = ACK_HEADER.pack(MAGIC, ACK, link.sender.session ^ 1, 1, 0, 0)
+        link.to_sender([ack])
+        self.assertEqual(link.sender.pending(), 1)
+
+    def test_short_datagrams(self):
+        endpoint = ReliableEndpoint(FakeSocket())
+        for data in (b'', bytes([MAGIC]), bytes([MAGIC, DATA, 0]), bytes([MAGIC, ACK]) + b'\x00' * 5,
+                     bytes([MAGIC, 99]) + b'\x00' * 20):
+            self.assertEqual(endpoint.on_datagram(data, SENDER), [])
+        self.assertEqual(endpoint.sock.sent, [])
+
+    def test_sequence_limit(self):
+        link = Link()
+        link.sender.send(b'x', RECEIVER)
+        link.sender._peers[RECEIVER].next_seq = MAX_SEQ
+        with self.assertRaises(OverflowError):
+            link.sender.send(b'y', RECEIVER)
+
+
+if __name__ == "__main__":
+    unittest.main()
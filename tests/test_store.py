@@ -0,0 +1,223 @@
+"""Хранилище сообщений common.store: запись, поиск и восстановление после сбоя"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import common.store  # noqa: E402
+from common.store import INDEX_ENTRY, INDEX_FILE, RECEIVED, SENT, MessageStore  # noqa: E402
+
+
+class StoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.directory)
+
+    def open(self, **kwargs):
+        store = MessageStore(self.directory, **kwargs)
+        self.stores.append(store)
+        return store
+
+    def reopen(self, store, **kwargs):
+        store.close()
+        self.stores.remove(store)
+        return self.open(**kwargs)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.startswith('segment_'))
+
+
+class MessageStoreTest(StoreTestCase):
+
+    def test_round_trip(self):
+        store = self.open()
+        self.assertEqual(store.append(b'first', peer='1.2.3.4:5', timestamp=10), 0)
+        self.assertEqual(store.append_many([b'second', b''], peer='peer', kind=SENT, timestamp=20), 1)
+        records = list(store.query())
+        self.assertEqual([record.payload for record in records], [b'first', b'second', b''])
+        self.assertEqual([record.peer for record in records], ['1.2.3.4:5', 'peer', 'peer'])
+        self.assertEqual([record.kind for record in records], [RECEIVED, SENT, SENT])
+        self.assertEqual(len(store), 3)
+
+    def test_query_filters(self):
+        store = self.open()
+        for second in range(10):
+            store.append(str(second).encode(), peer='a' if second % 2 else 'b',
+                         kind=SENT if second < 5 else RECEIVED, timestamp=100 + second)
+        payloads = [record.payload for record in store.query(start=103, end=107)]
+        self.assertEqual(payloads, [b'3', b'4', b'5', b'6'])
+        self.assertEqual([record.payload for record in store.query(peer='a', kind=RECEIVED)],
+                         [b'5', b'7', b'9'])
+        # Время в индексе не убывает, даже если передано меньшее
+        store.append(b'late', timestamp=1)
+        self.assertEqual(list(store.query())[-1].timestamp, 109)
+
+    def test_segment_rotation(self):
+        store = self.open(segment_size=100)
+        payloads = [bytes([index]) * 40 for index in range(10)]
+        store.append_many(payloads[:5])
+        for payload in payloads[5:]:
+            store.append(payload)
+        self.assertGreater(len(self.segments()), 3)
+        store = self.reopen(store, segment_size=100)
+        self.assertEqual([record.payload for record in store.query()], payloads)
+
+    def test_export(self):
+        store = self.open()
+        store.append(b'one', timestamp=1000)
+        store.append(b'two', kind=SENT, timestamp=1000)
+        exported = store.export(self.path('export'), '{kind}_%Y.txt')
+        names = sorted(os.path.basename(path) for path in exported)
+        self.assertEqual(names, ['receive_1970.txt', 'send_1970.txt'])
+
+
+class RecoveryTest(StoreTestCase):
+
+    def test_partial_index_entry(self):
+        store = self.open()
+        store.append_many([b'a', b'b'])
+        store.close()
+        self.stores.remove(store)
+        with open(self.path(INDEX_FILE), 'ab') as f:
+            f.write(b'\x01' * (INDEX_ENTRY.size // 2))
+        store = self.open()
+        self.assertEqual(os.path.getsize(self.path(INDEX_FILE)), 2 * INDEX_ENTRY.size)
+        store.append(b'c')
+        self.assertEqual([record.payload for record in store.query()], [b'a', b'b', b'c'])
+
+    def test_unindexed_segment_tail(self):
+        store = self.open()
+        store.append(b'indexed')
+        store.close()
+        self.stores.remove(store)
+        with open(self.path('segment_000001.dat'), 'ab') as f:
+            f.write(b'garbage without index')
+        store = self.open()
+        store.append(b'next')
+        self.assertEqual([record.payload for record in store.query()], [b'indexed', b'next'])
+
+    def test_orphan_segments(self):
+        store = self.open(segment_size=10)
+        store.append(b'12345678')
+        store.close()
+        self.stores.remove(store)
+        # Сбой сразу после смены сегмента, до записи индекса
+        for number in (2, 3):
+            with open(self.path(f'segment_{number:06d}.dat'), 'wb') as f:
+                f.write(b'orphan')
+        store = self.open(segment_size=10)
+        self.assertEqual(self.segments(), ['segment_000001.dat'])
+        store.append(b'abcdefgh')
+        store.append(b'zz')
+        self.assertEqual([record.payload for record in store.query()], [b'12345678', b'abcdefgh', b'zz'])
+
+    def test_empty_index_drops_all_data(self):
+        store = self.open()
+        store.close()
+        self.stores.remove(store)
+        with open(self.path('segment_000001.dat'), 'wb') as f:
+            f.write(b'data')
+        with open(self.path('segment_000002.dat'), 'wb') as f:
+            f.write(b'data')
+        store = self.open()
+        self.assertEqual(os.path.getsize(self.path('segment_000001.dat')), 0)
+        self.assertEqual(self.segments(), ['segment_000001.dat'])
+        self.assertEqual(len(store), 0)
+
+    def test_read_only(self):
+        store = self.open()
+        store.append(b'kept')
+        with open(self.path('segment_000002.dat'), 'wb') as f:
+            f.write(b'orphan')
+        with open(self.path(INDEX_FILE), 'ab') as f:
+            f.write(b'\x01')
+        reader = self.open(read_only=True)
+        self.assertEqual([record.payload for record in reader.query()], [b'kept'])
+        with self.assertRaises(ValueError):
+            reader.append(b'x')
+        # Читатель ничего не обрезает и не удаляет
+        self.assertEqual(os.path.getsize(self.path(INDEX_FILE)), INDEX_ENTRY.size + 1)
+        self.assertIn('segment_000002.dat', self.segments())
+
+    def test_read_only_missing(self):
+        with self.assertRaises(OSError):
+            MessageStore(self.path('missing'), read_only=True)
+        self.assertFalse(os.path.exists(self.path('missing')))
+
+
+class _FailingFile:
+    """Файл, запись в который завершается ошибкой «нет места на диске»"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def write(self, data):
+        raise OSError(28, "No space left on device")
+
+
+class RollbackTest(StoreTestCase):
+
+    def check_intact(self, store, payloads):
+        self.assertEqual(len(store), len(payloads))
+        self.assertEqual(os.path.getsize(self.path(INDEX_FILE)), len(payloads) * INDEX_ENTRY.size)
+        store.append(b'after')
+        self.assertEqual([record.payload for record in store.query()], payloads + [b'after'])
+        store = self.reopen(store, segment_size=store.segment_size)
+        self.assertEqual([record.payload for record in store.query()], payloads + [b'after'])
+
+    def test_index_write_fails(self):
+        store = self.open()
+        store.append(b'before')
+        store._index = _FailingFile(store._index)
+        with self.assertRaises(OSError):
+            store.append_many([b'lost1', b'lost2'])
+        self.check_intact(store, [b'before'])
+
+    def test_segment_write_fails_after_rotation(self):
+        store = self.open(segment_size=10)
+        store.append(b'12345678')
+        real_open = open
+
+        def failing_open(path, mode='r', *args, **kwargs):
+            f = real_open(path, mode, *args, **kwargs)
+            return _FailingFile(f) if mode == 'ab' else f
+
+        with mock.patch.object(common.store, 'open', failing_open, create=True):
+            with self.assertRaises(OSError):
+                store.append_many([b'abcdefgh', b'ijklmnop'])
+        # Сегмент, начатый неудачной пачкой, удалён
+        self.assertEqual(self.segments(), ['segment_000001.dat'])
+        self.check_intact(store, [b'12345678'])
+
+    def test_interrupted_batch(self):
+        store = self.open()
+        store.append(b'before')
+
+        def payloads():
+            yield b'one'
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            store.append_many(payloads())
+        self.assertEqual(os.path.getsize(self.path('segment_000001.dat')), len(b'before'))
+        self.check_intact(store, [b'before'])
+
+
+if __name__ == "__main__":
+    unittest.main()